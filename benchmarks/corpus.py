@@ -0,0 +1,51 @@
+import random
+from typing import List
+
+import fitz
+
+# Words of the synthetic documents. Codes are mixed in so that keyword (lexical) lookups have something to find.
+VOCABULARY = ("valve pump pressure sensor controller firmware voltage current engine turbine blade bearing shaft "
+              "gearbox coupling flange gasket seal housing bracket cable connector relay fuse breaker panel "
+              "inspection maintenance procedure warning caution torque specification tolerance calibration "
+              "temperature humidity vibration frequency amplitude signal noise filter output input supply "
+              "operator technician manual section chapter figure table appendix reference standard revision "
+              "the a of and to in is for with on by as at from that this be are it or was which an").split()
+
+
+class SyntheticCorpus:
+    """
+        Deterministic documents for the benchmarks: the same seed always produces the same texts, PDFs and questions.
+    """
+    def __init__(self, seed: int = 42, words_per_page: int = 400, words_per_paragraph: int = 60):
+        self.seed = seed
+        self.words_per_page = words_per_page
+        self.words_per_paragraph = words_per_paragraph
+
+    def pages(self, document: int, pages: int) -> List[str]:
+        rnd = random.Random(f"{self.seed}-{document}")
+        result = []
+        for _ in range(pages):
+            words = [rnd.choice(VOCABULARY) if rnd.random() > 0.02 else f"PN-{rnd.randint(1000, 9999)}"
+                     for _ in range(self.words_per_page)]
+            paragraphs = [" ".join(words[i:i + self.words_per_paragraph]) + "."
+                          for i in range(0, len(words), self.words_per_paragraph)]
+            result.append("\n\n".join(paragraphs))
+        return result
+
+    def text(self, document: int, pages: int) -> str:
+        return "\n\n".join(self.pages(document, pages))
+
+    def pdf(self, document: int, pages: int) -> bytes:
+        pdf = fitz.open()
+        for page_text in self.pages(document, pages):
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), page_text,
+                                fontsize=8)
+        pdf.set_metadata({'title': f"Synthetic document {document}", 'author': 'benchmark'})
+        pdf_bytes = pdf.tobytes()
+        pdf.close()
+        return pdf_bytes
+
+    def questions(self, count: int, words: int = 6) -> List[str]:
+        rnd = random.Random(f"{self.seed}-questions")
+        return [" ".join(rnd.choice(VOCABULARY) for _ in range(words)) + f" {i}?" for i in range(count)]
@@ -0,0 +1,239 @@
+"""
+    Benchmarks of ingestion and query, driving the FastAPI app in-process. Embeddings are computed locally with
+    `EMBEDDINGS_PROVIDER=hashing` and answers use the mockup generator, so no remote service is called and runs are
+    comparable across commits. Usage (from the root of the repository):
+
+        python -m benchmarks.run --documents 10 --pages 20 --concurrency 1,8,32 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import List
+
+import numpy as np
+
+
+def configure_environment(args, workdir: str):
+    """
+    The app reads its configuration from the environment when imported, so this must run before importing it.
+    """
+    os.environ['EMBEDDINGS_PROVIDER'] = 'hashing'
+    os.environ['VECTOR_STORE'] = args.vector_store
+    os.environ['COLLECTION'] = 'benchmark'
+    os.environ['PERSIST_DIR'] = os.path.join(workdir, 'indexes')
+    os.environ['CACHE_DIR'] = os.path.join(workdir, 'cache') + os.sep
+    # Every query is measured, not served from the caches
+    os.environ['QUERY_CACHE_SIZE'] = '0'
+    os.environ['ANSWER_CACHE_ENABLED'] = 'false'
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.environ.setdefault('KEYRING_SECRET_KEY', 'benchmark')
+
+
+def percentiles(latencies: List[float]) -> dict:
+    if len(latencies) == 0:
+        return {}
+    values = np.asarray(latencies) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 2),
+            'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'p99_ms': round(float(np.percentile(values, 99)), 2),
+            'mean_ms': round(float(values.mean()), 2)}
+
+
+def directory_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
+
+
+def peak_rss_mb() -> dict:
+    # Linux reports kilobytes. Children are the PDF extraction processes.
+    return {'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ''
+
+
+def bench_splitter(corpus, args) -> dict:
+    from langchain.schema import Document
+    from modules.splitters.splitter import Splitter
+
+    docs = [Document(page_content=corpus.text(d, args.pages), metadata={}) for d in range(args.documents)]
+    characters = sum(len(d.page_content) for d in docs)
+    start = time.perf_counter()
+    chunks = Splitter().split(docs)
+    elapsed = time.perf_counter() - start
+    return {'characters': characters, 'chunks': len(chunks), 'seconds': round(elapsed, 3),
+            'mb_per_second': round(characters / 1024 / 1024 / elapsed, 2),
+            'chunks_per_second': round(len(chunks) / elapsed, 1)}
+
+
+def bench_pdf_extractor(corpus, args) -> dict:
+    from modules.pdf.PDFExtractor import PDFExtractor
+
+    pdfs = [corpus.pdf(d, args.pages) for d in range(args.documents)]
+    start = time.perf_counter()
+    for pdf in pdfs:
+        PDFExtractor.extract(BytesIO(pdf))
+    elapsed = time.perf_counter() - start
+    pages = args.documents * args.pages
+    return {'pages': pages, 'seconds': round(elapsed, 3), 'pages_per_second': round(pages / elapsed, 1)}
+
+
+async def wait_until_ready(client, start: float) -> float:
+    # The index and NLTK are loaded in the background after the startup
+    while (await client.get('/healthcheck/ready')).status_code != 200:
+        live = await client.get('/healthcheck/live')
+        if live.status_code != 200:
+            raise RuntimeError(live.json()['message'])
+        await asyncio.sleep(0.01)
+    return round(time.perf_counter() - start, 3)
+
+
+async def bench_ingestion(client, corpus, args) -> dict:
+    job_ids = []
+    start = time.perf_counter()
+    for d in range(args.documents):
+        if args.format == 'pdf':
+            files = {'file': (f"document_{d}.pdf", corpus.pdf(d, args.pages), 'application/pdf')}
+            response = await client.post('/process_pdf', files=files)
+        else:
+            files = {'file': (f"document_{d}.txt", corpus.text(d, args.pages).encode('utf-8'), 'text/plain')}
+            response = await client.post('/process_text', files=files)
+        body = response.json()
+        if body['code'] != 0:
+            raise RuntimeError(f"Ingestion of document {d} failed: {body['message']}")
+        job_ids.append(body['result']['job_id'])
+
+    jobs = {}
+    while len(jobs) < len(job_ids):
+        for job_id in job_ids:
+            job = (await client.get(f"/jobs/{job_id}")).json()['result']
+            if job['status'] in ('done', 'failed'):
+                jobs[job_id] = job
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    failed = [j for j in jobs.values() if j['status'] == 'failed']
+    pages = sum(j['pages_extracted'] for j in jobs.values())
+    chunks = sum(j['chunks_embedded'] for j in jobs.values())
+    return {'documents': len(job_ids), 'failed': len(failed), 'pages': pages, 'chunks': chunks,
+            'seconds': round(elapsed, 3), 'pages_per_second': round(pages / elapsed, 1),
+            'chunks_per_second': round(chunks / elapsed, 1)}
+
+
+async def bench_endpoint(client, path: str, payloads: List[dict], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def call(payload):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, data=payload)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"HTTP {response.status_code}")
+            elif response.json()['code'] != 0:
+                errors.append(response.json()['message'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(p) for p in payloads])
+    elapsed = time.perf_counter() - start
+    result = {'concurrency': concurrency, 'requests': len(payloads), 'errors': len(errors),
+              'requests_per_second': round(len(payloads) / elapsed, 1), **percentiles(latencies)}
+    if len(errors) > 0:
+        result['first_error'] = errors[0]
+    return result
+
+
+async def run(args, workdir: str) -> dict:
+    import httpx
+    from benchmarks.corpus import SyntheticCorpus
+
+    corpus = SyntheticCorpus(args.seed)
+    results = {'splitter': bench_splitter(corpus, args), 'pdf_extractor': bench_pdf_extractor(corpus, args)}
+
+    import main
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    await main.startup()
+    try:
+        async with httpx.AsyncClient(app=main.app, base_url='http://benchmark', timeout=None) as client:
+            results['ready_seconds'] = await wait_until_ready(client, start)
+            results['loader'] = type(main.loader).__name__
+            results['ingestion'] = await bench_ingestion(client, corpus, args)
+            main.loader.store.persist()
+            results['index_size_mb'] = round(directory_size(os.environ['PERSIST_DIR']) / 1024 / 1024, 2)
+
+            questions = corpus.questions(args.queries)
+            results['query'] = []
+            for concurrency in args.concurrency:
+                payloads = [{'question': q, 'items': args.items, 'generate_answer': 'true',
+                             'use_mockup_answer': 'true', 'retrieval_mode': args.retrieval_mode} for q in questions]
+                results['query'].append(await bench_endpoint(client, '/query', payloads, concurrency))
+
+            texts = [corpus.pages(0, 1)[0][:200] + f" {i}" for i in range(args.queries)]
+            results['lemmatize'] = []
+            results['lemmatize_stopwords'] = []
+            for concurrency in args.concurrency:
+                payloads = [{'text': t, 'lan': 'english'} for t in texts]
+                results['lemmatize'].append(await bench_endpoint(client, '/lemmatize', payloads, concurrency))
+                results['lemmatize_stopwords'].append(await bench_endpoint(client, '/lemmatize_stopwords', payloads,
+                                                                           concurrency))
+    finally:
+        await main.shutdown()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks ingestion and query of the back end in-process")
+    parser.add_argument('--documents', type=int, default=5, help="Synthetic documents to ingest")
+    parser.add_argument('--pages', type=int, default=20, help="Pages per document")
+    parser.add_argument('--format', choices=['pdf', 'txt'], default='pdf', help="Format of the documents")
+    parser.add_argument('--queries', type=int, default=100, help="Queries per concurrency level")
+    parser.add_argument('--concurrency', type=lambda v: [int(c) for c in v.split(',')], default=[1, 8, 32],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument('--items', type=int, default=4, help="Items retrieved per query")
+    parser.add_argument('--retrieval-mode', default='vector', help="vector, lexical or hybrid")
+    parser.add_argument('--vector-store', default='chroma', help="chroma, faiss or numpy")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the synthetic corpus")
+    parser.add_argument('--output', default=None, help="JSON file to write the results to (stdout if not set)")
+    parser.add_argument('--keep', action='store_true', help="Keep the indexes and caches created by the run")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='documentqa-benchmark-')
+    configure_environment(args, workdir)
+    try:
+        results = asyncio.run(run(args, workdir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'commit': git_commit(), 'timestamp': int(time.time()), 'python': sys.version.split()[0],
+              'config': vars(args), 'results': results}
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
@@ -4,12 +4,44 @@ import os
 HOST = os.environ['HOST'] if 'HOST' in os.environ else "0.0.0.0"
 PORT = os.environ['PORT'] if 'PORT' in os.environ else 5000
 
-# ChromaDB configuration
+# DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ['LOG_LEVEL'] if 'LOG_LEVEL' in os.environ else 'DEBUG'
+
+# Vector store configuration: `chroma`, `faiss` or `numpy`
+VECTOR_STORE = os.environ['VECTOR_STORE'] if 'VECTOR_STORE' in os.environ else 'chroma'
 COLLECTION = os.environ['COLLECTION'] if 'COLLECTION' in os.environ else 'sintetic'
-PERSIST_DIR = 'indexes'
+PERSIST_DIR = os.environ['PERSIST_DIR'] if 'PERSIST_DIR' in os.environ else 'indexes'
+
+# Deployment: `single` (one process), or one `writer` process, which ingests and persists the index, and `reader`
+# processes, which serve queries from the index on disk and reopen it whenever the writer publishes a new version
+SINGLE = 'single'
+WRITER = 'writer'
+READER = 'reader'
+ROLES = [SINGLE, WRITER, READER]
+ROLE = os.environ['ROLE'].lower() if 'ROLE' in os.environ else SINGLE
+# Processes serving the port. More than 1 is only allowed for readers.
+WORKERS = int(os.environ['WORKERS']) if 'WORKERS' in os.environ else 1
+# Seconds between checks of readers for a new version of the index
+REPLICA_POLL_INTERVAL = float(os.environ['REPLICA_POLL_INTERVAL']) if 'REPLICA_POLL_INTERVAL' in os.environ else 1
+# Seconds a reader keeps the previous version open after opening a new one, for the queries still using it
+REPLICA_CLOSE_DELAY = float(os.environ['REPLICA_CLOSE_DELAY']) if 'REPLICA_CLOSE_DELAY' in os.environ else 30
 
 # Tmp folder
-TMP_DIR = 'tmp/'
+TMP_DIR = os.environ['TMP_DIR'] if 'TMP_DIR' in os.environ else 'tmp/'
+
+# Uploads are kept in memory up to UPLOAD_SPOOL_BYTES and in a temporary file beyond that, and read in chunks of
+# UPLOAD_CHUNK_BYTES
+UPLOAD_CHUNK_BYTES = int(os.environ['UPLOAD_CHUNK_BYTES']) if 'UPLOAD_CHUNK_BYTES' in os.environ else 1024 * 1024
+UPLOAD_SPOOL_BYTES = int(os.environ['UPLOAD_SPOOL_BYTES']) if 'UPLOAD_SPOOL_BYTES' in os.environ else 1024 * 1024
+# Max size of a file uploaded
+UPLOAD_MAX_BYTES = int(os.environ['UPLOAD_MAX_BYTES']) if 'UPLOAD_MAX_BYTES' in os.environ else 512 * 1024 * 1024
+# Max bytes of all the uploads being received or waiting to be indexed (0 for no limit). Uploads beyond it wait up to
+# UPLOAD_WAIT seconds for others to finish, and are rejected after that.
+UPLOADS_IN_FLIGHT_MAX_BYTES = int(os.environ['UPLOADS_IN_FLIGHT_MAX_BYTES']) \
+    if 'UPLOADS_IN_FLIGHT_MAX_BYTES' in os.environ else 2 * 1024 * 1024 * 1024
+UPLOAD_WAIT = float(os.environ['UPLOAD_WAIT']) if 'UPLOAD_WAIT' in os.environ else 30
+# Texts are split as they are decoded, in segments of about this many characters
+TEXT_SEGMENT_SIZE = int(os.environ['TEXT_SEGMENT_SIZE']) if 'TEXT_SEGMENT_SIZE' in os.environ else 1024 * 1024
 
 # LangChain
 CHUNK_SIZE = os.environ['CHUNK_SIZE'] if 'CHUNK_SIZE' in os.environ else 100
@@ -22,6 +54,127 @@ AVG_SIZE_OF_PARAGRAPH = os.environ['AVG_SIZE_OF_PARAGRAPH'] if 'AVG_SIZE_OF_PARA
 
 RELEVANT_THRESHOLD = os.environ['RELEVANT_THRESHOLD'] if 'RELEVANT_THRESHOLD' in os.environ else 0.41
 
+# Context sent to the LLM: overlapping neighbouring chunks (sharing at least CONTEXT_MIN_OVERLAP characters) are merged,
+# chunks sharing CONTEXT_DUPLICATE_SIMILARITY of their pairs of tokens with a more relevant one are dropped, and the
+# rest are added by relevance up to CONTEXT_MAX_TOKENS tokens
+CONTEXT_MAX_TOKENS = int(os.environ['CONTEXT_MAX_TOKENS']) if 'CONTEXT_MAX_TOKENS' in os.environ else 2000
+CONTEXT_MIN_OVERLAP = int(os.environ['CONTEXT_MIN_OVERLAP']) if 'CONTEXT_MIN_OVERLAP' in os.environ else 20
+CONTEXT_DUPLICATE_SIMILARITY = float(os.environ['CONTEXT_DUPLICATE_SIMILARITY']) \
+    if 'CONTEXT_DUPLICATE_SIMILARITY' in os.environ else 0.8
+
+# Items retrieved by a query when not specified (same as LangChain's default)
+DEFAULT_ITEMS = 4
+
+# Retrieval: `vector` (embeddings), `lexical` (BM25, no embeddings) or `hybrid` (both, fused by reciprocal rank)
+VECTOR = 'vector'
+LEXICAL = 'lexical'
+HYBRID = 'hybrid'
+RETRIEVAL_MODES = [VECTOR, LEXICAL, HYBRID]
+RETRIEVAL_MODE = os.environ['RETRIEVAL_MODE'] if 'RETRIEVAL_MODE' in os.environ else 'vector'
+# Language of the chunks, to tokenize them for the lexical index
+LEXICAL_LANGUAGE = os.environ['LEXICAL_LANGUAGE'] if 'LEXICAL_LANGUAGE' in os.environ else 'english'
+# Hybrid retrieval fuses the top `items * HYBRID_DEPTH` results of each ranking
+HYBRID_DEPTH = int(os.environ['HYBRID_DEPTH']) if 'HYBRID_DEPTH' in os.environ else 4
+# Constant of the reciprocal rank fusion: 1 / (RRF_K + rank)
+RRF_K = int(os.environ['RRF_K']) if 'RRF_K' in os.environ else 60
+
 NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER = "(Not enough results to combine in a single answer)"
 
 AUTHENTICATED = 0
+
+# Ingestion job queue
+INGESTION_WORKERS = int(os.environ['INGESTION_WORKERS']) if 'INGESTION_WORKERS' in os.environ else 2
+INGESTION_QUEUE_SIZE = int(os.environ['INGESTION_QUEUE_SIZE']) if 'INGESTION_QUEUE_SIZE' in os.environ else 32
+# How many jobs (finished or not) are kept to be reported by `/jobs`
+INGESTION_JOBS_HISTORY = int(os.environ['INGESTION_JOBS_HISTORY']) if 'INGESTION_JOBS_HISTORY' in os.environ else 200
+# Chunks sent to be embedded and stored at a time while a file is still being split
+INGESTION_BATCH_SIZE = int(os.environ['INGESTION_BATCH_SIZE']) if 'INGESTION_BATCH_SIZE' in os.environ else 256
+
+# Embeddings provider: `openai`, or `hashing` to embed locally without network (changing it needs a new COLLECTION)
+EMBEDDINGS_PROVIDER = os.environ['EMBEDDINGS_PROVIDER'] if 'EMBEDDINGS_PROVIDER' in os.environ else 'openai'
+HASHING_EMBEDDINGS_DIMENSIONS = int(os.environ['HASHING_EMBEDDINGS_DIMENSIONS']) \
+    if 'HASHING_EMBEDDINGS_DIMENSIONS' in os.environ else 1536
+# Embedding requests arriving within EMBEDDING_BATCH_WINDOW seconds of each other are sent to the provider in one call
+# of up to EMBEDDING_BATCH_MAX_SIZE texts, with at most EMBEDDING_MAX_CONCURRENCY calls at once. 0 disables batching.
+EMBEDDING_BATCH_WINDOW = float(os.environ['EMBEDDING_BATCH_WINDOW']) if 'EMBEDDING_BATCH_WINDOW' in os.environ else 0.01
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ['EMBEDDING_BATCH_MAX_SIZE']) \
+    if 'EMBEDDING_BATCH_MAX_SIZE' in os.environ else 512
+EMBEDDING_MAX_CONCURRENCY = int(os.environ['EMBEDDING_MAX_CONCURRENCY']) \
+    if 'EMBEDDING_MAX_CONCURRENCY' in os.environ else 4
+# Calls rejected by the provider's rate limit are retried up to EMBEDDING_MAX_RETRIES times, waiting
+# EMBEDDING_RETRY_BACKOFF seconds the first time and twice as long each time after that
+EMBEDDING_MAX_RETRIES = int(os.environ['EMBEDDING_MAX_RETRIES']) if 'EMBEDDING_MAX_RETRIES' in os.environ else 6
+EMBEDDING_RETRY_BACKOFF = float(os.environ['EMBEDDING_RETRY_BACKOFF']) \
+    if 'EMBEDDING_RETRY_BACKOFF' in os.environ else 1
+
+# Caches
+CACHE_DIR = os.environ['CACHE_DIR'] if 'CACHE_DIR' in os.environ else 'cache/'
+EMBEDDING_CACHE_ENABLED = os.environ['EMBEDDING_CACHE_ENABLED'].lower() == 'true' \
+    if 'EMBEDDING_CACHE_ENABLED' in os.environ else True
+EMBEDDING_CACHE_PATH = f"{CACHE_DIR}embeddings.sqlite"
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ['EMBEDDING_CACHE_MAX_BYTES']) \
+    if 'EMBEDDING_CACHE_MAX_BYTES' in os.environ else 512 * 1024 * 1024
+
+# Write-behind persistence of the vector stores. If disabled, the store is flushed to disk after every upload.
+STORE_WRITE_BEHIND = os.environ['STORE_WRITE_BEHIND'].lower() == 'true' \
+    if 'STORE_WRITE_BEHIND' in os.environ else True
+# Seconds between flushes of pending writes
+STORE_FLUSH_INTERVAL = float(os.environ['STORE_FLUSH_INTERVAL']) if 'STORE_FLUSH_INTERVAL' in os.environ else 30
+# Number of pending chunks forcing a flush before the interval ends
+STORE_FLUSH_MAX_PENDING = int(os.environ['STORE_FLUSH_MAX_PENDING']) \
+    if 'STORE_FLUSH_MAX_PENDING' in os.environ else 2000
+
+# PDF extraction
+PDF_EXTRACTION_WORKERS = int(os.environ['PDF_EXTRACTION_WORKERS']) \
+    if 'PDF_EXTRACTION_WORKERS' in os.environ else (os.cpu_count() or 1)
+# Pages extracted by each process at a time
+PDF_EXTRACTION_BATCH_SIZE = int(os.environ['PDF_EXTRACTION_BATCH_SIZE']) \
+    if 'PDF_EXTRACTION_BATCH_SIZE' in os.environ else 32
+
+# Cache of `/query` retrievals. Setting any of them to 0 disables it.
+QUERY_CACHE_SIZE = int(os.environ['QUERY_CACHE_SIZE']) if 'QUERY_CACHE_SIZE' in os.environ else 1024
+# Seconds
+QUERY_CACHE_TTL = float(os.environ['QUERY_CACHE_TTL']) if 'QUERY_CACHE_TTL' in os.environ else 300
+
+# Cache of the answers generated by the LLM
+ANSWER_CACHE_ENABLED = os.environ['ANSWER_CACHE_ENABLED'].lower() == 'true' \
+    if 'ANSWER_CACHE_ENABLED' in os.environ else True
+ANSWER_CACHE_PATH = f"{CACHE_DIR}answers.sqlite"
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ['ANSWER_CACHE_MAX_ENTRIES']) \
+    if 'ANSWER_CACHE_MAX_ENTRIES' in os.environ else 10000
+# Min cosine similarity between questions to reuse an answer to a different question. 0 disables it.
+ANSWER_CACHE_SIMILARITY = float(os.environ['ANSWER_CACHE_SIMILARITY']) \
+    if 'ANSWER_CACHE_SIMILARITY' in os.environ else 0
+
+# Threads available to run blocking calls (embeddings, searches, LLM...) without blocking the server
+BLOCKING_THREADS = int(os.environ['BLOCKING_THREADS']) if 'BLOCKING_THREADS' in os.environ else 40
+
+# Native NumPy vector store
+# `flat` for an exact scan of all the vectors, `ivf` to only scan the clusters nearest to the query
+NUMPY_INDEX = os.environ['NUMPY_INDEX'] if 'NUMPY_INDEX' in os.environ else 'flat'
+# Rows of the matrix scanned at a time
+NUMPY_SCAN_BLOCK = int(os.environ['NUMPY_SCAN_BLOCK']) if 'NUMPY_SCAN_BLOCK' in os.environ else 65536
+# Number of clusters of the IVF index. 0 for the square root of the number of chunks.
+NUMPY_IVF_LISTS = int(os.environ['NUMPY_IVF_LISTS']) if 'NUMPY_IVF_LISTS' in os.environ else 0
+# Clusters scanned per query
+NUMPY_IVF_PROBES = int(os.environ['NUMPY_IVF_PROBES']) if 'NUMPY_IVF_PROBES' in os.environ else 8
+# Chunks needed before training the IVF index. Smaller collections are scanned exactly.
+NUMPY_IVF_MIN_ROWS = int(os.environ['NUMPY_IVF_MIN_ROWS']) if 'NUMPY_IVF_MIN_ROWS' in os.environ else 100000
+
+# FAISS vector store
+# `flat` (exact), `hnsw` or `ivfpq`
+FAISS_INDEX = os.environ['FAISS_INDEX'] if 'FAISS_INDEX' in os.environ else 'flat'
+# HNSW: neighbours per node, and size of the candidate lists when building and searching. Higher is better recall.
+FAISS_HNSW_M = int(os.environ['FAISS_HNSW_M']) if 'FAISS_HNSW_M' in os.environ else 32
+FAISS_HNSW_EF_CONSTRUCTION = int(os.environ['FAISS_HNSW_EF_CONSTRUCTION']) \
+    if 'FAISS_HNSW_EF_CONSTRUCTION' in os.environ else 200
+FAISS_HNSW_EF_SEARCH = int(os.environ['FAISS_HNSW_EF_SEARCH']) if 'FAISS_HNSW_EF_SEARCH' in os.environ else 64
+# IVF-PQ: clusters, and clusters scanned per query. Search is exact until there are enough chunks to train it.
+FAISS_IVF_LISTS = int(os.environ['FAISS_IVF_LISTS']) if 'FAISS_IVF_LISTS' in os.environ else 1024
+FAISS_IVF_PROBES = int(os.environ['FAISS_IVF_PROBES']) if 'FAISS_IVF_PROBES' in os.environ else 16
+# IVF-PQ: sub-quantizers (must divide the embedding size) and bits per code
+FAISS_PQ_M = int(os.environ['FAISS_PQ_M']) if 'FAISS_PQ_M' in os.environ else 64
+FAISS_PQ_BITS = int(os.environ['FAISS_PQ_BITS']) if 'FAISS_PQ_BITS' in os.environ else 8
+
+# Lemmatization: number of token lemmas memoized
+LEMMA_CACHE_SIZE = int(os.environ['LEMMA_CACHE_SIZE']) if 'LEMMA_CACHE_SIZE' in os.environ else 100000
@@ -3,4 +3,9 @@ PARAM_NOT_FOUND = 1
 INVALID_VALUE = 2
 INVALID_FORMAT = 3
 LOGIN_FAILED = 4
+QUEUE_FULL = 5
+JOB_NOT_FOUND = 6
+NOT_READY = 7
+READ_ONLY = 8
+UPLOAD_TOO_LARGE = 9
 EXCEPTION = 999
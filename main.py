@@ -1,67 +1,112 @@
 import logging
 import datetime
+import json
 import os
-from io import BytesIO
+import queue
+import threading
+import time
 from typing import  Annotated, Optional
 
 import keyring
-import nltk
 
 from constants import response_codes
 from constants.consts import COLLECTION, HOST, PORT, RELEVANT_THRESHOLD, \
-    NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER, AUTHENTICATED, NEWLINE, CHUNK_SIZE, CHUNK_OVERLAP
-from constants.response_codes import LOGIN_FAILED
-from modules.generators.answer_generator import AnswerGenerator
-from modules.indexing.loaders.chroma_loader import ChromaLoader
-from modules.indexing.querier import Querier
+    NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER, AUTHENTICATED, NEWLINE, CHUNK_SIZE, CHUNK_OVERLAP, INGESTION_WORKERS, \
+    INGESTION_QUEUE_SIZE, INGESTION_JOBS_HISTORY, BLOCKING_THREADS, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, ANSWER_CACHE_ENABLED, \
+    ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, LEMMA_CACHE_SIZE, RETRIEVAL_MODE, LOG_LEVEL, \
+    RETRIEVAL_MODES, ROLE, ROLES, READER, WORKERS, PERSIST_DIR, UPLOADS_IN_FLIGHT_MAX_BYTES, UPLOAD_MAX_BYTES, \
+    UPLOAD_SPOOL_BYTES
+from constants.response_codes import LOGIN_FAILED, QUEUE_FULL, JOB_NOT_FOUND, NOT_READY, READ_ONLY, UPLOAD_TOO_LARGE
+from modules.indexing.query_cache import QueryCache
+from modules.indexing.search_filter import SearchFilter
+from modules.jobs.ingestion_queue import IngestionQueue
+from modules.metrics.metrics import Metrics, REQUESTS_IN_FLIGHT, REQUEST_SECONDS, INGESTION_QUEUE_DEPTH, \
+    UPLOADED_BYTES, UPLOAD_BYTES_IN_FLIGHT
+from modules.uploads.upload_buffer import UploadBuffer
+from modules.uploads.upload_limiter import UploadLimiter
 from app_secrets import Secrets
 
 import uvicorn
-from fastapi import FastAPI, UploadFile, Form
-
+from anyio import to_thread
+from fastapi import FastAPI, UploadFile, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, CollectorRegistry, multiprocess
+from starlette.formparsers import MultiPartParser
+
+from models.requests.batch_query_schema import BatchQuerySchema
+from models.requests.lemmatize_batch_schema import LemmatizeBatchSchema
 from models.responses.generic_schema import GenericSchema
-from modules.pdf.PDFExtractor import PDFExtractor
 from fastapi.middleware.cors import CORSMiddleware
 
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-
 import jwt
 
 from users.add_key import SERVICE_ID
 
+# Processes started with `spawn`, as the ones extracting the pages of PDFs, run this file again as `__mp_main__`
+# before running the function they are sent. They only need its definitions: the checks and the output are skipped
+SPAWNED = __name__ == '__mp_main__'
+
+
+def announce(step: str):
+    if not SPAWNED:
+        print(step)
+
+
 # SECRETS
 # =======
-print("Checking secrets...")
-if not Secrets.check():
-    exit(1)
+if not SPAWNED:
+    print("Checking secrets...")
+    if not Secrets.check():
+        exit(1)
+    if ROLE not in ROLES:
+        print(f"Unknown ROLE `{ROLE}`. Use one of: {', '.join(ROLES)}")
+        exit(1)
 # =======
 
 # LOGGING
 # =======
-print("Configuring logger...")
-logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
+announce("Configuring logger...")
+if not SPAWNED:
+    logging.basicConfig(encoding='utf-8', level=LOG_LEVEL)
 # =======
 
 
-# CHROMA
+# SERVICES
 # =======
-print("Setting up the vector store...")
-loader = ChromaLoader(COLLECTION)
+# NLTK, the vector store and the query engine are set up by `load_services` in the background once the app is
+# started, so that the liveness check answers straight away. Until they are ready, `/healthcheck/ready` fails and the
+# endpoints which need them are rejected.
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+loader = None
+answer_cache = None
+querier = None
+generator = None
+context_packer = None
+lemmatizer = None
+# Only set in readers, which reopen the index when the writer publishes a new version
+replica = None
+# Held by the writer while it runs
+writer_lock = None
+services_ready = threading.Event()
+services_error = None
 # =======
 
-# NLTK
+# INGESTION QUEUE
 # =======
-print("Installing small NLTK tools...")
-nltk.download('stopwords')
-nltk.download('punkt')
-nltk.download('wordnet')
+announce("Setting up the ingestion queue...")
+ingestion_queue = IngestionQueue(INGESTION_WORKERS, INGESTION_QUEUE_SIZE, INGESTION_JOBS_HISTORY)
+INGESTION_QUEUE_DEPTH.set_function(ingestion_queue.depth)
+# Uploads are buffered in TMP_DIR, within a limit of bytes for all of them
+upload_limiter = UploadLimiter(UPLOADS_IN_FLIGHT_MAX_BYTES)
+UPLOAD_BYTES_IN_FLIGHT.set_function(upload_limiter.bytes_in_flight)
+# Uploaded files are spooled by Starlette while parsing the request: in memory up to this size, and to disk beyond it
+MultiPartParser.max_file_size = UPLOAD_SPOOL_BYTES
 # =======
 
 # FAST API
 # ========
-print("Preparing FastAPI...")
+announce("Preparing FastAPI...")
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -69,17 +114,212 @@ app.add_middleware(
 )
 
 
+# Paths served while the services are loading
+ALWAYS_AVAILABLE = ('/healthcheck', '/metrics', '/login', '/jobs', '/docs', '/redoc', '/openapi.json')
+# Paths only served by the writer
+WRITER_PATHS = ('/process_pdf', '/process_text', '/delete_document', '/jobs')
+# Paths receiving uploads, and bytes allowed in their requests besides the file for the other fields of the form
+UPLOAD_PATHS = ('/process_pdf', '/process_text')
+UPLOAD_FORM_BYTES = 64 * 1024
 # =========
 
 
-@app.get("/healthcheck", status_code=200)
-async def healthcheck():
+def load_services():
+    global loader, answer_cache, querier, generator, context_packer, lemmatizer, replica, writer_lock, services_error
+    start = time.perf_counter()
+    try:
+        # Imported here, as LangChain, NLTK and the vector stores take seconds to import
+        from modules.generators.answer_cache import AnswerCache
+        from modules.generators.answer_generator import AnswerGenerator
+        from modules.generators.context_packer import ContextPacker
+        from modules.indexing.index_lock import IndexLock
+        from modules.indexing.index_replica import IndexReplica
+        from modules.indexing.loaders.loader_factory import LoaderFactory
+        from modules.indexing.querier import Querier
+        from modules.nlp.lemmatizer import Lemmatizer
+        from modules.nlp.nltk_resources import NltkResources
+
+        logging.info("Checking small NLTK tools...")
+        NltkResources.ensure()
+        lemmatizer = Lemmatizer(LEMMA_CACHE_SIZE)
+        lemmatizer.warmup()
+
+        logging.info(f"Setting up the vector store ({ROLE})...")
+        if ROLE == READER:
+            replica = IndexReplica(COLLECTION, replace_loader)
+            loader = replica.open()
+        else:
+            # Two processes writing the same index would corrupt it
+            writer_lock = IndexLock(f"{PERSIST_DIR}/{COLLECTION}")
+            if not writer_lock.acquire_writer():
+                raise RuntimeError(f"Another process is already writing to {COLLECTION}. Use ROLE=reader to serve "
+                                   f"queries from its index")
+            loader = LoaderFactory.build(COLLECTION)
+        answer_cache = AnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY) \
+            if ANSWER_CACHE_ENABLED else None
+
+        # Shared by all the requests, so that the LLM and embedding clients (and their HTTP connections) are reused
+        logging.info("Setting up the query engine...")
+        querier = Querier(loader, query_cache)
+        generator = AnswerGenerator(answer_cache, loader.store.embeddings)
+        context_packer = ContextPacker()
+        if replica is not None:
+            replica.start()
+        services_ready.set()
+        logging.info(f"Ready to serve in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logging.exception("The services could not be loaded")
+        services_error = str(e)
+
+
+def replace_loader(new_loader):
+    # Requests already running finish with the loader they started with
+    global loader
+    loader = new_loader
+    querier.loader = new_loader
+
+
+@app.middleware("http")
+async def require_writer(request: Request, call_next):
+    if ROLE == READER and request.url.path.startswith(WRITER_PATHS):
+        return JSONResponse(status_code=403,
+                            content=GenericSchema(message="This is a read replica. Send uploads, deletions and job "
+                                                          "queries to the writer", result="", code=READ_ONLY).dict())
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Checked before the body is read, as the form is parsed (and its files spooled) before the endpoint runs
+    if request.url.path.startswith(UPLOAD_PATHS):
+        length = request.headers.get('content-length')
+        if length is None or not length.isdigit():
+            return JSONResponse(status_code=411,
+                                content=GenericSchema(message="Uploads must have a Content-Length", result="",
+                                                      code=UPLOAD_TOO_LARGE).dict())
+        if int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_BYTES:
+            return JSONResponse(status_code=413,
+                                content=GenericSchema(message=f"Files can't be bigger than {UPLOAD_MAX_BYTES} bytes",
+                                                      result="", code=UPLOAD_TOO_LARGE).dict())
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def require_services(request: Request, call_next):
+    if not services_ready.is_set() and not request.url.path.startswith(ALWAYS_AVAILABLE):
+        return JSONResponse(status_code=503,
+                            content=GenericSchema(message="The index is still loading. Try again later", result="",
+                                                  code=NOT_READY).dict())
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        # The path of the route, not the requested one, so that ids in the path don't create new series
+        route = request.scope.get('route')
+        REQUEST_SECONDS.labels(route.path if route is not None else 'unknown', str(status)) \
+            .observe(time.perf_counter() - start)
+
+
+@app.on_event("startup")
+async def startup():
+    # Blocking calls (embeddings, searches, LLM) are offloaded to this pool of threads
+    to_thread.current_default_thread_limiter().total_tokens = BLOCKING_THREADS
+    if ROLE != READER:
+        ingestion_queue.start()
+    threading.Thread(target=load_services, name='load-services', daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    ingestion_queue.stop()
+    if replica is not None:
+        replica.stop()
+    if loader is not None:
+        loader.close()
+    from modules.pdf.page_extractor import PageExtractor
+    PageExtractor.shutdown()
+
+
+@app.get("/healthcheck/live", status_code=200)
+async def healthcheck_live(response: Response):
+    """
+    This endpoint is meant to provide a reliable method to check if the back end is up and running (liveness). It
+    answers while the index is still loading, and only fails if it could not be loaded.
+    """
+    if services_error is not None:
+        response.status_code = 503
+        return GenericSchema(message=f"The index could not be loaded: {services_error}", result="",
+                             code=response_codes.EXCEPTION)
+    return GenericSchema(message="Alive", result="", code=response_codes.SUCCESS)
+
+
+@app.get("/healthcheck/ready", status_code=200)
+async def healthcheck_ready(response: Response):
     """
-    This endpoint is meant to provide a reliable method to check if the back end is up and running.
+    This endpoint checks if the back end is ready to receive traffic (readiness): NLTK, the vector store and the query
+    engine are loaded. Until then it answers with HTTP 503.
     """
+    if not services_ready.is_set():
+        response.status_code = 503
+        return GenericSchema(message="The index is still loading", result="", code=NOT_READY)
     return GenericSchema(message="Healthy", result="", code=response_codes.SUCCESS)
 
 
+@app.get("/healthcheck", status_code=200)
+async def healthcheck(response: Response):
+    """
+    Same as `/healthcheck/ready`, kept for the existing health checkers.
+    """
+    return await healthcheck_ready(response)
+
+
+@app.get("/stats", status_code=200)
+async def stats():
+    """
+    This endpoint reports usage statistics of the caches of the back end.
+
+    Returns:\n\n
+         a json response with fields: `message`, `code`, `result` where in result you have `embedding_cache` with its
+         `hits`, `misses`, `remote_calls` to the embeddings provider, `remote_seconds` spent on them and
+         `estimated_saved_seconds` thanks to the cache, `query_cache` and `answer_cache` with their hits, misses
+         and hit rates, and `lemma_cache` with the hits and misses of the memoized lemmas.
+    """
+    from modules.embeddings.embeddings_factory import EmbeddingsFactory
+
+    answer_cache_stats = answer_cache.stats() if answer_cache is not None else {'enabled': False}
+    return GenericSchema(message="Stats retrieved",
+                         result={'embedding_cache': EmbeddingsFactory.stats(),
+                                 'query_cache': query_cache.stats(),
+                                 'answer_cache': answer_cache_stats,
+                                 'lemma_cache': lemmatizer.stats()},
+                         code=response_codes.SUCCESS)
+
+
+@app.get("/metrics", status_code=200)
+async def metrics():
+    """
+    This endpoint exposes the metrics of the back end in Prometheus format: time spent in each stage of ingestion and
+    query (`documentqa_stage_seconds`), time per endpoint, requests in flight, depth of the ingestion queue, and
+    counters of uploaded bytes, pages, chunks, embedded texts and LLM tokens.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # With several `WORKERS`, the metrics of all of them
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/login", status_code=200)
 async def login(email: Annotated[str, Form(description="User's email")],
                 password: Annotated[str, Form(description="User's password")]):
@@ -127,11 +367,7 @@ async def lemmatize_stopwords(text: Annotated[str, Form(description="String to r
          words.
     """
     try:
-        lemmatizer = WordNetLemmatizer()
-        text_tokens = word_tokenize(text, language=lan)
-
-        result = " ".join([lemmatizer.lemmatize(word.lower()) for word in text_tokens
-                           if lemmatizer.lemmatize(word.lower()) not in stopwords.words(lan)])
+        result = await run_in_threadpool(lemmatizer.lemmatize_stopwords, text, lan)
         return GenericSchema(message=f"Lemmas and Stopwords were successfully calculated", result=result,
                              code=response_codes.SUCCESS)
     except Exception as e:
@@ -152,16 +388,35 @@ async def lemmatize(text: Annotated[str, Form(description="String to return with
          a json response with fields: `message`, `code`, `result` where  in result you have the string lemmatized.
     """
     try:
-        lemmatizer = WordNetLemmatizer()
-        text_tokens = word_tokenize(text, language=lan)
-
-        result = " ".join([lemmatizer.lemmatize(word.lower()) for word in text_tokens])
+        result = await run_in_threadpool(lemmatizer.lemmatize, text, lan)
         return GenericSchema(message=f"Lemmas were successfully calculated", result=result,
                              code=response_codes.SUCCESS)
     except Exception as e:
         return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
 
 
+@app.post("/lemmatize/batch")
+async def lemmatize_batch(batch: LemmatizeBatchSchema):
+    """
+    This endpoint receives many texts in a json body and returns all of them lemmatized in a single call.
+
+    Args:\n\n
+    - `texts`: List of strings to return lemmatized.
+    - `lan`: Language of the texts.
+    - `remove_stopwords`: (Optional, default false) Removes the stopwords too, as `/lemmatize_stopwords` does.
+
+    Returns:\n\n
+         a json response with fields: `message`, `code`, `result` where in result you have `texts`, the list of
+         strings lemmatized, in the same order as `texts`.
+    """
+    try:
+        result = await run_in_threadpool(lemmatizer.lemmatize_batch, batch.texts, batch.lan, batch.remove_stopwords)
+        return GenericSchema(message=f"Lemmas were successfully calculated", result={'texts': result},
+                             code=response_codes.SUCCESS)
+    except Exception as e:
+        return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
+
+
 @app.post("/process_pdf")
 async def process_pdf(file: Annotated[UploadFile, Form(description="Your txt or pdf file to calculate embeddings and "
                                                                    "index them.")],
@@ -189,8 +444,12 @@ async def process_pdf(file: Annotated[UploadFile, Form(description="Your txt or
     - `chunk_overlap`: In order to take context into consideration, chunks also get a surrounding context of a total of
     **chunk_overlap** previous and following characters.\n
 
+    The file is processed in the background. Use `/jobs/{job_id}` to follow the progress. Files bigger than
+    `UPLOAD_MAX_BYTES` are rejected, and so are uploads which don't fit in `UPLOADS_IN_FLIGHT_MAX_BYTES` (the bytes of
+    all the uploads not indexed yet) after waiting `UPLOAD_WAIT` seconds.
+
     Returns:\n\n
-         a json response with fields: `message`, `code`, `result`
+         a json response with fields: `message`, `code`, `result` where in result you have the `job_id`.
     """
     if file is None:
         return GenericSchema(message="File is None", result="", code=response_codes.EXCEPTION)
@@ -203,20 +462,34 @@ async def process_pdf(file: Annotated[UploadFile, Form(description="Your txt or
 
     filename = file.filename
     extension = filename.split('.')[-1]
-    if extension.lower() == 'pdf':
-        contents = await file.read()
-    else:
+    if extension.lower() != 'pdf':
         return GenericSchema(message="Only txt of pdf files supported at this point", result="",
                              code=response_codes.INVALID_FORMAT)
+    try:
+        buffer = await receive_upload(file)
+    except ValueError as e:
+        return GenericSchema(message=str(e), result="", code=UPLOAD_TOO_LARGE)
+    except queue.Full:
+        return GenericSchema(message="Too many files being processed. Try again later", result="", code=QUEUE_FULL)
     logging.info(f"Processing {filename} with separator={separator}, chunk_size={chunk_size} and "
                  f"chunk_overlap={chunk_overlap}")
+
+    def task(job):
+        try:
+            loader.index_pdf(buffer.source(), filename, separator, chunk_size, chunk_overlap, job, buffer.digest())
+        finally:
+            buffer.close()
+
     try:
         separator = separator.replace("\r", "")
-        loader.index_pdf(contents, filename, separator, chunk_size, chunk_overlap)
-        return GenericSchema(message=f"{filename} was successfully processed", result="",
+        job = ingestion_queue.submit(filename, task)
+        return GenericSchema(message=f"{filename} was queued for processing", result={'job_id': job.id},
                              code=response_codes.SUCCESS)
-
+    except queue.Full:
+        buffer.close()
+        return GenericSchema(message="Too many files being processed. Try again later", result="", code=QUEUE_FULL)
     except Exception as e:
+        buffer.close()
         return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
 
 
@@ -246,35 +519,169 @@ async def process_text(file: Annotated[UploadFile, Form(description="Your txt or
      - `chunk_overlap`: In order to take context into consideration, chunks also get a surrounding context of a total of
      **chunk_overlap** previous and following characters.\n
 
+     The file is processed in the background. Use `/jobs/{job_id}` to follow the progress. Files bigger than
+     `UPLOAD_MAX_BYTES` are rejected, and so are uploads which don't fit in `UPLOADS_IN_FLIGHT_MAX_BYTES` (the bytes
+     of all the uploads not indexed yet) after waiting `UPLOAD_WAIT` seconds.
+
      Returns:\n\n
-          a json response with fields: `message`, `code`, `result`
+          a json response with fields: `message`, `code`, `result` where in result you have the `job_id`.
      """
     if file is None:
         return GenericSchema(message="File is None", result="", code=response_codes.EXCEPTION)
+    if separator is None:
+        separator = NEWLINE
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    if chunk_overlap is None:
+        chunk_overlap = CHUNK_OVERLAP
 
     filename = file.filename
     extension = filename.split('.')[-1]
-    if extension.lower() == 'txt':
-        contents = await file.read()
-    elif extension.lower() == 'pdf':
-        content_bytes = await file.read()
-        content_bytes_io = BytesIO(content_bytes)
-        contents = PDFExtractor.extract(content_bytes_io)
-    else:
+    if extension.lower() not in ['txt', 'pdf']:
         return GenericSchema(message="Only txt of pdf files supported at this point", result="",
                              code=response_codes.INVALID_FORMAT)
+    try:
+        buffer = await receive_upload(file)
+    except ValueError as e:
+        return GenericSchema(message=str(e), result="", code=UPLOAD_TOO_LARGE)
+    except queue.Full:
+        return GenericSchema(message="Too many files being processed. Try again later", result="", code=QUEUE_FULL)
     logging.info(f"Processing {filename} with separator={separator}, chunk_size={chunk_size} and "
                  f"chunk_overlap={chunk_overlap}")
+
+    def task(job):
+        from modules.pdf.PDFExtractor import PDFExtractor
+
+        try:
+            # Text is extracted or decoded as it is split, not all at once
+            if extension.lower() == 'pdf':
+                pieces = PDFExtractor.iter_text(buffer.source())
+            else:
+                pieces = buffer.iter_text()
+            loader.index_text_stream(pieces, filename, buffer.digest(), separator, chunk_size, chunk_overlap, job)
+        finally:
+            buffer.close()
+
     try:
         separator = separator.replace("\r", "")
-        loader.index_text(contents, filename, separator, chunk_size, chunk_overlap)
-        return GenericSchema(message=f"{filename} was successfully processed", result="",
+        job = ingestion_queue.submit(filename, task)
+        return GenericSchema(message=f"{filename} was queued for processing", result={'job_id': job.id},
                              code=response_codes.SUCCESS)
+    except queue.Full:
+        buffer.close()
+        return GenericSchema(message="Too many files being processed. Try again later", result="", code=QUEUE_FULL)
+    except Exception as e:
+        buffer.close()
+        return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
+
 
+@app.post("/delete_document")
+async def delete_document(filename: Annotated[str, Form(description="Name of the file previously uploaded")]):
+    """
+    This endpoint removes from the vector store all the chunks of a file previously uploaded.
+
+    Args:\n\n
+    - `filename`: Name of the file previously uploaded.
+
+    Returns:\n\n
+         a json response with fields: `message`, `code`, `result` where in result you have the number of `chunks`
+         removed.
+    """
+    try:
+        deleted = await run_in_threadpool(loader.delete_document, filename)
+        return GenericSchema(message=f"{filename} was removed", result={'chunks': deleted},
+                             code=response_codes.SUCCESS)
     except Exception as e:
         return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
 
 
+@app.get("/jobs")
+async def jobs():
+    """
+    This endpoint lists the ingestion jobs queued by `/process_pdf` and `/process_text`, together with their progress.
+
+    Returns:\n\n
+         a json response with fields: `message`, `code`, `result` where in result you have a `jobs` list. Each job has
+         `job_id`, `filename`, `status` (pending, running, done or failed), `pages_extracted`, `chunks_embedded`,
+         `persisted` and `error`.
+    """
+    return GenericSchema(message="Jobs retrieved", result={'jobs': [j.to_dict() for j in ingestion_queue.list()]},
+                         code=response_codes.SUCCESS)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    This endpoint reports the progress of an ingestion job.
+
+    Args:\n\n
+    - `job_id`: The id returned by `/process_pdf` or `/process_text`.
+
+    Returns:\n\n
+         a json response with fields: `message`, `code`, `result` where in result you have `job_id`, `filename`,
+         `status` (pending, running, done or failed), `pages_extracted`, `chunks_embedded`, `persisted` and `error`.
+    """
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return GenericSchema(message=f"Job {job_id} not found", result="", code=JOB_NOT_FOUND)
+    return GenericSchema(message=f"Job {job_id} is {job.status}", result=job.to_dict(), code=response_codes.SUCCESS)
+
+
+async def receive_upload(file: UploadFile) -> UploadBuffer:
+    """
+    Takes over the file of an upload and hashes it. Raises `ValueError` if it is too big, and `queue.Full` if there is
+    no room for it.
+    """
+    buffer = UploadBuffer(upload_limiter)
+    try:
+        await buffer.receive(file)
+    except Exception:
+        buffer.close()
+        raise
+    UPLOADED_BYTES.inc(buffer.size)
+    return buffer
+
+
+def is_relevant(distance: Optional[float]) -> bool:
+    # Chunks found only by the lexical index have no distance, but they contain the terms of the question
+    return distance is None or distance <= RELEVANT_THRESHOLD
+
+
+def pack_context(results: list):
+    # Only the relevant chunks are sent to the LLM, merged, deduplicated and cut to the token budget
+    return context_packer.pack([(r, x) for r, x in results if is_relevant(x)])
+
+
+def check_retrieval_mode(retrieval_mode: Optional[str]) -> str:
+    mode = retrieval_mode.lower() if retrieval_mode is not None else RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode `{retrieval_mode}`. Use one of: {', '.join(RETRIEVAL_MODES)}")
+    return mode
+
+
+def format_timings(stage_timings: dict, start: float) -> dict:
+    # Stages may be nested (e.g. `vector_search` includes `embed`), so they don't add up to the total
+    stage_timings = {stage: round(seconds * 1000, 2) for stage, seconds in stage_timings.items()}
+    stage_timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+    return stage_timings
+
+
+def format_results(results: list) -> list:
+    dict_result = []
+    for r, score in results:
+        partial = {'answer': r.page_content.strip(),
+                   'filename': r.metadata['uploaded_filename'],
+                   'title': r.metadata['title'] if 'title' in r.metadata else '',
+                   'author': r.metadata['author'] if 'author' in r.metadata else '',
+                   'page_number': r.metadata['page_number'] if 'page_number' in r.metadata else '',
+                   'total_pages': r.metadata['total_pages'] if 'total_pages' in r.metadata else '',
+                   'distance': round(score, 2) if score is not None else None,
+                   'is_relevant': is_relevant(score)
+                   }
+        dict_result.append(partial)
+    return dict_result
+
+
 @app.post("/query")
 async def query(question: Annotated[str, Form(description="Question or query to retrieve information from"
                                                           "your vector store")],
@@ -282,7 +689,15 @@ async def query(question: Annotated[str, Form(description="Question or query to
                                                                         "`False` otherwise"),
                 items: Optional[int] = Form(None, description="Number of items to retrieve"),
                 use_mockup_answer: Optional[str] = Form(None, description="True if you want to return a mockup answer, "
-                                                                          "False otherwise (testing purposes only)")):
+                                                                          "False otherwise (testing purposes only)"),
+                retrieval_mode: Optional[str] = Form(None, description="`vector`, `lexical` or `hybrid`"),
+                filename: Optional[str] = Form(None, description="Only search in this uploaded file"),
+                author: Optional[str] = Form(None, description="Only search in the documents of this author"),
+                page_from: Optional[int] = Form(None, description="Only search from this page number on"),
+                page_to: Optional[int] = Form(None, description="Only search up to this page number"),
+                cursor: Optional[str] = Form(None, description="`next_cursor` of the previous page of results"),
+                timings: Optional[str] = Form(None, description="`True` to add the time spent in each stage to the "
+                                                                "response (debugging purposes only)")):
     """
         This endpoint will trigger your Vector Store database looking for the min cosine distance towards all the chunks
         previously indexed.
@@ -291,45 +706,59 @@ async def query(question: Annotated[str, Form(description="Question or query to
     - `question`: Question or query to retrieve information from your vector store
     - `generate_answer`: True if you want to generate an answer using the results. False otherwise.
     - `items`: Number of items to retrieve
+    - `retrieval_mode`: `vector` (by embeddings), `lexical` (by keywords, BM25, without embeddings) or `hybrid` (both
+    rankings fused). Defaults to `RETRIEVAL_MODE`.
+    - `filename`, `author`, `page_from`, `page_to`: (Optional) Only the chunks matching all of them are searched.
+    - `cursor`: (Optional) To get the next page of results, the `next_cursor` returned with the previous page. The
+    rest of the parameters must be the same.
+    - `timings`: (Optional) True to add to the result the milliseconds spent in each stage, in `timings`.
 
     Returns:\n\n
-        a json response with fields: `message`, `code`, `result`
+        a json response with fields: `message`, `code`, `result` where in result you have the retrieved `answers`,
+        the `contexted_answer`, `answer_from_cache`, True if the contexted answer was not generated again,
+        `context`, the chunks and tokens of the relevant results (`retrieved_chunks`, `retrieved_tokens`) and of the
+        context sent to the LLM after merging overlapping chunks and dropping duplicates (`chunks`, `tokens`,
+        `saved_tokens`), and `next_cursor`, to get the next page of results (null if there are no more).
     """
     logging.info(f"Triggering {question} towards the index")
     try:
-        querier = Querier(loader)
-        results = querier.retrieve(question, items)
+        mode = check_retrieval_mode(retrieval_mode)
+        if cursor is not None:
+            from modules.indexing.querier import Querier
+            Querier.decode_cursor(cursor)
+    except ValueError as e:
+        return GenericSchema(message=str(e), result="", code=response_codes.INVALID_VALUE)
+    try:
+        start = time.perf_counter()
+        stage_timings = Metrics.start_timings() if str(timings).lower() == "true" else None
+        search_filter = SearchFilter(filename, author, page_from, page_to)
+        results, next_cursor = await run_in_threadpool(Metrics.in_context(querier.retrieve_page), question, items,
+                                                       mode, search_filter, cursor)
 
         generate_answer = str(generate_answer).lower() == "true"
 
         contexted_answer = ""
+        answer_from_cache = False
+        context = None
         if generate_answer:
-            generator = AnswerGenerator()
-
-            relevant_results = [r.page_content.strip() for r, x in results if x <= RELEVANT_THRESHOLD]
+            context = pack_context(results)
             contexted_answer = NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER
-            if len(relevant_results) > 0:
+            if len(context.texts) > 0:
                 if use_mockup_answer is not None and use_mockup_answer.lower() == "true":
-                    contexted_answer = generator.generate_mock(question, relevant_results)
+                    contexted_answer = generator.generate_mock(question, context.texts)
                 else:
-                    contexted_answer = generator.generate(question, relevant_results)
+                    contexted_answer, answer_from_cache = await run_in_threadpool(
+                        Metrics.in_context(generator.generate_cached), question, context.texts,
+                        loader.generation.current())
 
         main_result = {}
-
-        dict_result = []
-        for r, score in results:
-            partial = {'answer': r.page_content.strip(),
-                       'filename': r.metadata['uploaded_filename'],
-                       'title': r.metadata['title'] if 'title' in r.metadata else '',
-                       'author': r.metadata['author'] if 'author' in r.metadata else '',
-                       'page_number': r.metadata['page_number'] if 'page_number' in r.metadata else '',
-                       'total_pages': r.metadata['total_pages'] if 'total_pages' in r.metadata else '',
-                       'distance': round(score, 2),
-                       'is_relevant': score <= RELEVANT_THRESHOLD
-                       }
-            dict_result.append(partial)
         main_result['contexted_answer'] = contexted_answer.strip()
-        main_result['answers'] = dict_result
+        main_result['answer_from_cache'] = answer_from_cache
+        main_result['context'] = context.stats() if context is not None else None
+        main_result['answers'] = format_results(results)
+        main_result['next_cursor'] = next_cursor
+        if stage_timings is not None:
+            main_result['timings'] = format_timings(stage_timings, start)
         return GenericSchema(message=f"Processed: `{question}`", result=main_result,
                              code=response_codes.SUCCESS)
 
@@ -337,6 +766,150 @@ async def query(question: Annotated[str, Form(description="Question or query to
         return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
 
 
+@app.post("/query/stream")
+async def query_stream(question: Annotated[str, Form(description="Question or query to retrieve information from"
+                                                                 "your vector store")],
+                       generate_answer: Optional[str] = Form(None, description="`True` if you want to generate an "
+                                                                               "answer, `False` otherwise"),
+                       items: Optional[int] = Form(None, description="Number of items to retrieve"),
+                       use_mockup_answer: Optional[str] = Form(None, description="True if you want to return a mockup "
+                                                                                 "answer, False otherwise (testing "
+                                                                                 "purposes only)"),
+                       retrieval_mode: Optional[str] = Form(None, description="`vector`, `lexical` or `hybrid`")):
+    """
+    Same as `/query`, but streaming the response as newline-delimited json, so that the retrieved results can be shown
+    before the answer is generated.
+
+    Args:\n\n
+    - `question`: Question or query to retrieve information from your vector store
+    - `generate_answer`: True if you want to generate an answer using the results. False otherwise.
+    - `items`: Number of items to retrieve
+    - `retrieval_mode`: `vector`, `lexical` or `hybrid`, as in `/query`.
+
+    Returns:\n\n
+        a stream of json lines, each of them with an `event` field:\n
+        - `answers`: sent first, with the retrieved `answers`, as in `/query`.\n
+        - `token`: a piece of the contexted answer in `token`, as the LLM generates it.\n
+        - `done`: sent last, with `answer_from_cache`, True if the contexted answer was not generated again, and the
+        `context` sent to the LLM, as in `/query`.\n
+        - `error`: if something failed, with `message` and `code`.
+    """
+    logging.info(f"Triggering {question} towards the index (streaming)")
+    generate_answer = str(generate_answer).lower() == "true"
+
+    def event(**kwargs) -> str:
+        return json.dumps(kwargs) + "\n"
+
+    def events():
+        try:
+            mode = check_retrieval_mode(retrieval_mode)
+        except ValueError as e:
+            yield event(event='error', message=str(e), code=response_codes.INVALID_VALUE)
+            return
+        try:
+            results = querier.retrieve(question, items, mode)
+            yield event(event='answers', answers=format_results(results))
+
+            answer_from_cache = False
+            context = None
+            if generate_answer:
+                generation = loader.generation.current()
+                context = pack_context(results)
+                if len(context.texts) == 0:
+                    yield event(event='token', token=NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER)
+                elif use_mockup_answer is not None and use_mockup_answer.lower() == "true":
+                    yield event(event='token', token=generator.generate_mock(question, context.texts))
+                else:
+                    contexted_answer = generator.cached(question, context.texts, generation)
+                    if contexted_answer is not None:
+                        answer_from_cache = True
+                        yield event(event='token', token=contexted_answer)
+                    else:
+                        tokens = []
+                        for token in generator.stream(question, context.texts):
+                            tokens.append(token)
+                            yield event(event='token', token=token)
+                        from modules.generators.answer_generator import AnswerGenerator
+                        generator.remember(question, context.texts, generation,
+                                           AnswerGenerator.clean("".join(tokens)))
+            yield event(event='done', answer_from_cache=answer_from_cache,
+                        context=context.stats() if context is not None else None)
+        except Exception as e:
+            yield event(event='error', message=str(e), code=response_codes.EXCEPTION)
+
+    # Starlette iterates synchronous generators in a thread pool, so retrieval and generation don't block the loop
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/query/batch")
+async def query_batch(batch: BatchQuerySchema):
+    """
+    Same as `/query` for many questions at once. All the questions are embedded in a single request and scored against
+    the vector store in a single matrix operation, and answers are generated in a single batch.
+
+    Args:\n\n
+    - `questions`: List of objects with the `question` and, optionally, the number of `items` to retrieve.
+    - `generate_answer`: True if you want to generate an answer for every question using the results.
+    - `use_mockup_answer`: True if you want to return a mockup answer (testing purposes only).
+    - `retrieval_mode`: `vector`, `lexical` or `hybrid`, as in `/query`.
+    - `timings`: True to add to the result the milliseconds spent in each stage, in `timings`.
+
+    Returns:\n\n
+        a json response with fields: `message`, `code`, `result` where in result you have a `results` list with,
+        for each question in the same order, the `question` and the same fields as in `/query`.
+    """
+    logging.info(f"Triggering a batch of {len(batch.questions)} questions towards the index")
+    try:
+        mode = check_retrieval_mode(batch.retrieval_mode)
+    except ValueError as e:
+        return GenericSchema(message=str(e), result="", code=response_codes.INVALID_VALUE)
+    try:
+        start = time.perf_counter()
+        stage_timings = Metrics.start_timings() if batch.timings else None
+        questions = [q.question for q in batch.questions]
+        results = await run_in_threadpool(Metrics.in_context(querier.retrieve_batch), questions,
+                                          [q.items for q in batch.questions], mode)
+
+        contexted_answers = [("", False)] * len(questions)
+        contexts = [None] * len(questions)
+        if batch.generate_answer:
+            contexts = [pack_context(rows) for rows in results]
+            to_generate = [i for i, c in enumerate(contexts) if len(c.texts) > 0]
+            contexted_answers = [(NOT_ENOUGH_RESULTS_TO_GENERATE_ANSWER, False)] * len(questions)
+            if batch.use_mockup_answer:
+                for i in to_generate:
+                    contexted_answers[i] = (generator.generate_mock(questions[i], contexts[i].texts), False)
+            elif len(to_generate) > 0:
+                generated = await run_in_threadpool(Metrics.in_context(generator.generate_batch),
+                                                    [questions[i] for i in to_generate],
+                                                    [contexts[i].texts for i in to_generate],
+                                                    loader.generation.current())
+                for i, answer in zip(to_generate, generated):
+                    contexted_answers[i] = answer
+
+        main_result = {'results': [{'question': q,
+                                    'contexted_answer': answer.strip(),
+                                    'answer_from_cache': from_cache,
+                                    'context': context.stats() if context is not None else None,
+                                    'answers': format_results(rows)}
+                                   for q, rows, (answer, from_cache), context
+                                   in zip(questions, results, contexted_answers, contexts)]}
+        if stage_timings is not None:
+            main_result['timings'] = format_timings(stage_timings, start)
+        return GenericSchema(message=f"Processed {len(questions)} questions", result=main_result,
+                             code=response_codes.SUCCESS)
+
+    except Exception as e:
+        return GenericSchema(message=str(e), result="", code=response_codes.EXCEPTION)
+
+
 if __name__ == "__main__":
     # loader.show_collection_data()
-    uvicorn.run(app, host=HOST, port=PORT)
+    if WORKERS > 1:
+        if ROLE != READER:
+            print("Only readers can run with several WORKERS: the index must have a single writer")
+            exit(1)
+        # Every worker process imports the app on its own
+        uvicorn.run("main:app", host=HOST, port=int(PORT), workers=WORKERS)
+    else:
+        uvicorn.run(app, host=HOST, port=int(PORT))
@@ -0,0 +1,16 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class BatchQuestionSchema(BaseModel):
+    question: str
+    items: Optional[int] = None
+
+
+class BatchQuerySchema(BaseModel):
+    questions: List[BatchQuestionSchema]
+    generate_answer: bool = False
+    use_mockup_answer: bool = False
+    retrieval_mode: Optional[str] = None
+    timings: bool = False
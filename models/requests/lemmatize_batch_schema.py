@@ -0,0 +1,9 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class LemmatizeBatchSchema(BaseModel):
+    texts: List[str]
+    lan: str
+    remove_stopwords: bool = False
@@ -0,0 +1,75 @@
+import time
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+from modules.embeddings.embedding_cache import EmbeddingCache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+        Wraps any LangChain `Embeddings` so that texts already embedded by the same model are served from an
+        `EmbeddingCache` instead of calling the remote provider again.
+    """
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = CachedEmbeddings.model_name(embeddings)
+        # Some providers, as the first generation of OpenAI embeddings, embed queries with a different model
+        self.query_model = CachedEmbeddings.model_name(embeddings, query=True)
+
+    @staticmethod
+    def model_name(embeddings: Embeddings, query: bool = False) -> str:
+        """
+        Args:\n\n
+            embeddings: the embeddings being cached
+            query: whether to name the model embedding queries instead of documents
+
+        Returns:\n\n
+            The name of the model, used in the keys of the cache
+        """
+        # Wrappers, as `MicroBatchingEmbeddings`, embed with the model of the embeddings they wrap
+        wrapped = getattr(embeddings, 'embeddings', None)
+        if isinstance(wrapped, Embeddings):
+            return CachedEmbeddings.model_name(wrapped, query)
+        for attr in ['query_model_name' if query else 'document_model_name', 'model', 'model_name']:
+            name = getattr(embeddings, attr, None)
+            if isinstance(name, str):
+                return f"{type(embeddings).__name__}:{name}"
+        return type(embeddings).__name__
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.model, t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        # Same chunk repeated in the same batch is only embedded once
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        misses = len([k for k in keys if k not in found])
+        self.cache.record_lookups(len(keys) - misses, misses)
+
+        if len(missing) > 0:
+            start = time.perf_counter()
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.record_remote_call(time.perf_counter() - start)
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.key(self.query_model, text)
+        found = self.cache.get_many([key])
+        if key in found:
+            self.cache.record_lookups(1, 0)
+            return found[key]
+
+        self.cache.record_lookups(0, 1)
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self.cache.record_remote_call(time.perf_counter() - start)
+        self.cache.put_many({key: vector})
+        return vector
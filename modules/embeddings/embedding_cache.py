@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from modules.normalizers.whitespace_normalizer import WhitespaceNormalizer
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+
+class EmbeddingCache:
+    """
+        Persistent, content-addressed store of embeddings in SQLite. Entries are keyed by the embedding model and a
+        hash of the normalized text, and the least recently used ones are evicted when the cache grows beyond
+        `max_bytes`.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                          "last_access REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+        self.size_bytes = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.remote_calls = 0
+        self.remote_seconds = 0.0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        norm_text = WhitespaceNormalizer.normalize(text).strip()
+        return hashlib.sha256(f"{model}\x00{norm_text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        if len(keys) == 0:
+            return found
+        unique_keys = list(set(keys))
+        with self.lock:
+            for i in range(0, len(unique_keys), SQLITE_MAX_PARAMS):
+                batch = unique_keys[i:i + SQLITE_MAX_PARAMS]
+                rows = self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN "
+                                         f"({','.join('?' * len(batch))})", batch).fetchall()
+                for k, v in rows:
+                    found[k] = np.frombuffer(v, dtype=np.float32).tolist()
+            if len(found) > 0:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                      [(now, k) for k in found])
+                self.conn.commit()
+        return found
+
+    def put_many(self, entries: Dict[str, List[float]]):
+        if len(entries) == 0:
+            return
+        now = time.time()
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in entries.items()]
+        with self.lock:
+            existing = 0
+            keys = [r[0] for r in rows]
+            for i in range(0, len(keys), SQLITE_MAX_PARAMS):
+                batch = keys[i:i + SQLITE_MAX_PARAMS]
+                existing += self.conn.execute(f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN "
+                                              f"({','.join('?' * len(batch))})", batch).fetchone()[0]
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                                  rows)
+            self.size_bytes += sum(len(r[1]) for r in rows) - existing
+            if self.size_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Drops the least recently used entries until the cache is 10% below its limit
+        target = int(self.max_bytes * 0.9)
+        while self.size_bytes > target:
+            rows = self.conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 1000")\
+                .fetchall()
+            if len(rows) == 0:
+                self.size_bytes = 0
+                break
+            for k, size in rows:
+                if self.size_bytes <= target:
+                    break
+                self.conn.execute("DELETE FROM embeddings WHERE key = ?", (k,))
+                self.size_bytes -= size
+        logging.debug(f"Embedding cache evicted down to {self.size_bytes} bytes")
+
+    def record_lookups(self, hits: int, misses: int):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def record_remote_call(self, seconds: float):
+        with self.lock:
+            self.remote_calls += 1
+            self.remote_seconds += seconds
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        avg_seconds_per_miss = self.remote_seconds / self.misses if self.misses > 0 else 0.0
+        return {'entries': entries,
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                'remote_calls': self.remote_calls,
+                'remote_seconds': round(self.remote_seconds, 3),
+                'estimated_saved_seconds': round(self.hits * avg_seconds_per_miss, 3)}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,79 @@
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.openai import OpenAIEmbeddings
+
+from constants.consts import EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES, \
+    EMBEDDINGS_PROVIDER, HASHING_EMBEDDINGS_DIMENSIONS, EMBEDDING_BATCH_WINDOW, EMBEDDING_BATCH_MAX_SIZE, \
+    EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES, EMBEDDING_RETRY_BACKOFF
+from modules.embeddings.cached_embeddings import CachedEmbeddings
+from modules.embeddings.embedding_cache import EmbeddingCache
+from modules.embeddings.hashing_embeddings import HashingEmbeddings
+from modules.embeddings.micro_batching_embeddings import MicroBatchingEmbeddings
+from modules.embeddings.timed_embeddings import TimedEmbeddings
+
+OPENAI = 'openai'
+HASHING = 'hashing'
+
+
+class EmbeddingsFactory:
+    """
+        Builds the embeddings of the provider configured in `EMBEDDINGS_PROVIDER`, used by the vector stores and the
+        query path, so that all of them share the same `EmbeddingCache` and the same `MicroBatchingEmbeddings`.
+    """
+    _cache = None
+    _batchers = {}
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def cache() -> EmbeddingCache:
+        if EmbeddingsFactory._cache is None:
+            EmbeddingsFactory._cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+        return EmbeddingsFactory._cache
+
+    @staticmethod
+    def provider(provider: str = None) -> Embeddings:
+        if provider is None:
+            provider = EMBEDDINGS_PROVIDER
+        provider = provider.lower()
+        if provider == OPENAI:
+            if EMBEDDING_BATCH_WINDOW > 0:
+                # Rate-limited calls are retried by `MicroBatchingEmbeddings`, which keeps the calls under its cap
+                return OpenAIEmbeddings(max_retries=1)
+            return OpenAIEmbeddings()
+        if provider == HASHING:
+            return HashingEmbeddings(HASHING_EMBEDDINGS_DIMENSIONS)
+        raise ValueError(f"Unknown embeddings provider `{provider}`. Use one of: {OPENAI}, {HASHING}")
+
+    @staticmethod
+    def batcher(provider: str = None) -> Embeddings:
+        """
+        Returns:\n\n
+            The embeddings of the provider, batching the requests of all the stores (and their replicas) together
+        """
+        if provider is None:
+            provider = EMBEDDINGS_PROVIDER
+        provider = provider.lower()
+        if provider not in EmbeddingsFactory._batchers:
+            EmbeddingsFactory._batchers[provider] = MicroBatchingEmbeddings(
+                EmbeddingsFactory.provider(provider), EMBEDDING_BATCH_WINDOW, EMBEDDING_BATCH_MAX_SIZE,
+                EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES, EMBEDDING_RETRY_BACKOFF)
+        return EmbeddingsFactory._batchers[provider]
+
+    @staticmethod
+    def build(provider: str = None) -> Embeddings:
+        embeddings = EmbeddingsFactory.provider(provider)
+        # Hashing a text is cheaper than looking it up in the cache, or than waiting for others to batch it with
+        if isinstance(embeddings, HashingEmbeddings):
+            return TimedEmbeddings(embeddings)
+        if EMBEDDING_BATCH_WINDOW > 0:
+            embeddings = EmbeddingsFactory.batcher(provider)
+        if EMBEDDING_CACHE_ENABLED:
+            embeddings = CachedEmbeddings(embeddings, EmbeddingsFactory.cache())
+        return TimedEmbeddings(embeddings)
+
+    @staticmethod
+    def stats() -> dict:
+        if not EMBEDDING_CACHE_ENABLED:
+            return {'enabled': False}
+        return {'enabled': True, **EmbeddingsFactory.cache().stats()}
@@ -0,0 +1,51 @@
+import re
+import zlib
+from typing import List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+TOKEN_REGEX = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+        Local embeddings which need neither network nor model: the words and pairs of consecutive words of each text
+        are hashed into `dimensions` buckets with a random sign, weighted by sublinear term frequency and normalized.
+        The same text always gets the same vector, so ingestion and queries can be measured without a remote
+        provider. Texts sharing words are close, but there is no semantics beyond that.
+    """
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def _features(self, text: str) -> List[int]:
+        words = TOKEN_REGEX.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [zlib.crc32(f.encode('utf-8')) for f in features]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for i, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([i] * len(features))
+            hashes.extend(features)
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        buckets = (hashes % self.dimensions).astype(np.int64)
+        # The highest bit decides the sign, so that collisions cancel out instead of piling up
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+
+        counts = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(counts, (np.asarray(rows, dtype=np.int64), buckets), signs)
+        vectors = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) == 0:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
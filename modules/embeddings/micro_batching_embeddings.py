@@ -0,0 +1,148 @@
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain.embeddings.base import Embeddings
+from openai.error import RateLimitError
+
+from modules.metrics.metrics import Metrics, EMBEDDING_BATCH_SIZE, EMBEDDING_RETRIES
+
+
+class EmbeddingRequest:
+    """
+        Texts of a caller waiting to be embedded, and the future where it gets their vectors.
+    """
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.wait = 0.0
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+        Wraps any LangChain `Embeddings` so that the requests of concurrent callers (queries and ingestion) arriving
+        within `window` seconds of the first one are sent to the provider in a single call of up to `max_batch_size`
+        texts, instead of one call each, and every caller gets back its own vectors. At most `max_concurrency` calls
+        are made at once, and the calls rejected by the rate limit of the provider are retried with exponential
+        backoff.
+    """
+    def __init__(self, embeddings: Embeddings, window: float, max_batch_size: int, max_concurrency: int,
+                 max_retries: int, retry_backoff: float):
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Queries can only be merged with the other texts if they are embedded by the same model
+        self.batch_queries = getattr(embeddings, 'query_model_name', None) == \
+            getattr(embeddings, 'document_model_name', None)
+        self.requests = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='embeddings')
+        self.dispatcher = threading.Thread(target=self._dispatch, name='embeddings-batcher', daemon=True)
+        self.dispatcher.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) == 0:
+            return []
+        requests = [EmbeddingRequest(texts[i:i + self.max_batch_size])
+                    for i in range(0, len(texts), self.max_batch_size)]
+        for r in requests:
+            self.requests.put(r)
+        vectors = []
+        for r in requests:
+            vectors.extend(r.future.result())
+            # Observed in the thread of the caller, so that it shows up in its timings
+            Metrics.observe('embed_wait', r.wait)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        if not self.batch_queries:
+            return self.embeddings.embed_query(text)
+        return self.embed_documents([text])[0]
+
+    def _dispatch(self):
+        pending: Optional[EmbeddingRequest] = None
+        stopping = False
+        while not stopping:
+            first = pending if pending is not None else self.requests.get()
+            if first is None:
+                return
+            pending = None
+            batch, size = [first], len(first.texts)
+            deadline = first.submitted + self.window
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                if size + len(request.texts) > self.max_batch_size:
+                    pending = request
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            # Waits for a call to finish if there are already `max_concurrency` of them, meanwhile the requests
+            # arriving queue up for the next batch
+            self.slots.acquire()
+            now = time.perf_counter()
+            for r in batch:
+                r.wait = now - r.submitted
+            self.executor.submit(self._embed, batch)
+
+    def _embed(self, batch: List[EmbeddingRequest]):
+        try:
+            texts = [t for r in batch for t in r.texts]
+            try:
+                vectors = self._call(texts)
+            except Exception as e:
+                if len(batch) == 1 or isinstance(e, RateLimitError):
+                    for r in batch:
+                        r.future.set_exception(e)
+                    return
+                # So that a text the provider rejects only fails the request it came from
+                logging.warning(f"Batch of {len(texts)} texts failed ({e}), embedding its requests one by one")
+                for r in batch:
+                    try:
+                        r.future.set_result(self._call(r.texts))
+                    except Exception as request_error:
+                        r.future.set_exception(request_error)
+                return
+            start = 0
+            for r in batch:
+                r.future.set_result(vectors[start:start + len(r.texts)])
+                start += len(r.texts)
+        finally:
+            self.slots.release()
+
+    def _call(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                EMBEDDING_BATCH_SIZE.observe(len(texts))
+                return self.embeddings.embed_documents(texts)
+            except RateLimitError:
+                if attempt >= self.max_retries:
+                    raise
+                # With jitter, so that the calls rejected together are not retried together
+                delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning(f"Embeddings provider rate limit hit, retrying in {delay:.1f}s")
+                EMBEDDING_RETRIES.inc()
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        """
+        Stops the dispatcher once the requests already queued are sent, and waits for their calls to finish.
+        """
+        self.requests.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown(wait=True)
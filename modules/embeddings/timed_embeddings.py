@@ -0,0 +1,23 @@
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+from modules.metrics.metrics import Metrics, EMBEDDED_TEXTS
+
+
+class TimedEmbeddings(Embeddings):
+    """
+        Wraps the embeddings to time their calls (including the lookups in the cache) and count the texts embedded.
+    """
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        EMBEDDED_TEXTS.labels('documents').inc(len(texts))
+        with Metrics.stage('embed'):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        EMBEDDED_TEXTS.labels('queries').inc()
+        with Metrics.stage('embed'):
+            return self.embeddings.embed_query(text)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+class AnswerCache:
+    """
+        Persistent cache of generated answers in SQLite. Answers are found by the hash of the prompt template, the
+        question and the ordered context they were generated from. Optionally, an answer to a near-duplicate
+        question (by cosine similarity of the question embeddings) generated in the same ingest generation can be
+        reused as well.
+    """
+    def __init__(self, path: str, max_entries: int, similarity: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.similarity = similarity
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, template TEXT NOT NULL, "
+                          "generation INTEGER NOT NULL, question_vector BLOB, answer TEXT NOT NULL, "
+                          "last_access REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_generation ON answers (template, generation)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)")
+        self.conn.commit()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def template_hash(template: str) -> str:
+        return hashlib.sha256(template.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(template: str, question: str, context: List[str]) -> str:
+        norm_question = re.sub(r'\s+', ' ', question).strip().lower()
+        content = "\x00".join([AnswerCache.template_hash(template), norm_question, "\x1f".join(context)])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.exact_hits += 1
+            return row[0]
+
+    def get_similar(self, template: str, generation: int, question_vector: List[float]) -> Optional[str]:
+        """
+        Returns:\n\n
+            The answer of the most similar question cached in this `generation`, if its similarity is at least
+            `similarity`. None otherwise.
+        """
+        if self.similarity <= 0 or question_vector is None:
+            return None
+        with self.lock:
+            rows = self.conn.execute("SELECT key, question_vector, answer FROM answers WHERE template = ? AND "
+                                     "generation = ? AND question_vector IS NOT NULL",
+                                     (AnswerCache.template_hash(template), generation)).fetchall()
+            if len(rows) == 0:
+                return None
+            matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+            query = np.asarray(question_vector, dtype=np.float32)
+            similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity:
+                return None
+            self.conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time(), rows[best][0]))
+            self.conn.commit()
+            self.similar_hits += 1
+            return rows[best][2]
+
+    def put(self, key: str, template: str, generation: int, question_vector: Optional[List[float]], answer: str):
+        vector = np.asarray(question_vector, dtype=np.float32).tobytes() if question_vector is not None else None
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO answers (key, template, generation, question_vector, answer, "
+                              "last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, AnswerCache.template_hash(template), generation, vector, answer, time.time()))
+            count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute("DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_access "
+                                  "LIMIT ?)", (count - self.max_entries,))
+            self.conn.commit()
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {'entries': entries,
+                'max_entries': self.max_entries,
+                'similarity': self.similarity,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups > 0 else 0.0}
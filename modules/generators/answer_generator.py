@@ -1,12 +1,17 @@
-import random
 import re
+import time
+from typing import Iterator, List, Optional, Tuple
 
+from langchain.embeddings.base import Embeddings
 from langchain.llms import OpenAI
 from langchain import PromptTemplate, LLMChain
 
+from modules.generators.answer_cache import AnswerCache
+from modules.metrics.metrics import Metrics, LLM_TOKENS
+
 
 class AnswerGenerator:
-    def __init__(self):
+    def __init__(self, cache: AnswerCache = None, embeddings: Embeddings = None):
         template = "Act as a Summarizer. I will provide you with one Question and some "\
                    "Context. You will summarize the Context into one sentence in such a way that answers " \
                    "to the Question. Remove all the constructions and expressions you find in Context which don't add "\
@@ -14,8 +19,24 @@ class AnswerGenerator:
                    "\n"\
                    "{qa}"
 
+        self.template = template
         self.prompt = PromptTemplate(template=template, input_variables=["qa"])
         self.llm = OpenAI()
+        self.llm_chain = LLMChain(prompt=self.prompt, llm=self.llm)
+        self.cache = cache
+        # Used to embed the question when looking for answers to near-duplicate questions
+        self.embeddings = embeddings
+
+    @staticmethod
+    def qa(query: str, context: []) -> str:
+        context = "\n- ".join(context)
+        return f"The Question is the following: {query}.\nThe Context is the following:{context}."
+
+    @staticmethod
+    def clean(contexted_answer: str) -> str:
+        contexted_answer = contexted_answer.replace('\n', '').replace('\t', '')
+        contexted_answer = re.sub(r' +', ' ', contexted_answer)
+        return contexted_answer.strip()
 
     def generate(self, query: str, context: []) -> str:
         """
@@ -27,13 +48,121 @@ class AnswerGenerator:
         Returns:\n\n
             A string with the answer
         """
-        context = "\n- ".join(context)
-        qa = f"The Question is the following: {query}.\nThe Context is the following:{context}."
-        llm_chain = LLMChain(prompt=self.prompt, llm=self.llm)
-        contexted_answer = llm_chain.run(qa)
-        contexted_answer = contexted_answer.replace('\n', '').replace('\t', '')
-        contexted_answer = re.sub(r' +', ' ', contexted_answer)
-        return contexted_answer.strip()
+        qa = AnswerGenerator.qa(query, context)
+        with Metrics.stage('generate'):
+            contexted_answer = self.llm_chain.run(qa)
+        self._count_tokens(self.prompt.format(qa=qa), contexted_answer)
+        return AnswerGenerator.clean(contexted_answer)
+
+    @staticmethod
+    def _count_tokens(prompt: str, completion: str):
+        LLM_TOKENS.labels('prompt').inc(Metrics.count_tokens(prompt))
+        LLM_TOKENS.labels('completion').inc(Metrics.count_tokens(completion))
+
+    def stream(self, query: str, context: []) -> Iterator[str]:
+        """
+        Same as `generate`, but yielding the answer token by token as the LLM produces it.
+        Args:\n\n
+            query: the query/question formulated by the user
+            context: an array of relevant results retrieved before with `retrieve`
+
+        Returns:\n\n
+            An iterator of strings, which joined give the answer
+        """
+        started = False
+        prompt = self.prompt.format(qa=AnswerGenerator.qa(query, context))
+        completion = []
+        start = time.perf_counter()
+        for chunk in self.llm.stream(prompt):
+            completion.append(chunk["choices"][0]["text"])
+            token = completion[-1].replace('\n', '').replace('\t', '')
+            if not started:
+                token = token.lstrip()
+                if token == "":
+                    continue
+                started = True
+            yield token
+        # Time to the last token, including the time the client took to read the previous ones
+        Metrics.observe('generate', time.perf_counter() - start)
+        self._count_tokens(prompt, "".join(completion))
+
+    def cached(self, query: str, context: [], generation: int) -> Optional[str]:
+        """
+        Looks for an answer previously generated for the same question and context or, if configured, for a very
+        similar question in the same ingest `generation`.
+        Args:\n\n
+            query: the query/question formulated by the user
+            context: an array of relevant results retrieved before with `retrieve`
+            generation: the current ingest generation of the index
+
+        Returns:\n\n
+            The cached answer, or None
+        """
+        if self.cache is None:
+            return None
+        answer = self.cache.get(AnswerCache.key(self.template, query, context))
+        if answer is None:
+            answer = self.cache.get_similar(self.template, generation, self._question_vector(query))
+        if answer is None:
+            self.cache.record_miss()
+        return answer
+
+    def remember(self, query: str, context: [], generation: int, answer: str):
+        """
+        Stores a generated answer in the cache, to be found by `cached`.
+        """
+        if self.cache is None:
+            return
+        self.cache.put(AnswerCache.key(self.template, query, context), self.template, generation,
+                       self._question_vector(query), answer)
+
+    def _question_vector(self, query: str) -> Optional[List[float]]:
+        if self.cache.similarity <= 0 or self.embeddings is None:
+            return None
+        return self.embeddings.embed_query(query)
+
+    def generate_cached(self, query: str, context: [], generation: int) -> (str, bool):
+        """
+        Same as `generate`, but reusing the answers found by `cached`.
+        Args:\n\n
+            query: the query/question formulated by the user
+            context: an array of relevant results retrieved before with `retrieve`
+            generation: the current ingest generation of the index
+
+        Returns:\n\n
+            A string with the answer and True if it was served from the cache
+        """
+        answer = self.cached(query, context, generation)
+        if answer is not None:
+            return answer, True
+        answer = self.generate(query, context)
+        self.remember(query, context, generation, answer)
+        return answer, False
+
+    def generate_batch(self, queries: List[str], contexts: List[list], generation: int) -> List[Tuple[str, bool]]:
+        """
+        Same as `generate_cached` for many questions, sending all the prompts which are not cached to the LLM in a
+        single batch.
+        Args:\n\n
+            queries: the queries/questions formulated by the user
+            contexts: for each query, an array of relevant results retrieved before with `retrieve`
+            generation: the current ingest generation of the index
+
+        Returns:\n\n
+            For each query, a string with the answer and True if it was served from the cache
+        """
+        answers = [(self.cached(q, c, generation), True) for q, c in zip(queries, contexts)]
+        missing = [i for i, (a, _) in enumerate(answers) if a is None]
+        if len(missing) > 0:
+            inputs = [{'qa': AnswerGenerator.qa(queries[i], contexts[i])} for i in missing]
+            with Metrics.stage('generate'):
+                outputs = self.llm_chain.apply(inputs)
+            for i, inp, output in zip(missing, inputs, outputs):
+                self._count_tokens(self.prompt.format(**inp), output[self.llm_chain.output_key])
+                answer = AnswerGenerator.clean(output[self.llm_chain.output_key])
+                self.remember(queries[i], contexts[i], generation, answer)
+                answers[i] = (answer, False)
+        return answers
 
     def generate_mock(self, query: str, context: []) -> str:
         """
@@ -0,0 +1,152 @@
+from typing import List, Optional, Tuple
+
+from langchain.schema import Document
+
+from constants.consts import CONTEXT_MAX_TOKENS, CONTEXT_MIN_OVERLAP, CONTEXT_DUPLICATE_SIMILARITY
+from modules.metrics.metrics import Metrics, CONTEXT_TOKENS
+
+
+class PackedContext:
+    """
+        Texts to send to the LLM as context, and how many chunks and tokens they were packed from.
+    """
+    def __init__(self, texts: List[str], retrieved_chunks: int, retrieved_tokens: int, tokens: int):
+        self.texts = texts
+        self.retrieved_chunks = retrieved_chunks
+        self.retrieved_tokens = retrieved_tokens
+        self.tokens = tokens
+
+    def stats(self) -> dict:
+        return {'retrieved_chunks': self.retrieved_chunks,
+                'chunks': len(self.texts),
+                'retrieved_tokens': self.retrieved_tokens,
+                'tokens': self.tokens,
+                'saved_tokens': self.retrieved_tokens - self.tokens}
+
+
+class ContextPacker:
+    """
+        Packs the relevant chunks of a query into the context for the LLM. Neighbouring chunks of the same page repeat
+        `chunk_overlap` characters of each other, so the ones overlapping are merged back into a single text. Then,
+        in order of relevance, texts which mostly repeat a more relevant one are dropped, and the rest are kept while
+        they fit in `max_tokens`.
+    """
+    def __init__(self, max_tokens: int = None, min_overlap: int = None, duplicate_similarity: float = None):
+        if max_tokens is None:
+            max_tokens = CONTEXT_MAX_TOKENS
+        if min_overlap is None:
+            min_overlap = CONTEXT_MIN_OVERLAP
+        if duplicate_similarity is None:
+            duplicate_similarity = CONTEXT_DUPLICATE_SIMILARITY
+
+        self.max_tokens = max_tokens
+        self.min_overlap = min_overlap
+        self.duplicate_similarity = duplicate_similarity
+
+    def pack(self, results: List[Tuple[Document, Optional[float]]]) -> PackedContext:
+        """
+        Args:\n\n
+            results: the relevant chunks retrieved, with their distance, most relevant first
+
+        Returns:\n\n
+            The packed context, most relevant text first
+        """
+        with Metrics.stage('pack'):
+            encoding = Metrics.encoding()
+            # (rank of the most relevant chunk in it, file and page, text)
+            groups = []
+            retrieved_tokens = 0
+            for rank, (r, _) in enumerate(results):
+                text = r.page_content.strip()
+                retrieved_tokens += len(ContextPacker._tokens(encoding, text))
+                groups.append((rank, (r.metadata.get('uploaded_filename'), r.metadata.get('page_number')), text))
+            retrieved_chunks = len(groups)
+            groups = self._merge(groups)
+
+            texts = []
+            kept_pairs = []
+            tokens = 0
+            for _, _, text in sorted(groups, key=lambda g: g[0]):
+                text_tokens = ContextPacker._tokens(encoding, text)
+                pairs = set(zip(text_tokens, text_tokens[1:]))
+                if any(ContextPacker._similarity(pairs, p) >= self.duplicate_similarity for p in kept_pairs):
+                    continue
+                if tokens + len(text_tokens) > self.max_tokens:
+                    if len(texts) > 0:
+                        # A less relevant, shorter text may still fit
+                        continue
+                    # The most relevant text is cut rather than sending no context at all
+                    text_tokens = text_tokens[:self.max_tokens]
+                    text = ContextPacker._detokenize(encoding, text_tokens)
+                texts.append(text)
+                kept_pairs.append(pairs)
+                tokens += len(text_tokens)
+
+        CONTEXT_TOKENS.labels('retrieved').inc(retrieved_tokens)
+        CONTEXT_TOKENS.labels('packed').inc(tokens)
+        return PackedContext(texts, retrieved_chunks, retrieved_tokens, tokens)
+
+    def _merge(self, groups: List[tuple]) -> List[tuple]:
+        # Merges are repeated until no texts overlap, as a chunk may join two texts merged before
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(groups)):
+                for j in range(i + 1, len(groups)):
+                    rank_i, key_i, text_i = groups[i]
+                    rank_j, key_j, text_j = groups[j]
+                    if key_i != key_j:
+                        continue
+                    text = self._join(text_i, text_j)
+                    if text is None:
+                        continue
+                    groups[i] = (min(rank_i, rank_j), key_i, text)
+                    del groups[j]
+                    merged = True
+                    break
+                if merged:
+                    break
+        return groups
+
+    def _join(self, a: str, b: str) -> Optional[str]:
+        """
+        Returns:\n\n
+            A single text with `a` and `b` if one contains the other or they overlap, else None
+        """
+        if b in a:
+            return a
+        if a in b:
+            return b
+        joined = self._join_overlapping(a, b)
+        return joined if joined is not None else self._join_overlapping(b, a)
+
+    def _join_overlapping(self, first: str, second: str) -> Optional[str]:
+        # `second` starts with the end of `first`
+        prefix = second[:self.min_overlap]
+        if len(prefix) < self.min_overlap:
+            return None
+        position = first.find(prefix)
+        while position != -1:
+            if second.startswith(first[position:]):
+                return first[:position] + second
+            position = first.find(prefix, position + 1)
+        return None
+
+    @staticmethod
+    def _tokens(encoding, text: str) -> list:
+        if encoding is None:
+            return text.split()
+        return encoding.encode(text, disallowed_special=())
+
+    @staticmethod
+    def _detokenize(encoding, tokens: list) -> str:
+        if encoding is None:
+            return " ".join(tokens)
+        return encoding.decode(tokens)
+
+    @staticmethod
+    def _similarity(a: set, b: set) -> float:
+        # Share of the pairs of consecutive tokens of the shorter text which are also in the other one
+        if len(a) == 0 or len(b) == 0:
+            return 0.0
+        return len(a & b) / min(len(a), len(b))
@@ -0,0 +1,45 @@
+import hashlib
+from typing import Iterable, Iterator, Tuple, Union
+
+from langchain.schema import Document
+
+
+class ContentHasher:
+    """
+        Content hashes used to recognize documents and chunks already indexed, so that re-uploads only embed what
+        changed.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def document_hash(content: Union[bytes, str]) -> str:
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def chunk_hash(chunk: Document) -> str:
+        # The page is part of the hash so that a chunk moving to another page gets its metadata updated
+        page = chunk.metadata.get('page_number', '')
+        return hashlib.sha256(f"{page}\x00{chunk.page_content}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def with_ids(filename: str, chunks: Iterable[Document]) -> Iterator[Tuple[str, Document]]:
+        """
+        Calculates deterministic ids for the chunks of a file: same file and same chunk content give the same id.
+        Args:\n\n
+            filename: the uploaded filename
+            chunks: the chunks of the file, in order
+
+        Returns:\n\n
+            An iterator of (id, chunk)
+        """
+        file_key = hashlib.sha256(filename.encode('utf-8')).hexdigest()[:16]
+        seen = {}
+        for c in chunks:
+            chunk_hash = ContentHasher.chunk_hash(c)
+            # Identical chunks repeated in the same file (headers, footers...) are told apart by their occurrence
+            occurrence = seen.get(chunk_hash, 0)
+            seen[chunk_hash] = occurrence + 1
+            yield f"{file_key}-{chunk_hash[:32]}-{occurrence}", c
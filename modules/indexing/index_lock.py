@@ -0,0 +1,70 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+class IndexLock:
+    """
+        Coordinates the processes sharing the index of a collection on disk with file locks. The writer flushes the
+        index with the lock held exclusively and then publishes a new version of it, and read replicas open the index
+        with the lock shared, so that they never see it half-written, and again whenever the version changes.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock_path = f"{path}.lock"
+        self.version_path = f"{path}.published"
+        self.writer_path = f"{path}.writer"
+        self.writer_file = None
+
+    @contextmanager
+    def _locked(self, operation: int):
+        # A new open file per acquisition: threads using the same one would share the lock instead of waiting
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def shared(self):
+        return self._locked(fcntl.LOCK_SH)
+
+    def exclusive(self):
+        return self._locked(fcntl.LOCK_EX)
+
+    def published(self) -> int:
+        try:
+            with open(self.version_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def publish(self) -> int:
+        """
+        Bumps the published version. To be called with the lock held exclusively, after flushing the index.
+        """
+        version = self.published() + 1
+        # Written to a temporary file and renamed, so that readers never see a half-written value
+        tmp_path = f"{self.version_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(version))
+        os.replace(tmp_path, self.version_path)
+        return version
+
+    def acquire_writer(self) -> bool:
+        """
+        Makes this process the only writer of the collection until it exits.
+
+        Returns:\n\n
+            False if another process is already writing to it
+        """
+        f = open(self.writer_path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self.writer_file = f
+        return True
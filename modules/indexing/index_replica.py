@@ -0,0 +1,66 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from constants.consts import PERSIST_DIR, REPLICA_POLL_INTERVAL, REPLICA_CLOSE_DELAY
+from modules.indexing.index_lock import IndexLock
+from modules.indexing.loaders.loader import Loader
+from modules.indexing.loaders.loader_factory import LoaderFactory
+
+
+class IndexReplica:
+    """
+        Read replica of the index of a collection written by another process (`ROLE=reader`). The index is opened
+        read-only with the `IndexLock` shared, and opened again in the background every time the writer publishes a
+        new version, so readers pick up new documents without restarting. Queries use the previous version until the
+        new one is open.
+    """
+    def __init__(self, collection: str, on_reload: Callable[[Loader], None]):
+        self.collection = collection
+        self.on_reload = on_reload
+        self.index_lock = IndexLock(f"{PERSIST_DIR}/{collection}")
+        self.loader: Optional[Loader] = None
+        self.version = None
+        self.stop_polling = threading.Event()
+        self.poller = None
+
+    def open(self) -> Loader:
+        """
+        Opens the version of the index published last.
+
+        Returns:\n\n
+            The read-only loader
+        """
+        with self.index_lock.shared():
+            version = self.index_lock.published()
+            loader = LoaderFactory.build(self.collection, read_only=True)
+        self.loader = loader
+        self.version = version
+        return loader
+
+    def start(self):
+        self.poller = threading.Thread(target=self._poll, name=f"{self.collection}-replica", daemon=True)
+        self.poller.start()
+
+    def stop(self):
+        self.stop_polling.set()
+        if self.poller is not None:
+            self.poller.join()
+
+    def _poll(self):
+        while not self.stop_polling.wait(REPLICA_POLL_INTERVAL):
+            try:
+                if self.index_lock.published() != self.version:
+                    self._reload()
+            except Exception:
+                logging.exception(f"Error reloading {self.collection}")
+
+    def _reload(self):
+        previous = self.loader
+        loader = self.open()
+        self.on_reload(loader)
+        logging.info(f"Reloaded version {self.version} of {self.collection}")
+        if previous is not None:
+            timer = threading.Timer(REPLICA_CLOSE_DELAY, previous.close)
+            timer.daemon = True
+            timer.start()
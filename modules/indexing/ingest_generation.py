@@ -0,0 +1,37 @@
+import os
+import threading
+
+
+class IngestGeneration:
+    """
+        Counter bumped every time the content of the index changes, persisted to disk so that caches depending on
+        the index content can tell whether they are stale, even across restarts.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.value = IngestGeneration.read(path)
+
+    @staticmethod
+    def read(path: str) -> int:
+        try:
+            with open(path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def current(self) -> int:
+        return self.value
+
+    def bump(self) -> int:
+        with self.lock:
+            self.value += 1
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            # Written to a temporary file and renamed, so that readers never see a half-written value
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(str(self.value))
+            os.replace(tmp_path, self.path)
+            return self.value
@@ -0,0 +1,131 @@
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Tuple, Set, Optional
+
+from langchain.schema import Document
+
+from modules.indexing.search_filter import SearchFilter
+from modules.nlp.lemmatizer import Lemmatizer
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+
+class LexicalIndex:
+    """
+        BM25 inverted index of the chunks, in SQLite next to the vector store. Chunks are tokenized as
+        `/lemmatize_stopwords` does (lemmas without stopwords), and updated incrementally as chunks are added and
+        removed, so keyword lookups (names, codes...) don't need embeddings.
+    """
+    def __init__(self, path: str, lemmatizer: Lemmatizer, language: str, k1: float = 1.2, b: float = 0.75):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lemmatizer = lemmatizer
+        self.language = language
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, filename TEXT, "
+                          "length INTEGER NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_filename ON chunks (filename)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id TEXT NOT NULL, "
+                          "tf INTEGER NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_term ON postings (term)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_id ON postings (id)")
+        self.conn.commit()
+        # Collection statistics of BM25, kept in memory instead of aggregating the table on every query
+        self.chunks, self.total_length = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) "
+                                                           "FROM chunks").fetchone()
+
+    def ids(self, filename: str) -> Set[str]:
+        with self.lock:
+            return {r[0] for r in self.conn.execute("SELECT id FROM chunks WHERE filename = ?", (filename,))}
+
+    def add(self, ids: List[str], documents: List[Document]):
+        # Tokenized before taking the lock, as it is the slow part
+        terms = [Counter(self.lemmatizer.terms(d.page_content, self.language)) for d in documents]
+        with self.lock:
+            self.delete(ids)
+            self.conn.executemany("INSERT INTO chunks (id, filename, length, document, metadata) VALUES "
+                                  "(?, ?, ?, ?, ?)",
+                                  [(chunk_id, d.metadata.get('uploaded_filename'), sum(t.values()), d.page_content,
+                                    json.dumps(d.metadata)) for chunk_id, d, t in zip(ids, documents, terms)])
+            self.conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                                  [(term, chunk_id, tf) for chunk_id, t in zip(ids, terms) for term, tf in t.items()])
+            self.chunks += len(ids)
+            self.total_length += sum(sum(t.values()) for t in terms)
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            for i in range(0, len(ids), SQLITE_MAX_PARAMS):
+                batch = ids[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ','.join('?' * len(batch))
+                removed, length = self.conn.execute(f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks "
+                                                    f"WHERE id IN ({placeholders})", batch).fetchone()
+                self.conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", batch)
+                self.conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+                self.chunks -= removed
+                self.total_length -= length
+
+    def search(self, query: str, items: int, search_filter: Optional[SearchFilter] = None) \
+            -> List[Tuple[Document, float]]:
+        """
+        Args:\n\n
+            query: the question
+            items: the number of results
+            search_filter: if not None, only the chunks matching it are scored
+
+        Returns:\n\n
+            The chunks with the highest BM25 score for the query, with their score, best first
+        """
+        terms = set(self.lemmatizer.terms(query, self.language))
+        if len(terms) == 0:
+            return []
+        search_filter = search_filter if search_filter is not None else SearchFilter()
+        condition, params = search_filter.sql('c.filename', 'c.metadata')
+        scores = Counter()
+        with self.lock:
+            if self.chunks == 0:
+                return []
+            avg_length = self.total_length / self.chunks
+            for term in terms:
+                df = self.conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if df == 0:
+                    continue
+                # The idf is the one of the whole collection, whatever the filter
+                idf = math.log(1 + (self.chunks - df + 0.5) / (df + 0.5))
+                postings = self.conn.execute(f"SELECT p.id, p.tf, c.length FROM postings p JOIN chunks c "
+                                             f"ON c.id = p.id WHERE p.term = ? AND {condition}",
+                                             [term] + params).fetchall()
+                for chunk_id, tf, length in postings:
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / \
+                        (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+            best = heapq.nlargest(items, scores.items(), key=lambda s: s[1])
+            documents = self._documents([chunk_id for chunk_id, _ in best])
+        return [(documents[chunk_id], score) for chunk_id, score in best if chunk_id in documents]
+
+    def _documents(self, ids: List[str]) -> dict:
+        found = {}
+        for i in range(0, len(ids), SQLITE_MAX_PARAMS):
+            batch = ids[i:i + SQLITE_MAX_PARAMS]
+            for chunk_id, document, metadata in self.conn.execute(f"SELECT id, document, metadata FROM chunks WHERE "
+                                                                  f"id IN ({','.join('?' * len(batch))})", batch):
+                found[chunk_id] = Document(page_content=document, metadata=json.loads(metadata))
+        return found
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
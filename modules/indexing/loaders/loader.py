@@ -0,0 +1,262 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Iterable, List, Tuple, Optional, Union
+
+from langchain.schema import Document
+
+from constants.consts import INGESTION_BATCH_SIZE, PERSIST_DIR, DEFAULT_ITEMS, LEMMA_CACHE_SIZE, LEXICAL_LANGUAGE, \
+    HYBRID_DEPTH, RRF_K, VECTOR, LEXICAL, HYBRID, PARAGRAPH
+from modules.indexing.content_hasher import ContentHasher
+from modules.indexing.ingest_generation import IngestGeneration
+from modules.indexing.lexical_index import LexicalIndex
+from modules.indexing.search_filter import SearchFilter
+from modules.indexing.loaders.memory_loader import MemoryLoader
+from modules.jobs.ingestion_queue import IngestionJob
+from modules.metrics.metrics import Metrics, PAGES, CHUNKS
+from modules.nlp.lemmatizer import Lemmatizer
+from modules.normalizers.whitespace_normalizer import WhitespaceNormalizer
+
+from modules.splitters.splitter import Splitter
+from vector_stores.vector_store import VectorStore
+
+
+class Loader:
+    """
+        Indexes uploaded files in a `VectorStore` and in a BM25 `LexicalIndex`, and queries them. Subclasses only
+        choose the store.
+    """
+    def __init__(self, collection, store: VectorStore):
+        self.collection = collection
+        self.store = store
+        self.lexical = LexicalIndex(f"{PERSIST_DIR}/{collection}.lexical.sqlite", Lemmatizer(LEMMA_CACHE_SIZE),
+                                    LEXICAL_LANGUAGE)
+        # Bumped every time chunks are added or removed, to invalidate the caches of query results
+        self.generation = IngestGeneration(f"{PERSIST_DIR}/{collection}.generation")
+        # Uploads of the same filename are diffed against the index one at a time
+        self.filename_locks = {}
+        self.filename_locks_lock = threading.Lock()
+
+    def show_collection_data(self):
+        pass
+
+    def index_pdf(self, pdf: Union[bytes, str], filename: str, separator: str = None, chunk_size: int = None,
+                  chunk_overlap: int = None, job: IngestionJob = None, doc_hash: str = None):
+        """
+        Indexes a PDF, given its content or the path of the file. In the latter case, `doc_hash` (as returned by
+        `ContentHasher.document_hash` of the content) is required.
+        """
+        docs = MemoryLoader.load_pdf(pdf, filename)
+        if doc_hash is None:
+            doc_hash = ContentHasher.document_hash(pdf)
+        self._index_documents(docs, filename, doc_hash, separator, chunk_size, chunk_overlap, job)
+
+    def index_text(self, text: str, filename: str, separator: str = None, chunk_size: int = None,
+                   chunk_overlap: int = None, job: IngestionJob = None):
+        docs = MemoryLoader.load_text(text, filename)
+        self._index_documents(docs, filename, ContentHasher.document_hash(text), separator, chunk_size,
+                              chunk_overlap, job)
+
+    def index_text_stream(self, pieces: Iterable[str], filename: str, doc_hash: str, separator: str = None,
+                          chunk_size: int = None, chunk_overlap: int = None, job: IngestionJob = None):
+        """
+        Same as `index_text` for a text which arrives in pieces, which are only read if the file changed.
+        """
+        docs = MemoryLoader.load_text_stream(pieces, filename, separator if separator is not None else PARAGRAPH)
+        self._index_documents(docs, filename, doc_hash, separator, chunk_size, chunk_overlap, job)
+
+    def _index_documents(self, docs: Iterable[Document], filename: str, doc_hash: str, separator: str = None,
+                         chunk_size: int = None, chunk_overlap: int = None, job: IngestionJob = None):
+        """
+        Splits the pages of a file and indexes only the chunks which are not already in the store, removing the
+        chunks of a previous version of the file which are gone. `docs` is only consumed if the file changed, and
+        chunks are embedded in batches of `INGESTION_BATCH_SIZE` while the next pages are still being extracted.
+        """
+        self._check_writable()
+        with self._filename_lock(filename):
+            existing = self.store.get_chunks(filename)
+            # Files indexed before the lexical index existed are added to it when uploaded again
+            lexical_ids = self.lexical.ids(filename)
+            if len(existing) > 0 and all(m.get('doc_hash') == doc_hash for m in existing.values()) and \
+                    all(i in lexical_ids for i in existing):
+                logging.info(f"{filename} is already indexed and didn't change")
+                # Its chunks may have been written by a previous upload which is not persisted yet
+                self._watch_persistence(job)
+                return
+
+            def pages():
+                for d in Metrics.timed_iter('extract', docs):
+                    with Metrics.stage('normalize'):
+                        d.page_content = WhitespaceNormalizer.normalize(d.page_content)
+                    d.metadata['uploaded_filename'] = filename
+                    PAGES.inc()
+                    if job is not None:
+                        job.add_pages(1)
+                    yield d
+
+            current_ids = set()
+            batch = []
+            lexical_batch = []
+            added = 0
+            backfilled = 0
+            chunks = Splitter(separator, chunk_size, chunk_overlap).split_iter(pages())
+            for chunk_id, c in ContentHasher.with_ids(filename, chunks):
+                current_ids.add(chunk_id)
+                if chunk_id in existing:
+                    if chunk_id not in lexical_ids:
+                        c.metadata.update(existing[chunk_id])
+                        lexical_batch.append((chunk_id, c))
+                        backfilled += 1
+                        if len(lexical_batch) >= INGESTION_BATCH_SIZE:
+                            self.lexical.add([i for i, _ in lexical_batch], [c for _, c in lexical_batch])
+                            lexical_batch = []
+                    continue
+                c.metadata['chunk_id'] = chunk_id
+                c.metadata['doc_hash'] = doc_hash
+                batch.append((chunk_id, c))
+                if len(batch) >= INGESTION_BATCH_SIZE:
+                    added += self._add_batch(batch, job)
+                    batch = []
+            added += self._add_batch(batch, job)
+            if len(lexical_batch) > 0:
+                self.lexical.add([i for i, _ in lexical_batch], [c for _, c in lexical_batch])
+
+            removed_ids = [i for i in existing if i not in current_ids]
+            if len(removed_ids) > 0:
+                with Metrics.stage('store_delete'):
+                    self.store.delete(removed_ids)
+                    self.lexical.delete(removed_ids)
+                CHUNKS.labels('removed').inc(len(removed_ids))
+            self.lexical.commit()
+            if added > 0 or len(removed_ids) > 0 or backfilled > 0:
+                self.generation.bump()
+            logging.info(f"{filename}: {added} chunks added, {len(removed_ids)} removed, "
+                         f"{len(current_ids) - added} unchanged")
+
+        self._watch_persistence(job)
+
+    def _watch_persistence(self, job: Optional[IngestionJob]):
+        if job is not None:
+            write = self.store.last_write()
+            job.watch_persistence(lambda: self.store.is_persisted(write))
+
+    def _add_batch(self, batch: List[Tuple[str, Document]], job: IngestionJob = None) -> int:
+        if len(batch) == 0:
+            return 0
+        # Includes embedding the chunks
+        with Metrics.stage('store_add'):
+            self.store.add_documents([c for _, c in batch], ids=[i for i, _ in batch])
+        with Metrics.stage('lexical_add'):
+            self.lexical.add([i for i, _ in batch], [c for _, c in batch])
+        CHUNKS.labels('added').inc(len(batch))
+        if job is not None:
+            job.add_chunks(len(batch))
+        return len(batch)
+
+    def delete_document(self, filename: str) -> int:
+        """
+        Removes all the chunks of an uploaded file from the index.
+        Args:\n\n
+            filename: the uploaded filename
+
+        Returns:\n\n
+            The number of chunks removed
+        """
+        self._check_writable()
+        with self._filename_lock(filename):
+            ids = list(self.store.get_chunks(filename).keys())
+            if len(ids) > 0:
+                with Metrics.stage('store_delete'):
+                    self.store.delete(ids)
+                self.generation.bump()
+                CHUNKS.labels('removed').inc(len(ids))
+            self.lexical.delete(ids)
+            self.lexical.commit()
+        return len(ids)
+
+    def _check_writable(self):
+        if self.store.read_only:
+            raise PermissionError(f"{self.collection} is a read replica. Send the changes to the writer process")
+
+    def _filename_lock(self, filename: str) -> threading.Lock:
+        with self.filename_locks_lock:
+            if filename not in self.filename_locks:
+                self.filename_locks[filename] = threading.Lock()
+            return self.filename_locks[filename]
+
+    def close(self):
+        self.store.close()
+        self.lexical.close()
+
+    def qa(self, query: str, items: int = None, mode: str = VECTOR, search_filter: Optional[SearchFilter] = None) \
+            -> List[Tuple[Document, Optional[float]]]:
+        """
+        Args:\n\n
+            query: the question
+            items: the number of results
+            mode: `vector`, `lexical` or `hybrid`
+            search_filter: if not None, only the chunks matching it are searched
+
+        Returns:\n\n
+            The chunks answering the query with their distance to it. Chunks found only by the lexical index have
+            None as distance.
+        """
+        items = items if items is not None else DEFAULT_ITEMS
+        if mode == LEXICAL:
+            # No embeddings needed
+            results = [(d, None) for d, _ in self._lexical_search(query, items, search_filter)]
+        elif mode == HYBRID:
+            depth = items * HYBRID_DEPTH
+            results = Loader.fuse(self._vector_search(query, depth, search_filter),
+                                  self._lexical_search(query, depth, search_filter), items)
+        else:
+            results = self._vector_search(query, items, search_filter)
+        CHUNKS.labels('retrieved').inc(len(results))
+        return results
+
+    def _vector_search(self, query: str, items: int, search_filter: Optional[SearchFilter]) \
+            -> List[Tuple[Document, float]]:
+        # Includes embedding the query
+        with Metrics.stage('vector_search'):
+            return self.store.similarity_search(query, items, search_filter)
+
+    def _lexical_search(self, query: str, items: int, search_filter: Optional[SearchFilter]) \
+            -> List[Tuple[Document, float]]:
+        with Metrics.stage('lexical_search'):
+            return self.lexical.search(query, items, search_filter)
+
+    def qa_batch(self, queries: List[str], items: int = None, mode: str = VECTOR,
+                 search_filter: Optional[SearchFilter] = None) -> List[List[Tuple[Document, Optional[float]]]]:
+        items = items if items is not None else DEFAULT_ITEMS
+        if mode == LEXICAL:
+            return [self.qa(q, items, LEXICAL, search_filter) for q in queries]
+        depth = items * HYBRID_DEPTH if mode == HYBRID else items
+        # A single embeddings request for all the queries
+        vectors = self.store.embeddings.embed_documents(queries)
+        with Metrics.stage('vector_search'):
+            results = self.store.similarity_search_by_vectors(vectors, depth, search_filter)
+        if mode == HYBRID:
+            results = [Loader.fuse(r, self._lexical_search(q, depth, search_filter), items)
+                       for q, r in zip(queries, results)]
+        CHUNKS.labels('retrieved').inc(sum(len(r) for r in results))
+        return results
+
+    @staticmethod
+    def fuse(vector_results: List[Tuple[Document, float]], lexical_results: List[Tuple[Document, float]],
+             items: int) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Reciprocal rank fusion of both rankings: every chunk scores 1 / (RRF_K + rank) in each ranking it appears.
+
+        Returns:\n\n
+            The best `items` chunks, with their vector distance or None if only the lexical index found them
+        """
+        scores = defaultdict(float)
+        found = {}
+        for ranking, with_distance in [(vector_results, True), (lexical_results, False)]:
+            for rank, (d, score) in enumerate(ranking):
+                key = d.metadata.get('chunk_id', d.page_content)
+                scores[key] += 1 / (RRF_K + rank + 1)
+                if key not in found or with_distance:
+                    found[key] = (d, score if with_distance else None)
+        best = sorted(scores, key=lambda k: scores[k], reverse=True)[:items]
+        return [found[k] for k in best]
@@ -0,0 +1,31 @@
+from constants.consts import VECTOR_STORE
+from modules.indexing.loaders.loader import Loader
+
+CHROMA = 'chroma'
+FAISS = 'faiss'
+NUMPY = 'numpy'
+
+
+class LoaderFactory:
+    """
+        Builds the loader of the vector store configured in `VECTOR_STORE`. Only the selected backend is imported.
+        A `read_only` loader is a replica of the index written by another process.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def build(collection: str, vector_store: str = None, read_only: bool = False) -> Loader:
+        if vector_store is None:
+            vector_store = VECTOR_STORE
+        vector_store = vector_store.lower()
+        if vector_store == CHROMA:
+            from modules.indexing.loaders.chroma_loader import ChromaLoader
+            return ChromaLoader(collection, read_only)
+        if vector_store == FAISS:
+            from modules.indexing.loaders.faiss_loader import FaissLoader
+            return FaissLoader(collection, read_only)
+        if vector_store == NUMPY:
+            from modules.indexing.loaders.numpy_loader import NumpyLoader
+            return NumpyLoader(collection, read_only)
+        raise ValueError(f"Unknown vector store `{vector_store}`. Use one of: {CHROMA}, {FAISS}, {NUMPY}")
@@ -0,0 +1,58 @@
+from typing import Iterable, Iterator, List, Union
+
+from langchain.schema import Document
+
+from constants.consts import TEXT_SEGMENT_SIZE
+from modules.pdf.page_extractor import PageExtractor
+
+
+class MemoryLoader:
+    """
+        Builds LangChain `Document`s straight from the uploaded content, without writing it to a temporary file
+        first. Produces the same metadata as `PyMuPDFLoader` and `TextLoader`.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def load_pdf(pdf: Union[bytes, str], filename: str) -> Iterator[Document]:
+        """
+        Yields one `Document` per page, in order, as the pages get extracted from the content of the PDF or the path
+        of the file.
+        """
+        total_pages, doc_metadata = PageExtractor.info(pdf)
+        for i, text in enumerate(PageExtractor.iter_pages(pdf, total_pages)):
+            metadata = {'source': filename,
+                        'file_path': filename,
+                        'page_number': i + 1,
+                        'total_pages': total_pages,
+                        **doc_metadata}
+            yield Document(page_content=text, metadata=metadata)
+
+    @staticmethod
+    def load_text(text: str, filename: str) -> List[Document]:
+        return [Document(page_content=text, metadata={'source': filename})]
+
+    @staticmethod
+    def load_text_stream(pieces: Iterable[str], filename: str, separator: str) -> Iterator[Document]:
+        """
+        Same as `load_text` for a text which arrives in pieces (e.g. as it is decoded). Yields `Document`s of about
+        `TEXT_SEGMENT_SIZE` characters cut at a `separator` (or else at a newline), so that a big text is split as it
+        is read instead of held whole in memory.
+        """
+        text = ""
+        for piece in pieces:
+            text += piece
+            while len(text) >= TEXT_SEGMENT_SIZE:
+                cut_separator = separator
+                cut = text.rfind(separator, 0, TEXT_SEGMENT_SIZE) if separator != "" else -1
+                if cut <= 0:
+                    cut_separator = "\n"
+                    cut = text.rfind(cut_separator, 0, TEXT_SEGMENT_SIZE)
+                if cut <= 0:
+                    cut_separator = ""
+                    cut = TEXT_SEGMENT_SIZE
+                yield Document(page_content=text[:cut], metadata={'source': filename})
+                text = text[cut + len(cut_separator):]
+        if text != "":
+            yield Document(page_content=text, metadata={'source': filename})
@@ -0,0 +1,12 @@
+import logging
+
+from modules.indexing.loaders.loader import Loader
+from vector_stores.numpy_store import NumpyVectorStore
+
+
+class NumpyLoader(Loader):
+    def __init__(self, collection, read_only: bool = False):
+        super().__init__(collection, NumpyVectorStore(collection, read_only))
+
+    def show_collection_data(self):
+        logging.debug(f"NUMBER OF CHUNKS IN STORAGE: {int(self.store.alive.sum())} ({self.store.rows} rows)")
@@ -1,25 +1,136 @@
-from langchain.chains.question_answering import load_qa_chain
-from langchain.chains.qa_with_sources import load_qa_with_sources_chain
-from langchain.llms import OpenAI
+import base64
+import json
+from typing import List, Optional, Tuple
 
 # from modules.indexing.loaders.faiss_loader import FaissLoader
-from modules.indexing.loaders.chroma_loader import ChromaLoader
+from constants.consts import DEFAULT_ITEMS
+from modules.indexing.loaders.loader import Loader, VECTOR
+from modules.indexing.query_cache import QueryCache
+from modules.indexing.search_filter import SearchFilter
 
 
 class Querier:
-    def __init__(self, loader: ChromaLoader):
+    def __init__(self, loader: Loader, cache: QueryCache = None):
         self.loader = loader
-        self.chain = load_qa_chain(llm=OpenAI())
-        self.sources_chain = load_qa_with_sources_chain(llm=OpenAI())
+        self.cache = cache
 
-    def retrieve(self, query: str, items: int = None) -> []:
+    def retrieve(self, query: str, items: int = None, mode: str = VECTOR, search_filter: SearchFilter = None) -> []:
         """
         Retrieves `items` number of answers from the vector store answering to the query.
         Args:
             query: the question
             items: the number of items
+            mode: `vector`, `lexical` or `hybrid`
+            search_filter: if not None, only the chunks matching it are searched
 
         Returns:
             A list of rows from the vector store answering to that query
         """
-        return self.loader.qa(query, items)
\ No newline at end of file
+        if self.cache is None or not self.cache.enabled():
+            return self.loader.qa(query, items, mode, search_filter)
+
+        key = QueryCache.key(query, items, mode, search_filter.key() if search_filter is not None else None)
+        generation = self.loader.generation.current()
+        results = self.cache.get(key, generation)
+        if results is None:
+            results = self.loader.qa(query, items, mode, search_filter)
+            self.cache.put(key, generation, results)
+        return results
+
+    def retrieve_page(self, query: str, items: int = None, mode: str = VECTOR, search_filter: SearchFilter = None,
+                      cursor: str = None) -> Tuple[list, Optional[str]]:
+        """
+        Same as `retrieve`, one page at a time. The cursor of a page holds its last result, and the next page starts
+        after it, so that pages don't shift when chunks are added or removed in between. Only as many results as the
+        page needs (and one more, to know if there is a next page) are searched.
+        Args:
+            query: the question
+            items: the number of items per page
+            mode: `vector`, `lexical` or `hybrid`
+            search_filter: if not None, only the chunks matching it are searched
+            cursor: None for the first page, or the cursor returned with the previous page
+
+        Returns:
+            The rows of the page, and the cursor of the next page (None if there are no more results)
+        """
+        items = items if items is not None else DEFAULT_ITEMS
+        after = Querier.decode_cursor(cursor) if cursor is not None else None
+        k = (after['seen'] if after is not None else 0) + items + 1
+        while True:
+            results = self.retrieve(query, k, mode, search_filter)
+            start = Querier._page_start(results, after)
+            # Beyond a full window there may be more results after the cursor
+            if len(results) < k or len(results) > start + items:
+                break
+            k *= 2
+        page = results[start:start + items]
+        if len(results) <= start + items or len(page) == 0:
+            return page, None
+        last, distance = page[-1]
+        return page, Querier.encode_cursor(start + items, last.metadata.get('chunk_id'), distance)
+
+    @staticmethod
+    def _page_start(results: list, after: Optional[dict]) -> int:
+        if after is None:
+            return 0
+        ids = [d.metadata.get('chunk_id') for d, _ in results]
+        if after['last'] is not None and after['last'] in ids:
+            return ids.index(after['last']) + 1
+        # The last result is gone: the page starts with the first result ranked after it
+        if after['distance'] is not None and all(distance is not None for _, distance in results):
+            key = (after['distance'], after['last'] or '')
+            return len([i for (_, distance), i in zip(results, ids) if (distance, i or '') <= key])
+        # Without distances (lexical results), by position
+        return min(after['seen'], len(results))
+
+    @staticmethod
+    def encode_cursor(seen: int, last: Optional[str], distance: Optional[float]) -> str:
+        """
+        Args:\n\n
+            seen: number of results in this page and the previous ones
+            last: id of the last chunk of this page
+            distance: distance of the last chunk of this page to the query, if known
+        """
+        cursor = {'seen': seen, 'last': last, 'distance': float(distance) if distance is not None else None}
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> dict:
+        try:
+            after = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            seen, last, distance = after['seen'], after['last'], after['distance']
+        except Exception:
+            raise ValueError(f"Invalid cursor `{cursor}`")
+        if not isinstance(seen, int) or seen < 0 or (last is not None and not isinstance(last, str)) or \
+                (distance is not None and not isinstance(distance, (int, float))):
+            raise ValueError(f"Invalid cursor `{cursor}`")
+        return after
+
+    def retrieve_batch(self, queries: List[str], items: List[Optional[int]], mode: str = VECTOR) -> []:
+        """
+        Same as `retrieve` for many queries at once, embedding all of them in a single request and scoring them
+        against the vector store in a single matrix operation.
+        Args:
+            queries: the questions
+            items: the number of items for each question (None for the default)
+            mode: `vector`, `lexical` or `hybrid`
+
+        Returns:
+            For each query, a list of rows from the vector store answering to that query
+        """
+        generation = self.loader.generation.current()
+        use_cache = self.cache is not None and self.cache.enabled()
+        results = [None] * len(queries)
+        if use_cache:
+            for i, (q, k) in enumerate(zip(queries, items)):
+                results[i] = self.cache.get(QueryCache.key(q, k, mode), generation)
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if len(missing) > 0:
+            max_items = max(items[i] if items[i] is not None else DEFAULT_ITEMS for i in missing)
+            batch = self.loader.qa_batch([queries[i] for i in missing], max_items, mode)
+            for i, rows in zip(missing, batch):
+                results[i] = rows[:items[i] if items[i] is not None else DEFAULT_ITEMS]
+                if use_cache:
+                    self.cache.put(QueryCache.key(queries[i], items[i], mode), generation, results[i])
+        return results
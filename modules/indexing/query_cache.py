@@ -0,0 +1,67 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class QueryCache:
+    """
+        In-process LRU cache with a time to live for the results of `Querier.retrieve`. Entries belong to an ingest
+        generation: when the generation changes, everything cached before is dropped.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    @staticmethod
+    def key(question: str, *args) -> tuple:
+        return (re.sub(r'\s+', ' ', question).strip().lower(),) + args
+
+    def get(self, key: tuple, generation: int) -> Optional[Any]:
+        with self.lock:
+            self._check_generation(generation)
+            entry = self.entries.get(key) if generation == self.generation else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, generation: int, value: Any):
+        with self.lock:
+            self._check_generation(generation)
+            if generation != self.generation:
+                # Computed before an ingest which has already been seen
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def _check_generation(self, generation: int):
+        if self.generation is None or generation > self.generation:
+            self.entries.clear()
+            self.generation = generation
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'enabled': self.enabled(),
+                'entries': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
@@ -0,0 +1,71 @@
+from typing import Optional, List, Tuple
+
+
+class SearchFilter:
+    """
+        Restricts a search to the chunks of a file, of an author and/or of a range of pages. Each store translates it
+        into its own query language, so that it is applied before scoring the chunks instead of after.
+    """
+    def __init__(self, filename: Optional[str] = None, author: Optional[str] = None, page_from: Optional[int] = None,
+                 page_to: Optional[int] = None):
+        self.filename = filename
+        self.author = author
+        self.page_from = page_from
+        self.page_to = page_to
+
+    def is_empty(self) -> bool:
+        return self.filename is None and self.author is None and self.page_from is None and self.page_to is None
+
+    def key(self) -> tuple:
+        return self.filename, self.author, self.page_from, self.page_to
+
+    def matches(self, metadata: dict) -> bool:
+        if self.filename is not None and metadata.get('uploaded_filename') != self.filename:
+            return False
+        if self.author is not None and metadata.get('author') != self.author:
+            return False
+        page = metadata.get('page_number')
+        if self.page_from is not None and (not isinstance(page, int) or page < self.page_from):
+            return False
+        if self.page_to is not None and (not isinstance(page, int) or page > self.page_to):
+            return False
+        return True
+
+    def chroma_where(self) -> Optional[dict]:
+        """
+        Returns:\n\n
+            The filter as a Chroma `where` clause, or None if it is empty
+        """
+        conditions = []
+        if self.filename is not None:
+            conditions.append({'uploaded_filename': self.filename})
+        if self.author is not None:
+            conditions.append({'author': self.author})
+        if self.page_from is not None:
+            conditions.append({'page_number': {'$gte': self.page_from}})
+        if self.page_to is not None:
+            conditions.append({'page_number': {'$lte': self.page_to}})
+        if len(conditions) == 0:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+    def sql(self, filename_column: str = 'filename', metadata_column: str = 'metadata') -> Tuple[str, List]:
+        """
+        Returns:\n\n
+            The filter as a SQLite condition over a table with the uploaded filename and the json metadata of the
+            chunks, and its parameters
+        """
+        conditions, params = ['1 = 1'], []
+        if self.filename is not None:
+            conditions.append(f"{filename_column} = ?")
+            params.append(self.filename)
+        if self.author is not None:
+            conditions.append(f"json_extract({metadata_column}, '$.author') = ?")
+            params.append(self.author)
+        if self.page_from is not None:
+            conditions.append(f"json_extract({metadata_column}, '$.page_number') >= ?")
+            params.append(self.page_from)
+        if self.page_to is not None:
+            conditions.append(f"json_extract({metadata_column}, '$.page_number') <= ?")
+            params.append(self.page_to)
+        return ' AND '.join(conditions), params
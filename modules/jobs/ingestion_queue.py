@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class IngestionJob:
+    """
+        A single upload waiting for (or going through) extraction, splitting, embedding and persistence.
+    """
+    def __init__(self, filename: str, task: Callable[['IngestionJob'], None]):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.task = task
+        self.status = PENDING
+        self.pages_extracted = 0
+        self.chunks_embedded = 0
+        self.persisted = False
+        self.persistence_check = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def add_pages(self, pages: int):
+        self.pages_extracted += pages
+
+    def add_chunks(self, chunks: int):
+        self.chunks_embedded += chunks
+
+    def watch_persistence(self, check: Callable[[], bool]):
+        """
+        Args:\n\n
+            check: returns True once the chunks of this job have been flushed to disk by the vector store
+        """
+        self.persistence_check = check
+
+    def is_persisted(self) -> bool:
+        if not self.persisted and self.persistence_check is not None and self.persistence_check():
+            self.persisted = True
+            self.persistence_check = None
+        return self.persisted
+
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {'job_id': self.id,
+                'filename': self.filename,
+                'status': self.status,
+                'pages_extracted': self.pages_extracted,
+                'chunks_embedded': self.chunks_embedded,
+                'persisted': self.is_persisted(),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at}
+
+
+class IngestionQueue:
+    """
+        Bounded queue of `IngestionJob` consumed by a pool of worker threads, so that uploads don't block the event
+        loop serving `/query`.
+    """
+    def __init__(self, workers: int, max_size: int, history: int):
+        self.workers = workers
+        self.history = history
+        self.queue = queue.Queue(maxsize=max_size)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.stopping = threading.Event()
+
+    def start(self):
+        self.stopping.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"ingestion-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def stop(self, timeout: float = None):
+        """
+        Lets the workers finish the jobs already queued and stops them.
+        Args:\n\n
+            timeout: max seconds to wait for each worker
+        """
+        # Called from the event loop, so it must not block on a full queue: the workers which don't get a sentinel
+        # exit once they find the queue empty
+        self.stopping.set()
+        for _ in self.threads:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break
+        for t in self.threads:
+            t.join(timeout)
+        self.threads = []
+
+    def submit(self, filename: str, task: Callable[[IngestionJob], None]) -> IngestionJob:
+        """
+        Queues a new ingestion task.
+        Args:\n\n
+            filename: the uploaded filename, for reporting
+            task: a callable receiving the `IngestionJob` to report progress to
+
+        Returns:\n\n
+            The `IngestionJob`. Raises `queue.Full` if there is no room for more jobs.
+        """
+        job = IngestionJob(filename, task)
+        with self.lock:
+            self.queue.put_nowait(job)
+            self.jobs[job.id] = job
+            self._trim()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def _trim(self):
+        # Only finished jobs are forgotten, oldest first
+        excess = len(self.jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self.jobs.values() if j.is_finished()][:excess]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            if job is None:
+                self.queue.task_done()
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            try:
+                job.task(job)
+                job.status = DONE
+            except Exception as e:
+                logging.exception(f"Ingestion of {job.filename} failed")
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.task = None
+                job.finished_at = time.time()
+                self.queue.task_done()
@@ -0,0 +1,125 @@
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Seconds, from a fraction of a millisecond (normalizing a page) to minutes (extracting a big PDF)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram('documentqa_stage_seconds', "Time spent in each stage of ingestion and query", ['stage'],
+                          buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram('documentqa_request_seconds', "Time to answer each endpoint", ['path', 'status'],
+                            buckets=STAGE_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('documentqa_requests_in_flight', "Requests being processed")
+INGESTION_QUEUE_DEPTH = Gauge('documentqa_ingestion_queue_depth', "Ingestion jobs waiting for a worker")
+UPLOAD_BYTES_IN_FLIGHT = Gauge('documentqa_upload_bytes_in_flight', "Bytes of the uploads received and not indexed yet")
+UPLOADED_BYTES = Counter('documentqa_uploaded_bytes', "Bytes of the files uploaded")
+PAGES = Counter('documentqa_pages', "Pages extracted from the uploaded files")
+CHUNKS = Counter('documentqa_chunks', "Chunks added to, removed from or retrieved from the index", ['operation'])
+EMBEDDED_TEXTS = Counter('documentqa_embedded_texts', "Texts sent to the embeddings provider", ['kind'])
+EMBEDDING_BATCH_SIZE = Histogram('documentqa_embedding_batch_size', "Texts sent to the embeddings provider per call",
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048))
+EMBEDDING_RETRIES = Counter('documentqa_embedding_retries', "Calls to the embeddings provider retried after being "
+                                                            "rate-limited")
+CONTEXT_TOKENS = Counter('documentqa_context_tokens', "Tokens of the relevant chunks retrieved, and of the context "
+                                                      "packed from them for the LLM", ['kind'])
+LLM_TOKENS = Counter('documentqa_llm_tokens', "Tokens sent to and generated by the LLM", ['kind'])
+
+# Per-request breakdown of the time spent in each stage, only collected when a request asks for it
+_timings: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('timings', default=None)
+
+_encoding = None
+
+
+class Metrics:
+    """
+        Prometheus metrics of the pipeline. Timing a stage costs a couple of `perf_counter` calls and a histogram
+        update, so it can be used on every page and chunk.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    @contextmanager
+    def stage(name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.observe(name, time.perf_counter() - start)
+
+    @staticmethod
+    def observe(name: str, seconds: float):
+        STAGE_SECONDS.labels(name).observe(seconds)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0) + seconds
+
+    @staticmethod
+    def timed_iter(name: str, iterable: Iterable) -> Iterator:
+        """
+        Yields the items of `iterable`, timing how long each of them takes to be produced. Meant for lazy stages,
+        as the pages of a PDF being extracted.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            Metrics.observe(name, time.perf_counter() - start)
+            yield item
+
+    @staticmethod
+    def start_timings() -> dict:
+        """
+        Starts collecting the time spent in each stage by the current request. Blocking calls must run in a copy of
+        the context (see `in_context`) for their stages to be collected.
+
+        Returns:\n\n
+            The dictionary with the seconds per stage, filled in as the request goes on
+        """
+        timings = {}
+        _timings.set(timings)
+        return timings
+
+    @staticmethod
+    def in_context(func: Callable) -> Callable:
+        """
+        Binds `func` to a copy of the current context, so that it can be run in another thread.
+        """
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+    @staticmethod
+    def encoding():
+        """
+        Returns:\n\n
+            The `tiktoken` encoding of the OpenAI completion models, or None if it can't be loaded (it is downloaded
+            the first time)
+        """
+        global _encoding
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding('p50k_base')
+            except Exception as e:
+                logging.warning(f"Counting tokens approximately, as the encoding could not be loaded: {e}")
+                _encoding = False
+        return _encoding if _encoding is not False else None
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """
+        Returns:\n\n
+            The number of tokens of the text for the OpenAI completion models, or an estimate of 4 characters per
+            token if the encoding can't be loaded
+        """
+        encoding = Metrics.encoding()
+        if encoding is None:
+            return len(text) // 4
+        return len(encoding.encode(text, disallowed_special=()))
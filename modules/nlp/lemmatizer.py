@@ -0,0 +1,83 @@
+import threading
+from functools import lru_cache
+from typing import List, FrozenSet, Dict
+
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+
+
+class Lemmatizer:
+    """
+        Lemmatizes texts with a single WordNet lemmatizer shared by all the requests. The stopwords of each language
+        are loaded once as a frozenset, and the lemmas of the tokens already seen are memoized in a bounded LRU.
+    """
+    def __init__(self, memo_size: int):
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemma = lru_cache(maxsize=memo_size)(self.lemmatizer.lemmatize)
+        self.stopwords: Dict[str, FrozenSet[str]] = {}
+        self.lock = threading.Lock()
+
+    def warmup(self):
+        """
+        WordNet is loaded lazily on the first lemma, and that load is not safe if several threads trigger it at once.
+        """
+        self.lemmatizer.lemmatize('warmup')
+
+    def _stopwords(self, lan: str) -> FrozenSet[str]:
+        words = self.stopwords.get(lan)
+        if words is None:
+            with self.lock:
+                words = self.stopwords.get(lan)
+                if words is None:
+                    words = frozenset(stopwords.words(lan))
+                    self.stopwords[lan] = words
+        return words
+
+    def lemmas(self, text: str, lan: str) -> List[str]:
+        return [self.lemma(token.lower()) for token in word_tokenize(text, language=lan)]
+
+    def lemmatize(self, text: str, lan: str) -> str:
+        """
+        Args:\n\n
+            text: the text to lemmatize
+            lan: the language of the text, as NLTK names it (`english`, `spanish`...)
+
+        Returns:\n\n
+            The lowercased lemmas of the text, separated by spaces
+        """
+        return " ".join(self.lemmas(text, lan))
+
+    def lemmatize_stopwords(self, text: str, lan: str) -> str:
+        """
+        Args:\n\n
+            text: the text to lemmatize
+            lan: the language of the text, as NLTK names it (`english`, `spanish`...)
+
+        Returns:\n\n
+            The lowercased lemmas of the text which are not stopwords, separated by spaces
+        """
+        words = self._stopwords(lan)
+        return " ".join([lemma for lemma in self.lemmas(text, lan) if lemma not in words])
+
+    def terms(self, text: str, lan: str) -> List[str]:
+        """
+        Args:\n\n
+            text: the text to tokenize
+            lan: the language of the text, as NLTK names it (`english`, `spanish`...)
+
+        Returns:\n\n
+            The lemmas of the text which are not stopwords nor punctuation, in order and with repetitions, as indexed
+            for lexical search
+        """
+        words = self._stopwords(lan)
+        return [lemma for lemma in self.lemmas(text, lan) if lemma not in words and any(c.isalnum() for c in lemma)]
+
+    def lemmatize_batch(self, texts: List[str], lan: str, remove_stopwords: bool) -> List[str]:
+        if remove_stopwords:
+            return [self.lemmatize_stopwords(text, lan) for text in texts]
+        return [self.lemmatize(text, lan) for text in texts]
+
+    def stats(self) -> dict:
+        info = self.lemma.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
@@ -0,0 +1,26 @@
+import logging
+
+# Packages used by the lemmatizer and the lexical index, with the path where NLTK finds them once downloaded
+NLTK_PACKAGES = {'stopwords': 'corpora/stopwords',
+                 'punkt': 'tokenizers/punkt',
+                 'wordnet': 'corpora/wordnet'}
+
+
+class NltkResources:
+    """
+        Makes sure the NLTK data is on disk. `nltk.download` fetches the index of packages from GitHub even when the
+        data is already there, so it is only called for the packages which are missing.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def ensure():
+        import nltk
+
+        for package, path in NLTK_PACKAGES.items():
+            try:
+                nltk.data.find(path)
+            except LookupError:
+                logging.info(f"Downloading NLTK {package}...")
+                nltk.download(package, quiet=True)
@@ -1,7 +1,10 @@
-from typing import IO
+from io import BytesIO
+from typing import IO, Iterator, Union
 import re
 from pypdf import PdfReader
 
+from modules.pdf.page_extractor import PageExtractor, PYPDF
+
 
 class PDFExtractor:
     """
@@ -18,9 +21,13 @@ class PDFExtractor:
 
     @staticmethod
     def extract(file: IO) -> str:
-        reader = PdfReader(file)
-        text = []
-        for i, page in enumerate(reader.pages):
-            page_text = PDFExtractor.normalize_spaces(page.extract_text())
-            text.append(page_text)
-        return "".join(text)
+        return "".join(PDFExtractor.iter_text(file.read()))
+
+    @staticmethod
+    def iter_text(pdf: Union[bytes, str]) -> Iterator[str]:
+        """
+        Same as `extract`, yielding the text page by page from the content of the PDF or the path of the file.
+        """
+        total_pages = len(PdfReader(pdf if isinstance(pdf, str) else BytesIO(pdf)).pages)
+        for page_text in PageExtractor.iter_pages(pdf, total_pages, backend=PYPDF):
+            yield PDFExtractor.normalize_spaces(page_text)
@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from io import BytesIO
+from typing import Iterator, List, Union
+
+import fitz
+from pypdf import PdfReader
+
+from constants.consts import PDF_EXTRACTION_WORKERS, PDF_EXTRACTION_BATCH_SIZE, TMP_DIR
+
+PYMUPDF = 'pymupdf'
+PYPDF = 'pypdf'
+
+# Processes extracting pages, shared by every PDF and started the first time one needs them
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _open(pdf: Union[bytes, str]):
+    # From a path, pages are read from disk as needed instead of loading the whole file
+    return fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")
+
+
+def _pymupdf_pages(pdf: Union[bytes, str], start: int, end: int) -> List[str]:
+    with _open(pdf) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+
+def _pypdf_pages(pdf: Union[bytes, str], start: int, end: int) -> List[str]:
+    reader = PdfReader(pdf if isinstance(pdf, str) else BytesIO(pdf))
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+_BACKENDS = {PYMUPDF: _pymupdf_pages, PYPDF: _pypdf_pages}
+
+
+def _extract_batch(backend: str, pdf: Union[bytes, str], start: int, end: int) -> List[str]:
+    return _BACKENDS[backend](pdf, start, end)
+
+
+class PageExtractor:
+    """
+        Extracts the text of the pages of a PDF splitting page ranges across a pool of processes. Pages are yielded
+        in order as soon as their batch is ready, so that the next steps can start before the whole PDF is done.
+        The PDF is either its content or the path of a file with it. The processes are only handed paths: content is
+        written once to a temporary file in `TMP_DIR` instead of being sent again with every batch. The processes are started once, with `spawn` (forking a process with threads running can leave it with locks
+        held forever), and reused for every PDF until `shutdown`.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def pool() -> ProcessPoolExecutor:
+        global _pool
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            return _pool
+
+    @staticmethod
+    def shutdown():
+        """
+        Stops the processes, if they were started. The next PDF which needs them starts them again.
+        """
+        global _pool
+        with _pool_lock:
+            pool, _pool = _pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def info(pdf: Union[bytes, str]) -> (int, dict):
+        """
+        Returns:\n\n
+            The number of pages of the PDF and its metadata (title, author...)
+        """
+        with _open(pdf) as doc:
+            metadata = {k: v for k, v in doc.metadata.items() if type(v) in [str, int]}
+            return len(doc), metadata
+
+    @staticmethod
+    def iter_pages(pdf: Union[bytes, str], total_pages: int, backend: str = PYMUPDF, workers: int = None,
+                   batch_size: int = None) -> Iterator[str]:
+        """
+        Yields the text of every page of the PDF, in order.
+        Args:\n\n
+            pdf: the content of the PDF, or the path of the file
+            total_pages: number of pages of the PDF, as returned by `info`
+            backend: `pymupdf` or `pypdf`
+            workers: number of processes used at a time, up to `PDF_EXTRACTION_WORKERS` (the default)
+            batch_size: number of pages extracted by a process at a time. By default, `PDF_EXTRACTION_BATCH_SIZE`
+        """
+        if workers is None:
+            workers = PDF_EXTRACTION_WORKERS
+        if batch_size is None:
+            batch_size = PDF_EXTRACTION_BATCH_SIZE
+
+        # Starting processes is not worth it for small documents
+        if workers <= 1 or total_pages <= batch_size:
+            for i in range(0, total_pages, batch_size):
+                yield from _BACKENDS[backend](pdf, i, min(i + batch_size, total_pages))
+            return
+
+        ranges = deque((i, min(i + batch_size, total_pages)) for i in range(0, total_pages, batch_size))
+        pool = PageExtractor.pool()
+        path = None
+        if not isinstance(pdf, str):
+            os.makedirs(TMP_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix='pdf-', suffix='.pdf', dir=TMP_DIR)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf)
+            pdf = path
+        # Only a few batches ahead of the consumer are kept in memory
+        pending = deque()
+        try:
+            while len(ranges) > 0 or len(pending) > 0:
+                while len(ranges) > 0 and len(pending) < workers * 2:
+                    start, end = ranges.popleft()
+                    pending.append(pool.submit(_extract_batch, backend, pdf, start, end))
+                yield from pending.popleft().result()
+        finally:
+            # The pool outlives this PDF: batches nobody is going to read are not extracted
+            for future in pending:
+                future.cancel()
+            if path is not None:
+                # Batches already handed to a process can't be cancelled, and still read the file
+                wait([f for f in pending if not f.cancelled()])
+                os.remove(path)
@@ -1,14 +1,19 @@
 import logging
-import random
-from typing import List
+from collections import deque
+from typing import Iterable, Iterator, List, Tuple
 
 from langchain.schema import Document
-from langchain.text_splitter import CharacterTextSplitter
 
 from constants.consts import CHUNK_OVERLAP, CHUNK_SIZE, PARAGRAPH, AVG_SIZE_OF_PARAGRAPH, NEWLINE
+from modules.metrics.metrics import Metrics
 
 
 class Splitter:
+    """
+        Splits documents in chunks of `chunk_size` characters with `chunk_overlap` characters of context, in the same
+        way as LangChain's `CharacterTextSplitter`, but lazily and in a single pass: chunks are yielded document by
+        document as they are built.
+    """
     def __init__(self, separator=None, chunk_size=None, chunk_overlap=None):
         if separator is None:
             separator = PARAGRAPH
@@ -17,37 +22,85 @@ class Splitter:
         if chunk_overlap is None:
             chunk_overlap = CHUNK_OVERLAP
 
-        self.original_separator = separator
         self.separator = separator
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
-
-        self.splitter = CharacterTextSplitter(
-            separator=self.separator,
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-        )
-
-    def split(self, docs: List[Document]):
-        docs = self.splitter.split_documents(docs)
-
-        # I get random 5 splits and check the length. If the splits are too big, it means I need lower granularity.
-        random_docs = random.sample(docs, k=min(len(docs), 5))
-        for rd in random_docs:
-            if len(rd.page_content) > AVG_SIZE_OF_PARAGRAPH:
-                logging.warning("Splitter returned very big chunks. Replacing by newlines.")
-                self.original_separator = self.separator
-                self.separator = NEWLINE
-                self.splitter = CharacterTextSplitter(
-                    separator=self.separator,
-                    chunk_size=self.chunk_size,
-                    chunk_overlap=self.chunk_overlap,
-                    length_function=len,
-                )
-
-                docs = self.splitter.split_documents(docs)
-                break
-
-        return docs
+        self.chunk_size = int(chunk_size)
+        self.chunk_overlap = int(chunk_overlap)
 
+    def split(self, docs: Iterable[Document]) -> List[Document]:
+        return list(self.split_iter(docs))
+
+    def split_iter(self, docs: Iterable[Document]) -> Iterator[Document]:
+        for d in docs:
+            for text in Metrics.timed_iter('split', self.split_text(d.page_content)):
+                yield Document(page_content=text, metadata=dict(d.metadata))
+
+    def split_text(self, text: str) -> Iterator[str]:
+        return self._merge(self._pieces(text))
+
+    @staticmethod
+    def _iter_split(text: str, separator: str) -> Iterator[str]:
+        if separator == "":
+            yield from text
+            return
+        start = 0
+        while True:
+            end = text.find(separator, start)
+            if end == -1:
+                yield text[start:]
+                return
+            yield text[start:end]
+            start = end + len(separator)
+
+    def _pieces(self, text: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the pieces of the text between separators, together with the separator preceding them.
+        If a piece is bigger than a paragraph is expected to be, the separator is not frequent enough in this
+        document (e.g. '\\n\\n' in a PDF with single newlines), so that piece is split again by newlines.
+        """
+        warned = False
+        for piece in Splitter._iter_split(text, self.separator):
+            if len(piece) <= int(AVG_SIZE_OF_PARAGRAPH) or self.separator == NEWLINE:
+                yield piece, self.separator
+                continue
+            if not warned:
+                logging.debug("Splitter found very big pieces. Splitting them by newlines.")
+                warned = True
+            separator = self.separator
+            for sub_piece in Splitter._iter_split(piece, NEWLINE):
+                yield sub_piece, separator
+                separator = NEWLINE
+
+    def _merge(self, pieces: Iterable[Tuple[str, str]]) -> Iterator[str]:
+        # `current` holds the (piece, preceding separator) of the chunk being built. The separator of the first piece
+        # of a chunk is not part of it.
+        current = deque()
+        total = 0
+        for piece, separator in pieces:
+            separator_len = len(separator) if len(current) > 0 else 0
+            if total + len(piece) + separator_len > self.chunk_size:
+                if total > self.chunk_size:
+                    logging.warning(f"Created a chunk of size {total}, which is longer than the specified "
+                                    f"{self.chunk_size}")
+                if len(current) > 0:
+                    chunk = Splitter._join(current)
+                    if chunk is not None:
+                        yield chunk
+                    # Keeps the tail of the chunk as overlap for the next one
+                    while total > self.chunk_overlap or \
+                            (total + len(piece) + (len(separator) if len(current) > 0 else 0) > self.chunk_size
+                             and total > 0):
+                        first, _ = current.popleft()
+                        total -= len(first) + (len(current[0][1]) if len(current) > 0 else 0)
+            total += len(piece) + (len(separator) if len(current) > 0 else 0)
+            current.append((piece, separator))
+        chunk = Splitter._join(current)
+        if chunk is not None:
+            yield chunk
+
+    @staticmethod
+    def _join(pieces: deque) -> str:
+        if len(pieces) == 0:
+            return None
+        text = pieces[0][0] + "".join(separator + piece for piece, separator in list(pieces)[1:])
+        text = text.strip()
+        return text if text != "" else None
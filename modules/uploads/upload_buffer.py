@@ -0,0 +1,111 @@
+import asyncio
+import codecs
+import hashlib
+import os
+import queue
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from typing import Iterator, Union
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from constants.consts import TMP_DIR, UPLOAD_CHUNK_BYTES, UPLOAD_SPOOL_BYTES, UPLOAD_MAX_BYTES, UPLOAD_WAIT
+from modules.uploads.upload_limiter import UploadLimiter
+
+# Seconds between checks for room in the limiter while an upload waits
+UPLOAD_WAIT_POLL = 0.05
+
+
+class UploadBuffer:
+    """
+        Content of an uploaded file, in the file Starlette spooled it to while parsing the request: in memory up to
+        `UPLOAD_SPOOL_BYTES` and in a temporary file beyond that. The buffer takes that file over instead of copying
+        it, and reads it in chunks of `UPLOAD_CHUNK_BYTES`, so the whole file is never held in memory. Its bytes count
+        towards the `UploadLimiter` until it is closed.
+    """
+    def __init__(self, limiter: UploadLimiter):
+        self.limiter = limiter
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.reserved = 0
+        self.sha256 = hashlib.sha256()
+
+    async def receive(self, upload: UploadFile):
+        """
+        Takes over the file of the upload and hashes it. Raises `ValueError` if it is bigger than `UPLOAD_MAX_BYTES`,
+        and `queue.Full` if there is no room for it in the limiter after waiting `UPLOAD_WAIT` seconds.
+        """
+        # The upload is indexed in the background, so its file must outlive the request
+        self.file, upload.file = upload.file, BytesIO()
+        self.size = self.file.seek(0, os.SEEK_END)
+        if self.size > UPLOAD_MAX_BYTES:
+            raise ValueError(f"{upload.filename} is bigger than the limit of {UPLOAD_MAX_BYTES} bytes")
+        deadline = time.monotonic() + UPLOAD_WAIT
+        while not self.limiter.try_acquire(self.size):
+            if time.monotonic() > deadline:
+                raise queue.Full()
+            await asyncio.sleep(UPLOAD_WAIT_POLL)
+        self.reserved = self.size
+        await run_in_threadpool(self._hash)
+
+    def _hash(self):
+        for chunk in self._chunks():
+            self.sha256.update(chunk)
+
+    def _chunks(self) -> Iterator[bytes]:
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(UPLOAD_CHUNK_BYTES)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def digest(self) -> str:
+        """
+        Returns:\n\n
+            The same hash as `ContentHasher.document_hash` of the content
+        """
+        return self.sha256.hexdigest()
+
+    def source(self) -> Union[bytes, str]:
+        """
+        Returns:\n\n
+            The content if it fits in `UPLOAD_SPOOL_BYTES`, or else the path of a file with it. The file spooled by
+            Starlette has no name, so bigger contents are copied to `TMP_DIR` the first time.
+        """
+        if self.size <= UPLOAD_SPOOL_BYTES:
+            self.file.seek(0)
+            return self.file.read()
+        if self.path is None:
+            os.makedirs(TMP_DIR, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(prefix='upload-', dir=TMP_DIR)
+            with os.fdopen(fd, 'wb') as f:
+                self.file.seek(0)
+                shutil.copyfileobj(self.file, f, UPLOAD_CHUNK_BYTES)
+        return self.path
+
+    def iter_text(self, encoding: str = 'utf-8') -> Iterator[str]:
+        """
+        Decodes the content chunk by chunk.
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+        for chunk in self._chunks():
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+
+    def close(self):
+        """
+        Closes the file, removes its copy in `TMP_DIR`, if any, and releases the bytes reserved in the limiter.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+        self.limiter.release(self.reserved)
+        self.reserved = 0
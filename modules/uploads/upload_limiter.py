@@ -0,0 +1,32 @@
+import threading
+
+
+class UploadLimiter:
+    """
+        Bounds the bytes of all the uploads held at once, from the moment they are received until they are indexed,
+        so that many concurrent big uploads can't exhaust the memory or the disk. The size of an upload is reserved
+        once its request has been parsed, and released when the upload is done with.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, size: int) -> bool:
+        """
+        Returns:\n\n
+            True if `size` bytes more fit in the limit, reserving them
+        """
+        with self.lock:
+            # A file bigger than the limit is accepted when it's the only one, or it would never be
+            if self.max_bytes > 0 and self.in_flight > 0 and self.in_flight + size > self.max_bytes:
+                return False
+            self.in_flight += size
+            return True
+
+    def release(self, size: int):
+        with self.lock:
+            self.in_flight -= size
+
+    def bytes_in_flight(self) -> int:
+        return self.in_flight
@@ -0,0 +1,89 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+# The settings are read when `constants.consts` is imported, so they are set before any module of the app is
+WORKDIR = tempfile.mkdtemp(prefix='documentqa-tests-')
+os.environ.update({'EMBEDDINGS_PROVIDER': 'hashing',
+                   'VECTOR_STORE': os.environ.get('VECTOR_STORE', 'numpy'),
+                   'PERSIST_DIR': f"{WORKDIR}/indexes",
+                   'CACHE_DIR': f"{WORKDIR}/cache/",
+                   'TMP_DIR': f"{WORKDIR}/tmp/",
+                   'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'test'),
+                   'KEYRING_SECRET_KEY': os.environ.get('KEYRING_SECRET_KEY', 'test'),
+                   'LOG_LEVEL': 'WARNING'})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def client():
+    """
+    The app with its services loaded, and an index in a temporary directory.
+    """
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        while not main.services_ready.is_set():
+            assert main.services_error is None, main.services_error
+            time.sleep(0.05)
+        yield test_client
+
+
+@pytest.fixture(scope='session')
+def indexed(client):
+    """
+    Indexes `orchard.txt` and `cellar.txt`, and waits for their ingestion jobs to finish.
+    """
+    files = {'orchard.txt': "\n".join(f"The orchard harvest of apples number {i} happens in autumn." for i in range(30)),
+             'cellar.txt': "\n".join(f"The cellar keeps the cider barrel number {i} cool." for i in range(30))}
+    for filename, text in files.items():
+        response = client.post('/process_text', files={'file': (filename, text.encode('utf-8'), 'text/plain')},
+                               data={'separator': '\n'}).json()
+        assert response['code'] == 0, response
+        job_id = response['result']['job_id']
+        while True:
+            job = client.get(f"/jobs/{job_id}").json()['result']
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        assert job['status'] == 'done', job['error']
+    return files
+
+
+STORES = ['chroma', 'faiss', 'numpy']
+
+
+def build_store(vector_store: str, collection: str, read_only: bool = False):
+    if vector_store == 'chroma':
+        from vector_stores.chroma_store import ChromaVectorStore
+        return ChromaVectorStore(collection, read_only)
+    if vector_store == 'faiss':
+        from vector_stores.faiss_store import FaissVectorStore
+        return FaissVectorStore(collection, read_only)
+    from vector_stores.numpy_store import NumpyVectorStore
+    return NumpyVectorStore(collection, read_only)
+
+
+@pytest.fixture(params=STORES)
+def store(request):
+    """
+    An empty store of each backend, in a collection of its own.
+    """
+    vector_store = build_store(request.param, f"{request.param}_{request.node.name}".replace('[', '_').strip(']'))
+    yield vector_store
+    vector_store.close()
+
+
+def chunk(text: str, filename: str, page_number: int, author: str = 'Alice'):
+    from langchain.schema import Document
+    return Document(page_content=text, metadata={'uploaded_filename': filename, 'page_number': page_number,
+                                                 'author': author})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from langchain import LLMChain
+
+from modules.generators.answer_cache import AnswerCache
+from modules.generators.answer_generator import AnswerGenerator
+
+TEMPLATE = "Answer {qa}"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(str(tmp_path / 'answers.sqlite'), 3, similarity=0.9)
+
+
+def test_key_depends_on_question_and_ordered_context():
+    key = AnswerCache.key(TEMPLATE, "When are apples  harvested?", ["a", "b"])
+    assert key == AnswerCache.key(TEMPLATE, " when are apples harvested? ", ["a", "b"])
+    assert key != AnswerCache.key(TEMPLATE, "When are apples harvested?", ["b", "a"])
+    assert key != AnswerCache.key("Other {qa}", "When are apples harvested?", ["a", "b"])
+
+
+def test_exact_and_similar_hits(cache):
+    key = AnswerCache.key(TEMPLATE, "When are apples harvested?", ["a"])
+    assert cache.get(key) is None
+    cache.record_miss()
+    cache.put(key, TEMPLATE, 1, [1.0, 0.0], "In autumn.")
+
+    assert cache.get(key) == "In autumn."
+    assert cache.get_similar(TEMPLATE, 1, [0.99, 0.05]) == "In autumn."
+    # Not similar enough, from another generation of the index, or for another template
+    assert cache.get_similar(TEMPLATE, 1, [0.0, 1.0]) is None
+    assert cache.get_similar(TEMPLATE, 2, [1.0, 0.0]) is None
+    assert cache.get_similar("Other {qa}", 1, [1.0, 0.0]) is None
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['exact_hits'], stats['similar_hits'], stats['misses']) == (1, 1, 1, 1)
+
+
+def test_least_recently_used_are_evicted(cache):
+    keys = [AnswerCache.key(TEMPLATE, f"Question {i}", []) for i in range(4)]
+    for i, k in enumerate(keys[:3]):
+        cache.put(k, TEMPLATE, 1, None, f"Answer {i}")
+        time.sleep(0.01)
+    cache.get(keys[0])
+    cache.put(keys[3], TEMPLATE, 1, None, "Answer 3")
+
+    assert cache.stats()['entries'] == 3
+    assert cache.get(keys[1]) is None
+    assert [cache.get(k) for k in [keys[0], keys[2], keys[3]]] == ["Answer 0", "Answer 2", "Answer 3"]
+
+
+def test_generator_reuses_cached_answers(tmp_path, monkeypatch):
+    generator = AnswerGenerator(AnswerCache(str(tmp_path / 'answers.sqlite'), 10))
+    calls = []
+
+    def generate(query, context):
+        calls.append(query)
+        return f"Answer to {query}"
+
+    monkeypatch.setattr(generator, 'generate', generate)
+    assert generator.generate_cached("Apples?", ["a"], 1) == ("Answer to Apples?", False)
+    assert generator.generate_cached("Apples?", ["a"], 1) == ("Answer to Apples?", True)
+    # Another context is another prompt
+    assert generator.generate_cached("Apples?", ["b"], 1) == ("Answer to Apples?", False)
+    assert calls == ["Apples?", "Apples?"]
+
+
+def test_batch_only_sends_the_missing_prompts(tmp_path, monkeypatch):
+    generator = AnswerGenerator(AnswerCache(str(tmp_path / 'answers.sqlite'), 10))
+    generator.remember("Apples?", ["a"], 1, "In autumn.")
+    sent = []
+
+    def apply(chain, inputs):
+        sent.extend(inputs)
+        return [{chain.output_key: "\nIn  the cellar. "} for _ in inputs]
+
+    monkeypatch.setattr(LLMChain, 'apply', apply)
+    answers = generator.generate_batch(["Apples?", "Cider?"], [["a"], ["c"]], 1)
+    assert answers == [("In autumn.", True), ("In the cellar.", False)]
+    assert sent == [{'qa': AnswerGenerator.qa("Cider?", ["c"])}]
+    assert generator.cached("Cider?", ["c"], 1) == "In the cellar."
@@ -0,0 +1,52 @@
+import numpy as np
+
+from constants import response_codes
+from vector_stores.vector_store import VectorStore
+
+from conftest import chunk
+
+
+def test_top_k_and_squared_l2():
+    matrix = np.array([[0.0, 0.0], [1.0, 0.0], [3.0, 0.0]], dtype=np.float32)
+    queries = np.array([[2.9, 0.0], [0.2, 0.0]], dtype=np.float32)
+    distances = VectorStore.squared_l2(queries, matrix)
+    assert np.allclose(distances, ((queries[:, None, :] - matrix[None, :, :]) ** 2).sum(axis=2), atol=1e-4)
+    assert [list(t) for t in VectorStore.top_k(distances, 2)] == [[2, 1], [0, 1]]
+    assert [len(t) for t in VectorStore.top_k(distances, 10)] == [3, 3]
+
+
+def test_batch_search_matches_single_searches(store):
+    store.add_documents([chunk(f"Chunk {i} about topic {i % 5}", 'a.txt', 1) for i in range(40)],
+                        [f"id{i}" for i in range(40)])
+    questions = ["topic 1", "topic 3", "Chunk 7"]
+    batch = store.similarity_search_by_vectors([store.embeddings.embed_query(q) for q in questions], 4)
+    # Chunks at the same distance may come in any order
+    for q, results in zip(questions, batch):
+        assert np.allclose([d for _, d in results], [d for _, d in store.similarity_search(q, 4)], atol=1e-4)
+
+
+def test_query_batch(client, indexed):
+    response = client.post('/query/batch', json={'questions': [{'question': 'orchard apples', 'items': 2},
+                                                               {'question': 'cellar cider'}],
+                                                 'retrieval_mode': 'lexical'}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+    results = response['result']['results']
+    assert [r['question'] for r in results] == ['orchard apples', 'cellar cider']
+    assert len(results[0]['answers']) == 2
+    assert all(a['filename'] == 'cellar.txt' for a in results[1]['answers'])
+
+
+def test_query_batch_matches_single_queries(client, indexed):
+    questions = ['orchard harvest apples', 'cellar cider barrel']
+    response = client.post('/query/batch', json={'questions': [{'question': q, 'items': 3} for q in questions],
+                                                 'retrieval_mode': 'vector'}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+    for q, result in zip(questions, response['result']['results']):
+        single = client.post('/query', data={'question': q, 'items': 3, 'retrieval_mode': 'vector'}).json()
+        assert [a['distance'] for a in result['answers']] == [a['distance'] for a in single['result']['answers']]
+
+
+def test_query_batch_rejects_invalid_mode(client):
+    response = client.post('/query/batch', json={'questions': [{'question': 'cider'}],
+                                                 'retrieval_mode': 'telepathic'}).json()
+    assert response['code'] == response_codes.INVALID_VALUE
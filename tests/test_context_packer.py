@@ -0,0 +1,77 @@
+import pytest
+from langchain.schema import Document
+
+from constants import response_codes
+from modules.generators.context_packer import ContextPacker
+from modules.metrics.metrics import Metrics
+from modules.splitters.splitter import Splitter
+
+TEXT = "Line one about apples and pears.\nLine two mentions the orchard in spring.\n" \
+       "Line three says the harvest happens in autumn.\nLine four covers the storage of fruit.\n" \
+       "Line five is about cider making.\nLine six ends the page."
+
+
+@pytest.fixture(autouse=True)
+def words_as_tokens(monkeypatch):
+    # So that the tokens counted don't depend on the encoding being available
+    monkeypatch.setattr(Metrics, 'encoding', staticmethod(lambda: None))
+
+
+def result(text: str, filename: str = 'a.pdf', page_number: int = 1):
+    return Document(page_content=text, metadata={'uploaded_filename': filename, 'page_number': page_number}), 0.1
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    chunks = list(Splitter("\n", 100, 50).split_text(TEXT))
+    assert len(chunks) > 2
+    packed = ContextPacker(1000, 20, 0.8).pack([result(c) for c in reversed(chunks)])
+    assert packed.texts == [TEXT]
+    assert packed.retrieved_chunks == len(chunks)
+    assert packed.tokens == len(TEXT.split()) < packed.retrieved_tokens
+
+
+def test_chunks_of_other_pages_are_not_merged():
+    first, second = "Apples are picked in autumn by hand", "picked in autumn by hand and stored cold"
+    packed = ContextPacker(1000, 10, 0.99).pack([result(first), result(second, page_number=2)])
+    assert packed.texts == [first, second]
+
+
+def test_duplicates_of_more_relevant_texts_are_dropped():
+    text = "The cellar keeps the cider barrels cool all year long"
+    packed = ContextPacker(1000, 20, 0.8).pack([result(text, 'a.pdf'), result("Apples grow in the orchard", 'b.pdf'),
+                                                result(text + " indeed", 'c.pdf')])
+    assert packed.texts == [text, "Apples grow in the orchard"]
+    assert packed.stats()['saved_tokens'] == len(text.split()) + 1
+
+
+def test_texts_are_kept_by_relevance_within_the_budget():
+    long, short = " ".join(f"long{i}" for i in range(8)), "short text here"
+    packed = ContextPacker(10, 20, 0.8).pack([result("first relevant text", 'a.pdf'), result(long, 'b.pdf'),
+                                              result(short, 'c.pdf')])
+    # The long text doesn't fit, but a less relevant shorter one still does
+    assert packed.texts == ["first relevant text", short]
+    assert packed.tokens == 6
+
+
+def test_most_relevant_text_is_cut_to_the_budget():
+    packed = ContextPacker(4, 20, 0.8).pack([result("one two three four five six")])
+    assert packed.texts == ["one two three four"]
+    assert packed.tokens == 4
+
+
+def test_nothing_to_pack():
+    packed = ContextPacker().pack([])
+    assert packed.texts == []
+    assert packed.stats() == {'retrieved_chunks': 0, 'chunks': 0, 'retrieved_tokens': 0, 'tokens': 0,
+                              'saved_tokens': 0}
+
+
+def test_query_reports_packed_context(client, indexed):
+    response = client.post('/query', data={'question': 'orchard harvest apples', 'items': 5,
+                                           'retrieval_mode': 'lexical', 'generate_answer': 'true',
+                                           'use_mockup_answer': 'true'}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+    context = response['result']['context']
+    assert context['retrieved_chunks'] == 5
+    assert 0 < context['tokens'] <= context['retrieved_tokens']
+    assert context['saved_tokens'] == context['retrieved_tokens'] - context['tokens']
@@ -0,0 +1,107 @@
+import time
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+from modules.embeddings.cached_embeddings import CachedEmbeddings
+from modules.embeddings.embedding_cache import EmbeddingCache
+from modules.embeddings.micro_batching_embeddings import MicroBatchingEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    model = 'counting'
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_key_normalizes_whitespace_and_depends_on_model():
+    assert EmbeddingCache.key('m', "apples  \r\npears \n") == EmbeddingCache.key('m', "apples\npears")
+    assert EmbeddingCache.key('m', "apples") != EmbeddingCache.key('other', "apples")
+
+
+def test_only_misses_are_embedded(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.sqlite'), 1_000_000)
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, cache)
+
+    first = embeddings.embed_documents(["apples", "pears", "apples"])
+    assert provider.calls == [["apples", "pears"]]
+    second = embeddings.embed_documents(["pears", "cider"])
+    assert provider.calls[1] == ["cider"]
+    assert second[0] == first[1]
+    assert embeddings.embed_query("apples") == first[0]
+    assert len(provider.calls) == 2
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['remote_calls']) == (3, 2, 4, 2)
+    cache.close()
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / 'embeddings.sqlite')
+    cache = EmbeddingCache(path, 1_000_000)
+    CachedEmbeddings(CountingEmbeddings(), cache).embed_documents(["apples"])
+    cache.close()
+
+    provider = CountingEmbeddings()
+    cache = EmbeddingCache(path, 1_000_000)
+    CachedEmbeddings(provider, cache).embed_documents(["apples"])
+    assert provider.calls == []
+    assert cache.size_bytes == 12
+    cache.close()
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    # Every vector takes 12 bytes, so the cache fits 5 of them
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.sqlite'), 60)
+    keys = [EmbeddingCache.key('m', f"text {i}") for i in range(6)]
+    for i, k in enumerate(keys[:5]):
+        cache.put_many({k: [float(i), 0.0, 0.0]})
+        time.sleep(0.01)
+    cache.get_many([keys[0]])
+    time.sleep(0.01)
+    cache.put_many({keys[5]: [5.0, 0.0, 0.0]})
+
+    # Evicted down to 10% below the limit, starting by the least recently used
+    assert cache.size_bytes == 48
+    assert set(cache.get_many(keys)) == {keys[0], keys[3], keys[4], keys[5]}
+    cache.close()
+
+
+def test_model_name_of_wrapped_embeddings():
+    provider = CountingEmbeddings()
+    assert CachedEmbeddings.model_name(provider) == 'CountingEmbeddings:counting'
+    batcher = MicroBatchingEmbeddings(provider, 0.0, 16, 1, 0, 0.0)
+    assert CachedEmbeddings.model_name(batcher) == 'CountingEmbeddings:counting'
+    batcher.close()
+
+
+class FirstGenerationEmbeddings(CountingEmbeddings):
+    document_model_name = 'search-doc'
+    query_model_name = 'search-query'
+
+    def embed_query(self, text: str) -> List[float]:
+        return [-v for v in self.embed_documents([text])[0]]
+
+
+def test_queries_are_cached_under_the_query_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.sqlite'), 1_000_000)
+    provider = FirstGenerationEmbeddings()
+    embeddings = CachedEmbeddings(provider, cache)
+
+    document = embeddings.embed_documents(["apples"])[0]
+    query = embeddings.embed_query("apples")
+    assert query != document
+    assert len(provider.calls) == 2
+    assert embeddings.embed_query("apples") == query
+    assert embeddings.embed_documents(["apples"])[0] == document
+    assert len(provider.calls) == 2
+    cache.close()
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from vector_stores import faiss_store
+from vector_stores.read_write_lock import ReadWriteLock
+
+from conftest import build_store, chunk
+
+
+@pytest.fixture(params=[faiss_store.FLAT, faiss_store.HNSW])
+def faiss_index(request, monkeypatch):
+    monkeypatch.setattr(faiss_store, 'FAISS_INDEX', request.param)
+    store = build_store('faiss', f"faiss_{request.node.name}".replace('[', '_').replace(']', ''))
+    add(store, 0, 100)
+    yield store
+    store.close()
+
+
+def add(store, start: int, end: int):
+    store.add_documents([chunk(f"Chunk {i} about topic {i % 7} and item {i}", 'a.txt', 1) for i in range(start, end)],
+                        [f"id{i}" for i in range(start, end)])
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(2, timeout=5)
+
+    def read():
+        with lock.shared():
+            inside.wait()
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for t in readers:
+        t.start()
+    for t in readers:
+        t.join()
+    assert not inside.broken
+
+
+def test_writer_excludes_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def read():
+        with lock.shared():
+            events.append('read')
+
+    with lock.exclusive():
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.1)
+        events.append('written')
+    reader.join()
+    assert events == ['written', 'read']
+
+
+def test_concurrent_adds_and_searches(faiss_index):
+    errors = []
+    adding = threading.Event()
+
+    def search():
+        while not adding.is_set():
+            try:
+                for results in faiss_index.similarity_search_by_vectors(vectors, 5):
+                    assert len(results) == 5
+            except Exception as e:
+                errors.append(e)
+                return
+
+    vectors = [faiss_index.embeddings.embed_query(f"topic {t}") for t in range(3)]
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for t in searchers:
+        t.start()
+    for start in range(100, 300, 10):
+        add(faiss_index, start, start + 10)
+    adding.set()
+    for t in searchers:
+        t.join()
+
+    assert errors == []
+    assert faiss_index.index.ntotal == 300
+    assert len(faiss_index.similarity_search("Chunk 299 about topic 5 and item 299", 1)) == 1
+
+
+def test_ivfpq_is_trained_without_stopping_searches(monkeypatch):
+    monkeypatch.setattr(faiss_store, 'FAISS_INDEX', faiss_store.IVFPQ)
+    monkeypatch.setattr(faiss_store, 'FAISS_IVF_LISTS', 4)
+    monkeypatch.setattr(faiss_store, 'FAISS_PQ_M', 8)
+    monkeypatch.setattr(faiss_store, 'FAISS_PQ_BITS', 4)
+    monkeypatch.setattr(faiss_store, 'TRAIN_ADD_BLOCK', 100)
+    store = build_store('faiss', 'faiss_ivfpq_training')
+    vector = store.embeddings.embed_query("topic 3")
+    errors = []
+    adding = threading.Event()
+
+    def search():
+        while not adding.is_set():
+            try:
+                assert len(store.similarity_search_by_vectors([vector], 5)[0]) == 5
+            except Exception as e:
+                errors.append(e)
+                return
+
+    add(store, 0, 10)
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    # Trained once there are 16 * 39 vectors
+    for start in range(10, 700, 30):
+        add(store, start, start + 30)
+    adding.set()
+    searcher.join()
+
+    assert errors == []
+    assert isinstance(store.index, faiss_store.faiss.IndexIVFPQ)
+    assert store.index.ntotal == store.rows == 700
+    store.close()
@@ -0,0 +1,28 @@
+import threading
+import time
+
+from modules.jobs.ingestion_queue import IngestionQueue, DONE
+
+
+def test_stop_with_a_full_queue_does_not_block():
+    ingestion_queue = IngestionQueue(workers=2, max_size=2, history=10)
+    ingestion_queue.start()
+    release = threading.Event()
+    threads = list(ingestion_queue.threads)
+    # Both workers busy and the queue full
+    jobs = [ingestion_queue.submit(f"{i}.txt", lambda job: release.wait(10)) for i in range(2)]
+    while ingestion_queue.depth() > 0:
+        time.sleep(0.01)
+    jobs += [ingestion_queue.submit(f"{i}.txt", lambda job: release.wait(10)) for i in range(2, 4)]
+
+    stopper = threading.Thread(target=ingestion_queue.stop, args=(0.1,), daemon=True)
+    stopper.start()
+    stopper.join(2)
+    assert not stopper.is_alive()
+
+    # The jobs already queued are still processed, then the workers exit
+    release.set()
+    for t in threads:
+        t.join(5)
+        assert not t.is_alive()
+    assert all(job.status == DONE for job in jobs)
@@ -0,0 +1,29 @@
+from constants import response_codes
+
+
+def test_lemmatize_batch_matches_single_calls(client):
+    texts = ["The cats were running", "Apples and pears", ""]
+    response = client.post('/lemmatize/batch', json={'texts': texts, 'lan': 'english'}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+
+    singles = [client.post('/lemmatize', data={'text': t, 'lan': 'english'}).json()['result'] for t in texts[:2]]
+    assert response['result']['texts'][:2] == singles
+    assert len(response['result']['texts']) == len(texts)
+
+
+def test_lemmatize_batch_removes_stopwords(client):
+    texts = ["The cats were running in the garden"]
+    response = client.post('/lemmatize/batch', json={'texts': texts, 'lan': 'english',
+                                                      'remove_stopwords': True}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+
+    single = client.post('/lemmatize_stopwords', data={'text': texts[0], 'lan': 'english'}).json()['result']
+    assert response['result']['texts'] == [single]
+    assert 'the' not in response['result']['texts'][0].lower().split()
+
+
+def test_lemmatize_batch_reports_errors(client):
+    response = client.post('/lemmatize/batch', json={'texts': ["Some text"], 'lan': 'klingon',
+                                                     'remove_stopwords': True}).json()
+    assert response['code'] == response_codes.EXCEPTION
+    assert response['result'] == ""
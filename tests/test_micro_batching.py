@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+from langchain.embeddings.base import Embeddings
+from openai.error import RateLimitError
+
+from modules.embeddings.micro_batching_embeddings import MicroBatchingEmbeddings, EmbeddingRequest
+
+
+class SlowEmbeddings(Embeddings):
+    """
+        Provider taking a while per call, which records the size of every call and can be told to rate limit them.
+    """
+    def __init__(self):
+        self.calls = []
+        self.rate_limited = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.lock:
+            self.calls.append(len(texts))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            rate_limited = self.rate_limited > 0
+            self.rate_limited -= 1 if rate_limited else 0
+        try:
+            time.sleep(0.02)
+            if rate_limited:
+                raise RateLimitError("Slow down")
+            if 'bad' in texts:
+                raise ValueError("Bad text")
+            return [SlowEmbeddings.vector(t) for t in texts]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    @staticmethod
+    def vector(text: str) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)))]
+
+
+@pytest.fixture
+def provider():
+    return SlowEmbeddings()
+
+
+@pytest.fixture
+def batcher(provider):
+    batcher = MicroBatchingEmbeddings(provider, 0.01, 64, 2, 2, 0.01)
+    yield batcher
+    batcher.close()
+
+
+def test_concurrent_queries_are_batched(provider, batcher):
+    questions = [f"question {i}" for i in range(200)]
+    with ThreadPoolExecutor(50) as executor:
+        vectors = list(executor.map(batcher.embed_query, questions))
+
+    assert vectors == [SlowEmbeddings.vector(q) for q in questions]
+    assert len(provider.calls) < 50
+    assert max(provider.calls) <= 64
+    assert provider.max_active <= 2
+
+
+def test_documents_are_split_in_batches(provider, batcher):
+    texts = [f"chunk {i}" for i in range(150)]
+    assert batcher.embed_documents(texts) == [SlowEmbeddings.vector(t) for t in texts]
+    assert provider.calls == [64, 64, 22]
+    assert batcher.embed_documents([]) == []
+
+
+def test_rate_limited_calls_are_retried(provider, batcher):
+    provider.rate_limited = 2
+    assert batcher.embed_query("apples") == SlowEmbeddings.vector("apples")
+    assert provider.calls == [1, 1, 1]
+
+    provider.rate_limited = 10
+    with pytest.raises(RateLimitError):
+        batcher.embed_query("pears")
+
+
+def test_rejected_text_only_fails_its_request(batcher):
+    with ThreadPoolExecutor(5) as executor:
+        futures = [executor.submit(batcher.embed_documents, [t]) for t in ["a", "bad", "c", "d", "e"]]
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert [f.result() for i, f in enumerate(futures) if i != 1] == [[SlowEmbeddings.vector(t)] for t in "acde"]
+
+
+def test_close_sends_the_queued_requests(provider):
+    batcher = MicroBatchingEmbeddings(provider, 0.05, 64, 1, 0, 0.0)
+    requests = [EmbeddingRequest([f"q{i}"]) for i in range(4)]
+    for r in requests:
+        batcher.requests.put(r)
+    batcher.close()
+    assert [r.future.result(timeout=0) for r in requests] == [[SlowEmbeddings.vector(f"q{i}")] for i in range(4)]
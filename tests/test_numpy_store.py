@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pytest
+
+from vector_stores import numpy_store
+from vector_stores.ivf_index import IVFIndex
+from vector_stores.numpy_store import NumpyVectorStore
+
+from conftest import build_store, chunk
+
+
+@pytest.fixture
+def ivf_store(request, monkeypatch):
+    monkeypatch.setattr(numpy_store, 'NUMPY_INDEX', 'ivf')
+    monkeypatch.setattr(numpy_store, 'NUMPY_IVF_MIN_ROWS', 50)
+    monkeypatch.setattr(numpy_store, 'NUMPY_IVF_LISTS', 4)
+    # Every list is probed, so that searches see all the rows
+    monkeypatch.setattr(numpy_store, 'NUMPY_IVF_PROBES', 4)
+    store = build_store('numpy', f"numpy_{request.node.name}")
+    add(store, 0, 100)
+    store._train_if_needed()
+    assert store.ivf is not None
+    yield store
+    store.close()
+
+
+def add(store, start: int, end: int):
+    store.add_documents([chunk(f"Chunk {i} about topic {i % 7} and item {i}", 'a.txt', 1) for i in range(start, end)],
+                        [f"id{i}" for i in range(start, end)])
+
+
+def test_assigned_returns_a_new_index():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, 8)).astype(np.float32)
+    index = IVFIndex.train(vectors, 4).assigned(vectors)
+    grown = index.assigned(rng.normal(size=(10, 8)).astype(np.float32))
+
+    assert len(index.assignments) == 40
+    assert len(grown.assignments) == 50
+    assert index.candidates(vectors[0], 4).max() < 40
+    assert sorted(grown.candidates(vectors[0], 4)) == list(range(50))
+
+
+def test_search_over_a_view_taken_before_an_add(ivf_store):
+    view = ivf_store._view()
+    add(ivf_store, 100, 150)
+    query = np.asarray(ivf_store.embeddings.embed_query("topic 3"), dtype=np.float32)
+    rows, _ = NumpyVectorStore._search_ivf(query, 10, *view)
+    assert len(rows) == 10
+    assert rows.max() < 100
+
+
+def test_concurrent_adds_and_searches(ivf_store):
+    errors = []
+    adding = threading.Event()
+
+    def search():
+        while not adding.is_set():
+            try:
+                for results in ivf_store.similarity_search_by_vectors(vectors, 5):
+                    assert len(results) == 5
+            except Exception as e:
+                errors.append(e)
+                return
+
+    vectors = [ivf_store.embeddings.embed_query(f"topic {t}") for t in range(3)]
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for t in searchers:
+        t.start()
+    for start in range(100, 300, 10):
+        add(ivf_store, start, start + 10)
+    adding.set()
+    for t in searchers:
+        t.join()
+
+    assert errors == []
+    assert len(ivf_store.similarity_search("Chunk 299 about topic 5 and item 299", 1)) == 1
@@ -0,0 +1,74 @@
+import os
+
+import fitz
+import pytest
+
+from modules.pdf.page_extractor import PageExtractor, PYMUPDF, PYPDF
+
+
+def make_pdf(pages: int, title: str) -> bytes:
+    doc = fitz.open()
+    for p in range(pages):
+        doc.new_page().insert_text((72, 72), f"{title} page {p + 1}")
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+@pytest.fixture
+def extractor():
+    yield PageExtractor
+    PageExtractor.shutdown()
+
+
+@pytest.mark.parametrize('backend', [PYMUPDF, PYPDF])
+def test_pages_in_processes_match_pages_in_process(extractor, backend):
+    pdf = make_pdf(9, 'Orchard')
+    expected = list(extractor.iter_pages(pdf, 9, backend=backend, workers=1))
+    assert [t.strip() for t in expected] == [f"Orchard page {p}" for p in range(1, 10)]
+    assert list(extractor.iter_pages(pdf, 9, backend=backend, workers=2, batch_size=2)) == expected
+
+
+def test_pool_is_reused_across_pdfs(extractor, tmp_path):
+    path = tmp_path / 'cellar.pdf'
+    path.write_bytes(make_pdf(5, 'Cellar'))
+    list(extractor.iter_pages(make_pdf(5, 'Orchard'), 5, workers=2, batch_size=1))
+    pool = extractor.pool()
+    pages = list(extractor.iter_pages(str(path), 5, workers=2, batch_size=1))
+    assert [t.strip() for t in pages] == [f"Cellar page {p}" for p in range(1, 6)]
+    assert extractor.pool() is pool
+    assert pool._mp_context.get_start_method() == 'spawn'
+
+
+def test_shutdown_stops_the_pool(extractor):
+    pdf = make_pdf(4, 'Orchard')
+    list(extractor.iter_pages(pdf, 4, workers=2, batch_size=1))
+    pool = extractor.pool()
+    extractor.shutdown()
+    assert extractor.pool() is not pool
+    assert len(list(extractor.iter_pages(pdf, 4, workers=2, batch_size=1))) == 4
+
+
+def test_stopping_early_cancels_pending_batches(extractor):
+    pages = extractor.iter_pages(make_pdf(20, 'Orchard'), 20, workers=2, batch_size=1)
+    assert next(pages).strip() == "Orchard page 1"
+    pages.close()
+    assert list(extractor.iter_pages(make_pdf(3, 'Cellar'), 3, workers=2, batch_size=1))[2].strip() == "Cellar page 3"
+
+
+def test_content_is_written_once_and_removed(extractor):
+    from constants.consts import TMP_DIR
+
+    def copies():
+        return [f for f in os.listdir(TMP_DIR) if f.startswith('pdf-')] if os.path.isdir(TMP_DIR) else []
+
+    pages = extractor.iter_pages(make_pdf(8, 'Orchard'), 8, workers=2, batch_size=1)
+    assert next(pages).strip() == "Orchard page 1"
+    assert len(copies()) == 1
+    assert len(list(pages)) == 7
+    assert copies() == []
+
+    pages = extractor.iter_pages(make_pdf(20, 'Orchard'), 20, workers=2, batch_size=1)
+    next(pages)
+    pages.close()
+    assert copies() == []
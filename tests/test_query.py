@@ -0,0 +1,96 @@
+import json
+
+from langchain.schema import Document
+
+from constants import response_codes
+from modules.indexing.querier import Querier
+
+
+def query(client, **data):
+    data = {'retrieval_mode': 'lexical', **data}
+    return client.post('/query', data=data).json()
+
+
+def test_query_pages_with_cursor(client, indexed):
+    first = query(client, question='orchard harvest apples', items=2)
+    assert first['code'] == response_codes.SUCCESS, first
+    assert first['result']['next_cursor'] is not None
+
+    second = query(client, question='orchard harvest apples', items=2, cursor=first['result']['next_cursor'])
+    assert second['code'] == response_codes.SUCCESS, second
+    first_answers = [a['answer'] for a in first['result']['answers']]
+    second_answers = [a['answer'] for a in second['result']['answers']]
+    assert len(second_answers) == 2
+    assert set(first_answers).isdisjoint(second_answers)
+
+
+def test_query_rejects_invalid_cursor(client, indexed):
+    response = query(client, question='orchard', cursor='not a cursor')
+    assert response['code'] == response_codes.INVALID_VALUE
+
+
+class RankedLoader:
+    """
+        Returns the chunks sorted by distance, as a loader would, and remembers how many were asked for.
+    """
+    def __init__(self, distances: dict):
+        self.distances = distances
+        self.asked = []
+
+    def qa(self, query, items, mode, search_filter):
+        self.asked.append(items)
+        ranked = sorted(self.distances.items(), key=lambda c: c[1])[:items]
+        return [(Document(page_content=i, metadata={'chunk_id': i}), d) for i, d in ranked]
+
+
+def pages(querier, items, cursor=None):
+    results, cursor = querier.retrieve_page("apples", items, cursor=cursor)
+    return [d.page_content for d, _ in results], cursor
+
+
+def test_pages_only_search_what_they_need():
+    loader = RankedLoader({f"c{i}": float(i) for i in range(7)})
+    querier = Querier(loader)
+    first, cursor = pages(querier, 3)
+    assert first == ['c0', 'c1', 'c2']
+    assert loader.asked == [4]
+    second, cursor = pages(querier, 3, cursor)
+    assert second == ['c3', 'c4', 'c5']
+    last, cursor = pages(querier, 3, cursor)
+    assert last == ['c6']
+    assert cursor is None
+
+
+def test_pages_continue_after_the_last_result():
+    loader = RankedLoader({f"c{i}": float(i) for i in range(7)})
+    querier = Querier(loader)
+    first, cursor = pages(querier, 3)
+    # A chunk ranked first added, and the last one of the page removed, before the next page
+    loader.distances['new'] = -1.0
+    del loader.distances['c2']
+    second, _ = pages(querier, 3, cursor)
+    assert second == ['c3', 'c4', 'c5']
+
+
+def test_query_stream_remembers_generated_answer(client, indexed, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.generator, 'stream', lambda question, context: iter(["Apples are ", "harvested\n", "."]))
+    question = 'When is the orchard harvest of apples?'
+    lines = client.post('/query/stream', data={'question': question, 'items': 3, 'generate_answer': 'true',
+                                               'retrieval_mode': 'lexical'}).text.strip().splitlines()
+    events = [json.loads(line) for line in lines]
+
+    assert events[0]['event'] == 'answers'
+    assert [e['token'] for e in events if e['event'] == 'token'] == ["Apples are ", "harvested\n", "."]
+    assert events[-1]['event'] == 'done', events[-1]
+    assert events[-1]['answer_from_cache'] is False
+
+    # The second time, the answer is served from the cache instead of being generated again
+    monkeypatch.setattr(main.generator, 'stream', lambda question, context: iter(["Not", " cached"]))
+    lines = client.post('/query/stream', data={'question': question, 'items': 3, 'generate_answer': 'true',
+                                               'retrieval_mode': 'lexical'}).text.strip().splitlines()
+    events = [json.loads(line) for line in lines]
+    assert [e['token'] for e in events if e['event'] == 'token'] == ["Apples are harvested."]
+    assert events[-1]['answer_from_cache'] is True
+
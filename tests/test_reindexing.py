@@ -0,0 +1,76 @@
+import pytest
+from langchain.schema import Document
+
+from modules.indexing.content_hasher import ContentHasher
+from modules.indexing.loaders.loader_factory import LoaderFactory
+from modules.jobs.ingestion_queue import IngestionJob
+
+from conftest import STORES
+
+LINES = [f"Line {i} of the orchard notebook, about apple tree {i}." for i in range(12)]
+
+
+@pytest.fixture(params=STORES)
+def loader(request):
+    loader = LoaderFactory.build(f"{request.param}_{request.node.originalname}", request.param)
+    yield loader
+    loader.close()
+
+
+def index(loader, lines, filename='notebook.txt'):
+    loader.index_text("\n".join(lines), filename, separator='\n', chunk_size=60, chunk_overlap=0)
+    return loader.store.get_chunks(filename)
+
+
+def test_ids_are_deterministic():
+    chunks = [Document(page_content=t, metadata={'page_number': 1}) for t in ["Header", "Body", "Header"]]
+    ids = [i for i, _ in ContentHasher.with_ids('a.txt', chunks)]
+    assert ids == [i for i, _ in ContentHasher.with_ids('a.txt', chunks)]
+    # Repeated chunks get ids of their own, and the same chunk of another file or page too
+    assert len(set(ids)) == 3
+    assert ids[0] not in [i for i, _ in ContentHasher.with_ids('b.txt', chunks)]
+    moved = [Document(page_content="Header", metadata={'page_number': 2})]
+    assert next(ContentHasher.with_ids('a.txt', moved))[0] != ids[0]
+
+
+def test_same_upload_adds_nothing(loader):
+    chunks = index(loader, LINES)
+    assert len(chunks) == len(LINES)
+    write = loader.store.last_write()
+    generation = loader.generation.current()
+    assert index(loader, LINES) == chunks
+    assert loader.store.last_write() == write
+    assert loader.generation.current() == generation
+
+
+def test_same_upload_job_is_persisted(loader):
+    index(loader, LINES)
+    job = IngestionJob('notebook.txt', None)
+    loader.index_text("\n".join(LINES), 'notebook.txt', separator='\n', chunk_size=60, chunk_overlap=0, job=job)
+    loader.store.persist()
+    assert job.is_persisted()
+
+
+def test_changed_upload_reindexes_differences(loader):
+    before = index(loader, LINES)
+    write = loader.store.last_write()
+    changed = LINES[:6] + ["A new line about the pear trees of the orchard."] + LINES[8:]
+    after = index(loader, changed)
+
+    assert len(after) == len(changed)
+    # One call adding the new chunk, and one deleting the two gone
+    assert loader.store.last_write() == write + 2
+    assert len(set(before) - set(after)) == 2
+    added = set(after) - set(before)
+    assert added == {loader.qa("pear trees", 1, mode='lexical')[0][0].metadata['chunk_id']}
+    results = loader.qa("apple tree 6", 20, mode='lexical')
+    assert all("apple tree 6." not in d.page_content and "apple tree 7." not in d.page_content for d, _ in results)
+
+
+def test_delete_document(loader):
+    index(loader, LINES)
+    index(loader, ["The cellar keeps the cider cool."], 'cellar.txt')
+    assert loader.delete_document('notebook.txt') == len(LINES)
+    assert loader.store.get_chunks('notebook.txt') == {}
+    assert [d.metadata['uploaded_filename'] for d, _ in loader.qa("orchard apple tree", 5)] == ['cellar.txt']
+    assert loader.delete_document('notebook.txt') == 0
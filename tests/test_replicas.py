@@ -0,0 +1,82 @@
+import pytest
+
+from constants.consts import PERSIST_DIR
+from modules.indexing import index_replica
+from modules.indexing.index_lock import IndexLock
+from modules.indexing.index_replica import IndexReplica
+from modules.indexing.loaders import loader_factory
+from modules.indexing.loaders.loader_factory import LoaderFactory
+
+from conftest import STORES
+
+
+@pytest.fixture(params=STORES)
+def writer(request, monkeypatch):
+    # Replicas open the store configured in `VECTOR_STORE`
+    monkeypatch.setattr(loader_factory, 'VECTOR_STORE', request.param)
+    monkeypatch.setattr(index_replica, 'REPLICA_CLOSE_DELAY', 0)
+    writer = LoaderFactory.build(f"{request.param}_{request.node.originalname}")
+    yield writer
+    writer.close()
+
+
+def add(loader, filename: str, text: str):
+    loader.index_text(text, filename, separator='\n')
+    loader.store.persist()
+
+
+def filenames(loader, question: str):
+    return {d.metadata['uploaded_filename'] for d, _ in loader.qa(question, 10)}
+
+
+def test_single_writer(tmp_path):
+    first = IndexLock(str(tmp_path / 'collection'))
+    second = IndexLock(str(tmp_path / 'collection'))
+    assert first.acquire_writer()
+    assert not second.acquire_writer()
+    first.writer_file.close()
+    assert second.acquire_writer()
+    second.writer_file.close()
+
+
+def test_publish_bumps_the_version(tmp_path):
+    lock = IndexLock(str(tmp_path / 'collection'))
+    assert lock.published() == 0
+    with lock.exclusive():
+        assert lock.publish() == 1
+    assert IndexLock(str(tmp_path / 'collection')).published() == 1
+
+
+def test_replica_sees_published_writes(writer):
+    add(writer, 'orchard.txt', "The orchard harvest of apples happens in autumn.")
+    reloaded = []
+    replica = IndexReplica(writer.collection, reloaded.append)
+    reader = replica.open()
+    assert replica.version == IndexLock(f"{PERSIST_DIR}/{writer.collection}").published() > 0
+    assert filenames(reader, "orchard apples") == {'orchard.txt'}
+
+    add(writer, 'cellar.txt', "The cellar keeps the cider barrels cool.")
+    assert filenames(reader, "cellar cider") == {'orchard.txt'}
+    replica._reload()
+    assert reloaded == [replica.loader] and replica.loader is not reader
+    assert filenames(replica.loader, "cellar cider") == {'orchard.txt', 'cellar.txt'}
+    replica.loader.close()
+
+
+def test_replica_is_read_only(writer):
+    add(writer, 'orchard.txt', "The orchard harvest of apples happens in autumn.")
+    reader = IndexReplica(writer.collection, lambda loader: None).open()
+    with pytest.raises(PermissionError):
+        reader.index_text("The cellar keeps the cider barrels cool.", 'cellar.txt')
+    with pytest.raises(PermissionError):
+        reader.delete_document('orchard.txt')
+    assert filenames(reader, "orchard apples") == {'orchard.txt'}
+    reader.close()
+
+
+def test_replica_lists_the_chunks_of_a_file(writer):
+    add(writer, 'orchard.txt', "The orchard harvest of apples happens in autumn.\nThe pears come later.")
+    reader = IndexReplica(writer.collection, lambda loader: None).open()
+    assert reader.store.get_chunks('orchard.txt') == writer.store.get_chunks('orchard.txt')
+    assert reader.store.get_chunks('cellar.txt') == {}
+    reader.close()
@@ -0,0 +1,65 @@
+from constants import response_codes
+from modules.indexing.search_filter import SearchFilter
+
+from conftest import chunk
+
+
+def add_pages(store):
+    documents = [chunk(f"The orchard harvest of apples on page {p}", 'a.pdf', p) for p in range(1, 4)] + \
+                [chunk("The cellar keeps the cider barrels cool", 'b.pdf', 1, author='Bob')]
+    ids = [f"a{p}" for p in range(1, 4)] + ['b1']
+    store.add_documents(documents, ids)
+    return ids
+
+
+def filenames(results):
+    return [d.metadata['uploaded_filename'] for d, _ in results]
+
+
+def test_filter_by_filename(store):
+    add_pages(store)
+    results = store.similarity_search("orchard apples", 10, SearchFilter(filename='b.pdf'))
+    assert filenames(results) == ['b.pdf']
+
+
+def test_filter_by_author_and_pages(store):
+    add_pages(store)
+    results = store.similarity_search("orchard apples", 10, SearchFilter(author='Alice', page_from=2, page_to=3))
+    assert sorted(d.metadata['page_number'] for d, _ in results) == [2, 3]
+
+
+def test_filter_matching_nothing_returns_no_results(store):
+    add_pages(store)
+    assert store.similarity_search("orchard apples", 4, SearchFilter(filename='missing.pdf')) == []
+
+
+def test_filter_of_deleted_file_returns_no_results(store):
+    ids = add_pages(store)
+    store.delete([i for i in ids if i.startswith('a')])
+    assert store.similarity_search("orchard apples", 4, SearchFilter(filename='a.pdf')) == []
+    assert filenames(store.similarity_search("orchard apples", 4)) == ['b.pdf']
+
+
+def test_batch_search_applies_filter(store):
+    add_pages(store)
+    vectors = [store.embeddings.embed_query("orchard apples"), store.embeddings.embed_query("cider")]
+    results = store.similarity_search_by_vectors(vectors, 10, SearchFilter(filename='a.pdf'))
+    assert [sorted(filenames(r)) for r in results] == [['a.pdf'] * 3] * 2
+    assert store.similarity_search_by_vectors(vectors, 10, SearchFilter(filename='missing.pdf')) == [[], []]
+
+
+def test_query_with_filter_matching_nothing(client, indexed):
+    for mode in ('vector', 'lexical', 'hybrid'):
+        response = client.post('/query', data={'question': 'orchard apples', 'filename': 'missing.txt',
+                                               'retrieval_mode': mode}).json()
+        assert response['code'] == response_codes.SUCCESS, response
+        assert response['result']['answers'] == []
+        assert response['result']['next_cursor'] is None
+
+
+def test_query_with_filter(client, indexed):
+    response = client.post('/query', data={'question': 'orchard apples cider', 'filename': 'cellar.txt', 'items': 5,
+                                           'retrieval_mode': 'hybrid'}).json()
+    assert response['code'] == response_codes.SUCCESS, response
+    assert len(response['result']['answers']) == 5
+    assert all(a['filename'] == 'cellar.txt' for a in response['result']['answers'])
@@ -0,0 +1,57 @@
+import asyncio
+import os
+from tempfile import SpooledTemporaryFile
+
+from fastapi import UploadFile
+
+from constants import response_codes
+from modules.indexing.content_hasher import ContentHasher
+from modules.uploads import upload_buffer
+from modules.uploads.upload_buffer import UploadBuffer
+from modules.uploads.upload_limiter import UploadLimiter
+
+
+def spooled(content: bytes, max_size: int) -> UploadFile:
+    file = SpooledTemporaryFile(max_size=max_size)
+    file.write(content)
+    return UploadFile(file, filename='orchard.txt')
+
+
+def test_buffer_takes_over_the_spooled_file(monkeypatch):
+    monkeypatch.setattr(upload_buffer, 'UPLOAD_SPOOL_BYTES', 64)
+    monkeypatch.setattr(upload_buffer, 'UPLOAD_CHUNK_BYTES', 16)
+    text = "The orchard harvest of apples happens in autumn, and the pears come later. " * 4
+    upload = spooled(text.encode('utf-8'), 64)
+    spool = upload.file
+    limiter = UploadLimiter(1024)
+    buffer = UploadBuffer(limiter)
+    asyncio.run(buffer.receive(upload))
+
+    assert buffer.file is spool and upload.file is not spool
+    assert buffer.digest() == ContentHasher.document_hash(text)
+    assert limiter.bytes_in_flight() == len(text)
+    assert "".join(buffer.iter_text()) == text
+    # Bigger than what is kept in memory: a path, for the processes extracting pages
+    path = buffer.source()
+    with open(path, 'rb') as f:
+        assert f.read() == text.encode('utf-8')
+    buffer.close()
+    assert not os.path.exists(path)
+    assert limiter.bytes_in_flight() == 0
+
+
+def test_small_upload_is_a_content():
+    buffer = UploadBuffer(UploadLimiter(1024))
+    asyncio.run(buffer.receive(spooled(b"The cellar keeps the cider cool.", 1024)))
+    assert buffer.source() == b"The cellar keeps the cider cool."
+    buffer.close()
+
+
+def test_upload_bigger_than_the_limit_is_rejected_before_reading_it(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'UPLOAD_MAX_BYTES', 100)
+    monkeypatch.setattr(main, 'UPLOAD_FORM_BYTES', 1000)
+    response = client.post('/process_text', files={'file': ('big.txt', b"apples " * 500, 'text/plain')})
+    assert response.status_code == 413
+    assert response.json()['code'] == response_codes.UPLOAD_TOO_LARGE
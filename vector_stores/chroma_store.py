@@ -1,31 +1,153 @@
-import logging
+import json
+import os
+from typing import Dict, List, Tuple, Optional
 
+import uuid
+
+import numpy as np
+import pyarrow.parquet as pq
+from chromadb.errors import NoDatapointsException
+from langchain.schema import Document
 from langchain.vectorstores import Chroma
-from langchain.embeddings.openai import OpenAIEmbeddings
+from langchain.vectorstores.chroma import _results_to_docs_and_scores
 
-import pandas as pd
+from constants.consts import PERSIST_DIR, DEFAULT_ITEMS
+from modules.indexing.search_filter import SearchFilter
+from vector_stores.vector_store import VectorStore
 
-from constants.consts import PERSIST_DIR
+MAX_DISTANCES_PER_BLOCK = 2 ** 24
+# Files written by `persist` with the whole database of Chroma
+CHROMA_FILES = ['chroma-collections.parquet', 'chroma-embeddings.parquet']
 
 
-class ChromaVectorStore:
-    def __init__(self, collection):
-        self.collection = collection
-        self.embeddings = OpenAIEmbeddings()
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection, read_only: bool = False):
+        super().__init__(collection, read_only)
+        # In-memory copy of all the embeddings of the collection for `similarity_search_by_vectors`, rebuilt after
+        # writes: (write sequence it was built at, ids, documents, metadatas, embeddings matrix, squared norms)
+        self.snapshot = None
+        # Number of chunks of the collection: (write sequence it was counted at, count)
+        self.counted = None
+        if read_only:
+            # Replicas only search the snapshot, so they read it straight from the files written by `persist`
+            # instead of loading the database in Chroma (which writes it back when it is garbage collected)
+            self.vector_store = None
+            self.snapshot = self._read_persisted()
+            return
         self.vector_store = Chroma(self.collection, self.embeddings, persist_directory=PERSIST_DIR)
 
-    def add_documents(self, documents):
-        res = self.vector_store.add_documents(documents)
-        self.persist()
-        return res
+        # The DuckDB connection of Chroma can't be used by several threads at once, so every call to the collection
+        # holds `write_lock`. Embeddings are computed before taking it.
+
+    def add_documents(self, documents, ids: List[str] = None):
+        if ids is None:
+            ids = [str(uuid.uuid1()) for _ in documents]
+        texts = [d.page_content for d in documents]
+        embeddings = self.embeddings.embed_documents(texts)
+        with self.write_lock:
+            self.vector_store._collection.add(ids=ids, embeddings=embeddings, documents=texts,
+                                              metadatas=[d.metadata for d in documents])
+            self._written(len(documents))
+        self._persist_if_needed()
+        return ids
+
+    def delete(self, ids: List[str]):
+        with self.write_lock:
+            self.vector_store._collection.delete(ids=ids)
+            self._written(len(ids))
+        self._persist_if_needed()
 
-    def persist(self):
+    def get_chunks(self, filename: str) -> Dict[str, dict]:
+        if self.read_only:
+            _, ids, _, metadatas, _, _ = self.snapshot
+            return {i: m for i, m in zip(ids, metadatas) if m.get('uploaded_filename') == filename}
+        with self.write_lock:
+            res = self.vector_store._collection.get(where={'uploaded_filename': filename}, include=['metadatas'])
+        return dict(zip(res['ids'], res['metadatas']))
+
+    def _flush(self):
         self.vector_store.persist()
-        self.vector_store = None
-        self.vector_store = Chroma(self.collection, self.embeddings, persist_directory=PERSIST_DIR)
 
-    def similarity_search(self, query: str, items: int = None):
-        if items is not None:
-            return self.vector_store.similarity_search_with_score(query, k=items)
-        else:
-            return self.vector_store.similarity_search_with_score(query)
+    def similarity_search_by_vectors(self, vectors: List[List[float]], items: int = 4,
+                                     search_filter: Optional[SearchFilter] = None) \
+            -> List[List[Tuple[Document, float]]]:
+        # Scored against a snapshot of the collection with one matrix product per block of queries
+        _, documents, metadatas, matrix, norms = self._snapshot()
+        if search_filter is not None and not search_filter.is_empty():
+            selected = [i for i, m in enumerate(metadatas) if search_filter.matches(m)]
+            documents = [documents[i] for i in selected]
+            metadatas = [metadatas[i] for i in selected]
+            matrix, norms = matrix[selected], norms[selected]
+        if len(documents) == 0:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        # Queries are scored in blocks to bound the size of the distances matrix
+        block = max(1, MAX_DISTANCES_PER_BLOCK // len(documents))
+        results = []
+        for start in range(0, len(queries), block):
+            distances = VectorStore.squared_l2(queries[start:start + block], matrix, norms)
+            for q, candidates in enumerate(VectorStore.top_k(distances, items)):
+                results.append([(Document(page_content=documents[i], metadata=metadatas[i]),
+                                 float(distances[q, i])) for i in candidates])
+        return results
+
+    def _snapshot(self):
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot[0] == self.writes:
+            return snapshot[1:]
+        with self.write_lock:
+            writes = self.writes
+            res = self.vector_store._collection.get(include=['embeddings', 'documents', 'metadatas'])
+        matrix = np.asarray(res['embeddings'], dtype=np.float32) if len(res['ids']) > 0 \
+            else np.zeros((0, 0), dtype=np.float32)
+        snapshot = (writes, res['ids'], res['documents'], res['metadatas'], matrix, (matrix ** 2).sum(axis=1))
+        self.snapshot = snapshot
+        return snapshot[1:]
+
+    def _read_persisted(self):
+        """
+        Returns:\n\n
+            The snapshot of the collection as persisted last, read from the Parquet files of Chroma
+        """
+        paths = [f"{PERSIST_DIR}/{name}" for name in CHROMA_FILES]
+        collections = pq.read_table(paths[0], columns=['uuid', 'name']).to_pylist() \
+            if all(os.path.exists(p) for p in paths) else []
+        uuids = [c['uuid'] for c in collections if c['name'] == self.collection]
+        if len(uuids) == 0:
+            return self.writes, [], [], [], np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        table = pq.read_table(paths[1], columns=['id', 'document', 'metadata', 'embedding'],
+                              filters=[('collection_uuid', '=', uuids[0])])
+        ids = table.column('id').to_pylist()
+        metadatas = [json.loads(m) or {} for m in table.column('metadata').to_pylist()]
+        embeddings = table.column('embedding').combine_chunks().flatten().to_numpy()
+        matrix = embeddings.astype(np.float32).reshape(len(ids), -1) if len(ids) > 0 \
+            else np.zeros((0, 0), dtype=np.float32)
+        return self.writes, ids, table.column('document').to_pylist(), metadatas, matrix, (matrix ** 2).sum(axis=1)
+
+    def similarity_search(self, query: str, items: int = None, search_filter: Optional[SearchFilter] = None):
+        where = search_filter.chroma_where() if search_filter is not None else None
+        vector = self.embeddings.embed_query(query)
+        if self.read_only:
+            # The HNSW index of Chroma is saved on every write, not with the database, so replicas don't load it and
+            # search the snapshot instead
+            return self.similarity_search_by_vectors([vector], items if items is not None else DEFAULT_ITEMS,
+                                                     search_filter)[0]
+        with self.write_lock:
+            # Chroma fails when asked for more results than chunks there are, or when no chunk matches the filter
+            # (fewer matching it than asked for is fine)
+            items = min(items if items is not None else DEFAULT_ITEMS, self._count())
+            if items == 0:
+                return []
+            try:
+                results = self.vector_store._collection.query(query_embeddings=[vector], n_results=items, where=where)
+            except NoDatapointsException:
+                return []
+        return _results_to_docs_and_scores(results)
+
+    def _count(self) -> int:
+        """
+        Called with `write_lock` held.
+        """
+        if self.counted is None or self.counted[0] != self.writes:
+            self.counted = (self.writes, self.vector_store._collection.count())
+        return self.counted[1]
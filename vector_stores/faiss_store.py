@@ -1,34 +1,209 @@
 import logging
+import os
+import threading
+import uuid
+from typing import Dict, List, Tuple, Optional
 
-from langchain import InMemoryDocstore
-from langchain.docstore.base import Docstore
+import faiss
+import numpy as np
 from langchain.schema import Document
-from langchain.vectorstores import FAISS
-from langchain.embeddings.openai import OpenAIEmbeddings
 
-from constants.consts import PERSIST_DIR
+from constants.consts import PERSIST_DIR, DEFAULT_ITEMS, FAISS_INDEX, FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, \
+    FAISS_HNSW_EF_SEARCH, FAISS_IVF_LISTS, FAISS_IVF_PROBES, FAISS_PQ_M, FAISS_PQ_BITS
+from modules.indexing.search_filter import SearchFilter
+from vector_stores.metadata_table import MetadataTable
+from vector_stores.read_write_lock import ReadWriteLock
+from vector_stores.vector_store import VectorStore
 
+FLAT = 'flat'
+HNSW = 'hnsw'
+IVFPQ = 'ivfpq'
+# Vectors copied at a time from the exact index to the IVF-PQ index being trained
+TRAIN_ADD_BLOCK = 65536
 
-class FaissVectorStore:
-    def __init__(self, collection):
-        self.collection = collection
-        self.embeddings = OpenAIEmbeddings()
-        self.path = f"{PERSIST_DIR}/{self.collection}"
+
+class FaissVectorStore(VectorStore):
+    """
+        Vector store on a FAISS index, with texts and metadata in a `MetadataTable`. The type of index is chosen with
+        `FAISS_INDEX`: `flat` (exact), `hnsw` (graph) or `ivfpq` (clusters + product quantization, for very large
+        collections). Rows are the sequential ids of FAISS, and deleted chunks are only marked as deleted.
+    """
+    def __init__(self, collection, read_only: bool = False):
+        super().__init__(collection, read_only)
+        self.path = f"{PERSIST_DIR}/{collection}.faiss"
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        self.index_path = f"{self.path}/index.faiss"
+        self.table = MetadataTable(f"{self.path}/chunks.sqlite")
+
+        self.index = faiss.read_index(self.index_path) if os.path.exists(self.index_path) else None
+        self.rows = self.index.ntotal if self.index is not None else 0
+        # The index is written before the metadata is committed, so after a crash there can be metadata of vectors
+        # which were not saved
+        if not read_only and self.table.count() > self.rows:
+            logging.warning(f"Dropping {self.table.count() - self.rows} chunks without vectors from {self.path}")
+            self.table.truncate(self.rows)
+        self.alive = self.table.alive(self.rows)
+        self.index_dirty = False
+        # FAISS indexes can't be searched while vectors are added to them: searches share this lock, writes of the
+        # index take it exclusively
+        self.search_lock = ReadWriteLock()
+        self.training = threading.Lock()
+        self._configure_search()
+
+    def _new_index(self, dim: int):
+        if FAISS_INDEX == HNSW:
+            index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+            return index
+        # IVF-PQ needs training data: vectors go to an exact index until there are enough of them
+        return faiss.IndexFlatL2(dim)
+
+    def _configure_search(self):
+        if self.index is None:
+            return
+        if isinstance(self.index, faiss.IndexHNSWFlat):
+            self.index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        elif isinstance(self.index, faiss.IndexIVFPQ):
+            self.index.nprobe = FAISS_IVF_PROBES
+
+    def _train_if_needed(self):
+        """
+        Replaces the exact index by an IVF-PQ index once there are enough vectors to train it. The new index is
+        trained on a sample and filled without holding the locks, so that searches and writes go on meanwhile, and is
+        only swapped in once it has every vector.
+        """
+        codes = max(FAISS_IVF_LISTS, 2 ** FAISS_PQ_BITS)
+        # FAISS asks for at least 39 training vectors per cluster of the IVF and per code of the PQ
+        if FAISS_INDEX != IVFPQ or not isinstance(self.index, faiss.IndexFlatL2) or self.index.ntotal < codes * 39:
+            return
+        if not self.training.acquire(blocking=False):
+            return
         try:
-            self.vector_store = FAISS.load_local(self.path, self.embeddings)
-        except:
-            logging.warning(f"{self.path} not found. Creating...")
-            self.vector_store = FAISS.from_texts([""], OpenAIEmbeddings())
-
-    def add_documents(self, documents):
-        res = self.vector_store.add_documents(documents)
-        self.persist()
-        return res
-
-    def persist(self):
-        self.vector_store.save_local(self.path)
-        #self.vector_store = None
-        #self.vector_store = Chroma(self.collection, self.embeddings, persist_directory=PERSIST_DIR)
-
-    def similarity_search(self, query):
-        return self.vector_store.similarity_search(query)
+            exact = self.index
+            if not isinstance(exact, faiss.IndexFlatL2):
+                return
+            # Beyond 256 vectors per centroid, FAISS samples the training vectors anyway
+            with self.search_lock.shared():
+                total = exact.ntotal
+                sample = np.sort(np.random.default_rng(0).choice(total, size=min(total, codes * 256), replace=False))
+                vectors = exact.reconstruct_batch(sample)
+            quantizer = faiss.IndexFlatL2(exact.d)
+            index = faiss.IndexIVFPQ(quantizer, exact.d, FAISS_IVF_LISTS, FAISS_PQ_M, FAISS_PQ_BITS)
+            index.train(vectors)
+            for start in range(0, total, TRAIN_ADD_BLOCK):
+                # Only shared, as the exact index may be appended to (and moved in memory) by writes
+                with self.search_lock.shared():
+                    vectors = exact.reconstruct_n(start, min(TRAIN_ADD_BLOCK, total - start))
+                index.add(vectors)
+            with self.write_lock:
+                # Vectors added while training
+                if exact.ntotal > total:
+                    index.add(exact.reconstruct_n(total, exact.ntotal - total))
+                with self.search_lock.exclusive():
+                    self.index = index
+                    self._configure_search()
+                self.index_dirty = True
+                self._flush_and_publish()
+            logging.info(f"Trained an IVF-PQ index over {len(sample)} of the {index.ntotal} vectors of "
+                         f"{self.collection}")
+        finally:
+            self.training.release()
+
+    def add_documents(self, documents: List[Document], ids: List[str] = None):
+        if len(documents) == 0:
+            return []
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in documents]
+        # Embedded before taking the lock, so that searches and other writes don't wait for the embeddings provider
+        vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+        with self.write_lock:
+            replaced = self.table.insert(self.rows, ids, documents)
+            alive = np.concatenate([self.alive, np.ones(len(documents), dtype=bool)])
+            alive[replaced] = False
+            with self.search_lock.exclusive():
+                if self.index is None:
+                    self.index = self._new_index(vectors.shape[1])
+                    self._configure_search()
+                self.index.add(vectors)
+                self.alive = alive
+            self.rows += len(documents)
+            self.index_dirty = True
+            self._written(len(documents))
+        self._persist_if_needed()
+        self._train_if_needed()
+        return ids
+
+    def delete(self, ids: List[str]):
+        with self.write_lock:
+            rows = self.table.delete(ids)
+            self.alive[rows] = False
+            self._written(len(rows))
+        self._persist_if_needed()
+
+    def get_chunks(self, filename: str) -> Dict[str, dict]:
+        return self.table.get_chunks(filename)
+
+    def _flush(self):
+        if self.index is not None and self.index_dirty:
+            tmp_path = f"{self.index_path}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self.index_dirty = False
+        self.table.commit()
+
+    def similarity_search(self, query: str, items: int = None, search_filter: Optional[SearchFilter] = None) \
+            -> List[Tuple[Document, float]]:
+        vector = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vectors([vector], items if items is not None else DEFAULT_ITEMS,
+                                                 search_filter)[0]
+
+    def similarity_search_by_vectors(self, vectors: List[List[float]], items: int = 4,
+                                     search_filter: Optional[SearchFilter] = None) \
+            -> List[List[Tuple[Document, float]]]:
+        queries = np.asarray(vectors, dtype=np.float32)
+        with self.search_lock.shared():
+            index = self.index
+            alive = self.alive
+            if index is None or index.ntotal == 0:
+                return [[] for _ in vectors]
+            if search_filter is not None and not search_filter.is_empty():
+                return self._search_selected(index, queries, items, search_filter, alive)
+            # Deleted chunks are still in the index: more results are asked for until there are `items` alive ones
+            k = min(items + int(len(alive) - alive.sum()), index.ntotal)
+            while True:
+                distances, rows = index.search(queries, k)
+                found = []
+                for q in range(len(queries)):
+                    keep = [(r, d) for r, d in zip(rows[q], distances[q]) if 0 <= r < len(alive) and alive[r]][:items]
+                    found.append(keep)
+                if k >= index.ntotal or all(len(f) >= items for f in found):
+                    break
+                k = min(k * 2, index.ntotal)
+        return [self.table.results([r for r, _ in f], [d for _, d in f]) for f in found]
+
+    def _search_selected(self, index, queries: np.ndarray, items: int, search_filter: SearchFilter,
+                         alive: np.ndarray) -> List[List[Tuple[Document, float]]]:
+        """
+        Searches only the rows matching the filter, which FAISS skips while traversing the index. Called with
+        `search_lock` shared.
+        """
+        rows = self.table.matching(search_filter, len(alive))
+        rows = rows[alive[rows]]
+        if len(rows) == 0:
+            return [[] for _ in queries]
+        selector = faiss.IDSelectorBatch(rows)
+        if isinstance(index, faiss.IndexHNSWFlat):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(FAISS_HNSW_EF_SEARCH, items))
+        elif isinstance(index, faiss.IndexIVFPQ):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=FAISS_IVF_PROBES)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        distances, found = index.search(queries, min(items, len(rows)), params=params)
+        return [self.table.results([r for r in found[q] if r >= 0], [d for r, d in zip(found[q], distances[q])
+                                                                      if r >= 0]) for q in range(len(queries))]
+
+    def close(self):
+        super().close()
+        with self.write_lock:
+            self.table.close()
@@ -0,0 +1,82 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from vector_stores.vector_store import VectorStore
+
+
+class IVFIndex:
+    """
+        Inverted file index: vectors are assigned to the nearest of a few coarse clusters (k-means centroids), and
+        queries are only compared with the vectors of the `probes` clusters nearest to them. An index is not changed
+        once built (`assigned` returns a new one), so that searches can keep using it while rows are added.
+    """
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, trained_rows: int):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.trained_rows = trained_rows
+        self.lists = None
+
+    @staticmethod
+    def train(vectors: np.ndarray, lists: int, iterations: int = 10, seed: int = 0) -> 'IVFIndex':
+        """
+        Runs k-means over `vectors` (a sample of the collection) to find the centroids of `lists` clusters.
+        """
+        rng = np.random.default_rng(seed)
+        lists = min(lists, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), size=lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = IVFIndex._nearest(vectors, centroids)
+            for c in range(lists):
+                members = vectors[labels == c]
+                # Empty clusters are reseeded with a random vector
+                centroids[c] = members.mean(axis=0) if len(members) > 0 else vectors[rng.integers(len(vectors))]
+        logging.debug(f"Trained an IVF index of {lists} lists over {len(vectors)} vectors")
+        return IVFIndex(centroids, np.zeros(0, dtype=np.int32), 0)
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        norms = (centroids ** 2).sum(axis=1)
+        for start in range(0, len(vectors), block):
+            labels[start:start + block] = VectorStore.squared_l2(np.asarray(vectors[start:start + block]),
+                                                                 centroids, norms).argmin(axis=1)
+        return labels
+
+    def assigned(self, vectors: np.ndarray) -> 'IVFIndex':
+        """
+        Returns:\n\n
+            A copy of the index with the cluster of every vector appended to the assignments, in order
+        """
+        assignments = np.concatenate([self.assignments, IVFIndex._nearest(vectors, self.centroids)])
+        return IVFIndex(self.centroids, assignments, self.trained_rows)
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """
+        Returns:\n\n
+            The rows of the vectors in the `probes` clusters nearest to `query`
+        """
+        lists = self.lists
+        if lists is None:
+            # Built on first use. Searches building it at the same time get the same lists
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+            self.lists = lists
+        distances = VectorStore.squared_l2(query[None, :], self.centroids)[0]
+        nearest = np.argsort(distances)[:probes]
+        return np.concatenate([lists[c] for c in nearest]) if len(nearest) > 0 else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments,
+                     trained_rows=np.array([self.trained_rows]))
+
+    @staticmethod
+    def load(path: str) -> Optional['IVFIndex']:
+        try:
+            with np.load(path) as data:
+                return IVFIndex(data['centroids'], data['assignments'], int(data['trained_rows'][0]))
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from modules.indexing.search_filter import SearchFilter
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+
+class MetadataTable:
+    """
+        Compact side table in SQLite for the stores which only keep vectors: maps every row of the vectors to the
+        chunk id, its text and its metadata. Rows are never reused: deleted chunks are only marked as deleted.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+                          "filename TEXT, document TEXT NOT NULL, metadata TEXT NOT NULL, "
+                          "deleted INTEGER NOT NULL DEFAULT 0)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_filename ON chunks (filename)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def get_info(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_info(self, key: str, value: str):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value))
+
+    def count(self) -> int:
+        """
+        Returns:\n\n
+            The number of rows, including the deleted ones
+        """
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+
+    def insert(self, first_row: int, ids: List[str], documents: List[Document]) -> List[int]:
+        """
+        Inserts the chunks in consecutive rows starting at `first_row`. Chunks with an id already present replace the
+        previous ones, which are marked as deleted.
+
+        Returns:\n\n
+            The rows which got deleted because of that
+        """
+        with self.lock:
+            replaced = self.delete(ids)
+            self.conn.executemany("INSERT INTO chunks (row, id, filename, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                                  [(first_row + i, chunk_id, d.metadata.get('uploaded_filename'), d.page_content,
+                                    json.dumps(d.metadata)) for i, (chunk_id, d) in enumerate(zip(ids, documents))])
+            return replaced
+
+    def delete(self, ids: List[str]) -> List[int]:
+        """
+        Returns:\n\n
+            The rows of the chunks which were marked as deleted
+        """
+        rows = []
+        with self.lock:
+            for i in range(0, len(ids), SQLITE_MAX_PARAMS):
+                batch = ids[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ','.join('?' * len(batch))
+                rows += [r[0] for r in self.conn.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND id IN "
+                                                         f"({placeholders})", batch).fetchall()]
+                self.conn.execute(f"UPDATE chunks SET deleted = 1 WHERE deleted = 0 AND id IN ({placeholders})",
+                                  batch)
+        return rows
+
+    def truncate(self, rows: int):
+        """
+        Removes the rows from `rows` on, if any. Used to recover from writes not flushed completely.
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM chunks WHERE row >= ?", (rows,))
+            self.conn.commit()
+
+    def alive(self, rows: int) -> np.ndarray:
+        """
+        Returns:\n\n
+            A boolean mask of the first `rows` rows, True for the ones not deleted
+        """
+        mask = np.zeros(rows, dtype=bool)
+        with self.lock:
+            alive = [r[0] for r in self.conn.execute("SELECT row FROM chunks WHERE deleted = 0 AND row < ?",
+                                                     (rows,)).fetchall()]
+        mask[alive] = True
+        return mask
+
+    def matching(self, search_filter: SearchFilter, rows: int) -> np.ndarray:
+        """
+        Returns:\n\n
+            The sorted rows, among the first `rows`, of the chunks not deleted which match the filter
+        """
+        condition, params = search_filter.sql()
+        with self.lock:
+            found = [r[0] for r in self.conn.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND row < ? AND "
+                                                     f"{condition} ORDER BY row", [rows] + params).fetchall()]
+        return np.asarray(found, dtype=np.int64)
+
+    def get_chunks(self, filename: str) -> Dict[str, dict]:
+        with self.lock:
+            rows = self.conn.execute("SELECT id, metadata FROM chunks WHERE deleted = 0 AND filename = ?",
+                                     (filename,)).fetchall()
+        return {chunk_id: json.loads(metadata) for chunk_id, metadata in rows}
+
+    def documents(self, rows: List[int]) -> Dict[int, Document]:
+        found = {}
+        rows = [int(r) for r in rows]
+        with self.lock:
+            for i in range(0, len(rows), SQLITE_MAX_PARAMS):
+                batch = rows[i:i + SQLITE_MAX_PARAMS]
+                for row, document, metadata in self.conn.execute(f"SELECT row, document, metadata FROM chunks WHERE "
+                                                                 f"row IN ({','.join('?' * len(batch))})", batch):
+                    found[row] = Document(page_content=document, metadata=json.loads(metadata))
+        return found
+
+    def results(self, rows: List[int], distances: List[float]) -> List[Tuple[Document, float]]:
+        documents = self.documents(rows)
+        return [(documents[int(r)], float(d)) for r, d in zip(rows, distances) if int(r) in documents]
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,236 @@
+import logging
+import math
+import os
+import threading
+import uuid
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from constants.consts import PERSIST_DIR, DEFAULT_ITEMS, NUMPY_INDEX, NUMPY_SCAN_BLOCK, NUMPY_IVF_LISTS, \
+    NUMPY_IVF_PROBES, NUMPY_IVF_MIN_ROWS
+from vector_stores.ivf_index import IVFIndex
+from modules.indexing.search_filter import SearchFilter
+from vector_stores.metadata_table import MetadataTable
+from vector_stores.vector_store import VectorStore
+
+FLAT = 'flat'
+IVF = 'ivf'
+
+
+class NumpyVectorStore(VectorStore):
+    """
+        Native vector store. Embeddings are appended to a contiguous float32 file which is memory-mapped to be
+        searched, and texts and metadata live in a `MetadataTable`. Searches are an exact scan of the matrix, or, with
+        `NUMPY_INDEX=ivf`, a scan of the clusters of an `IVFIndex` nearest to the query for large collections.
+    """
+    def __init__(self, collection, read_only: bool = False):
+        super().__init__(collection, read_only)
+        self.path = f"{PERSIST_DIR}/{collection}.numpy"
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = f"{self.path}/vectors.f32"
+        self.ivf_path = f"{self.path}/ivf.npz"
+        self.table = MetadataTable(f"{self.path}/chunks.sqlite")
+
+        dim = self.table.get_info('dim')
+        self.dim = int(dim) if dim is not None else None
+        self.rows = self.table.count()
+        # Replicas only map the rows committed by the writer, which may be appending more
+        self.vectors_file = None
+        if not read_only:
+            self._recover()
+            self.vectors_file = open(self.vectors_path, 'ab')
+        self.alive = self.table.alive(self.rows)
+
+        self.ivf = None
+        self.ivf_dirty = False
+        self.training = threading.Lock()
+        if NUMPY_INDEX == IVF:
+            self.ivf = IVFIndex.load(self.ivf_path)
+            if self.ivf is not None and len(self.ivf.assignments) < self.rows:
+                self.ivf = self.ivf.assigned(self._matrix()[len(self.ivf.assignments):])
+                self.ivf_dirty = True
+
+        # (memory-mapped matrix, alive mask, ivf) as seen by searches. Rebuilt after writes.
+        self.view = None
+
+    def _recover(self):
+        # Vectors are flushed before their metadata is committed, so after a crash the vectors file can have rows
+        # without metadata, which are dropped
+        if self.dim is None:
+            return
+        row_bytes = self.dim * 4
+        file_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if file_rows > self.rows:
+            logging.warning(f"Dropping {file_rows - self.rows} vectors without metadata from {self.vectors_path}")
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(self.rows * row_bytes)
+        elif file_rows < self.rows:
+            logging.warning(f"Dropping {self.rows - file_rows} chunks without vectors from {self.path}")
+            self.table.truncate(file_rows)
+            self.rows = file_rows
+
+    def _matrix(self) -> np.ndarray:
+        if self.rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+
+    def _view(self):
+        with self.write_lock:
+            if self.view is None:
+                if self.vectors_file is not None:
+                    self.vectors_file.flush()
+                self.view = (self._matrix(), self.alive.copy(), self.ivf)
+            return self.view
+
+    def add_documents(self, documents: List[Document], ids: List[str] = None):
+        if len(documents) == 0:
+            return []
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in documents]
+        # Embedded before taking the lock, so that searches and other writes don't wait for the embeddings provider
+        vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+        with self.write_lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.table.set_info('dim', str(self.dim))
+            self.vectors_file.write(vectors.tobytes())
+            replaced = self.table.insert(self.rows, ids, documents)
+            self.alive = np.concatenate([self.alive, np.ones(len(documents), dtype=bool)])
+            self.alive[replaced] = False
+            self.rows += len(documents)
+            if self.ivf is not None:
+                # A new index, as the current one may be in the view of searches running over the previous rows
+                self.ivf = self.ivf.assigned(vectors)
+                self.ivf_dirty = True
+            self.view = None
+            self._written(len(documents))
+        self._persist_if_needed()
+        return ids
+
+    def delete(self, ids: List[str]):
+        with self.write_lock:
+            rows = self.table.delete(ids)
+            self.alive[rows] = False
+            self.view = None
+            self._written(len(rows))
+        self._persist_if_needed()
+
+    def get_chunks(self, filename: str) -> Dict[str, dict]:
+        return self.table.get_chunks(filename)
+
+    def _flush(self):
+        self.vectors_file.flush()
+        os.fsync(self.vectors_file.fileno())
+        self.table.commit()
+        if self.ivf is not None and self.ivf_dirty:
+            tmp_path = f"{self.ivf_path}.tmp.npz"
+            self.ivf.save(tmp_path)
+            os.replace(tmp_path, self.ivf_path)
+            self.ivf_dirty = False
+
+    def persist(self):
+        super().persist()
+        if NUMPY_INDEX == IVF and not self.read_only:
+            self._train_if_needed()
+
+    def _train_if_needed(self):
+        """
+        (Re)trains the IVF index once the collection is big enough, and again every time it doubles its size.
+        """
+        alive_rows = int(self.alive.sum())
+        if alive_rows < NUMPY_IVF_MIN_ROWS or (self.ivf is not None and self.rows < 2 * self.ivf.trained_rows):
+            return
+        if not self.training.acquire(blocking=False):
+            return
+        try:
+            matrix, alive, _ = self._view()
+            lists = NUMPY_IVF_LISTS if NUMPY_IVF_LISTS > 0 else int(math.sqrt(alive_rows))
+            alive_idx = np.nonzero(alive)[0]
+            sample = np.random.default_rng(0).choice(alive_idx, size=min(len(alive_idx), lists * 40), replace=False)
+            ivf = IVFIndex.train(np.asarray(matrix[np.sort(sample)]), lists)
+            ivf = ivf.assigned(matrix)
+            ivf.trained_rows = len(matrix)
+            with self.write_lock:
+                # Rows added while training
+                if self.rows > len(matrix):
+                    ivf = ivf.assigned(self._matrix()[len(matrix):])
+                self.ivf = ivf
+                self.ivf_dirty = True
+                self.view = None
+                self._flush_and_publish()
+        finally:
+            self.training.release()
+
+    def similarity_search(self, query: str, items: int = None, search_filter: Optional[SearchFilter] = None) \
+            -> List[Tuple[Document, float]]:
+        vector = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vectors([vector], items if items is not None else DEFAULT_ITEMS,
+                                                 search_filter)[0]
+
+    def similarity_search_by_vectors(self, vectors: List[List[float]], items: int = 4,
+                                     search_filter: Optional[SearchFilter] = None) \
+            -> List[List[Tuple[Document, float]]]:
+        matrix, alive, ivf = self._view()
+        if len(matrix) == 0:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        if search_filter is not None and not search_filter.is_empty():
+            # Only the rows matching the filter are read and scored, exactly
+            rows = self.table.matching(search_filter, len(alive))
+            found = self._search_flat(queries, items, matrix, alive, rows[alive[rows]])
+        elif ivf is not None:
+            found = [self._search_ivf(q, items, matrix, alive, ivf) for q in queries]
+        else:
+            found = self._search_flat(queries, items, matrix, alive)
+        return [self.table.results(rows, distances) for rows, distances in found]
+
+    @staticmethod
+    def _search_flat(queries: np.ndarray, items: int, matrix: np.ndarray, alive: np.ndarray,
+                     selected: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # The matrix (or only its `selected` rows) is scanned in blocks of rows, keeping the best `items` of every
+        # query seen so far
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(matrix) if selected is None else len(selected), NUMPY_SCAN_BLOCK):
+            if selected is None:
+                block = np.asarray(matrix[start:start + NUMPY_SCAN_BLOCK])
+                distances = VectorStore.squared_l2(queries, block)
+                distances[:, ~alive[start:start + NUMPY_SCAN_BLOCK]] = np.inf
+                rows = np.broadcast_to(np.arange(start, start + len(block)), distances.shape)
+            else:
+                block_rows = selected[start:start + NUMPY_SCAN_BLOCK]
+                distances = VectorStore.squared_l2(queries, np.asarray(matrix[block_rows]))
+                rows = np.broadcast_to(block_rows, distances.shape)
+            best_distances = np.concatenate([best_distances, distances], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_distances.shape[1] > items:
+                top = np.argpartition(best_distances, items - 1, axis=1)[:, :items]
+                best_distances = np.take_along_axis(best_distances, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+        found = []
+        for q in range(len(queries)):
+            order = np.argsort(best_distances[q])
+            order = order[np.isfinite(best_distances[q, order])]
+            found.append((best_rows[q, order], best_distances[q, order]))
+        return found
+
+    @staticmethod
+    def _search_ivf(query: np.ndarray, items: int, matrix: np.ndarray, alive: np.ndarray, ivf: IVFIndex) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        candidates = np.sort(ivf.candidates(query, NUMPY_IVF_PROBES))
+        candidates = candidates[alive[candidates]]
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        distances = VectorStore.squared_l2(query[None, :], np.asarray(matrix[candidates]))
+        top = VectorStore.top_k(distances, items)[0]
+        return candidates[top], distances[0, top]
+
+    def close(self):
+        super().close()
+        with self.write_lock:
+            if self.vectors_file is not None:
+                self.vectors_file.close()
+            self.table.close()
@@ -0,0 +1,43 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+        Lets any number of readers hold the lock at once, or a single writer. Writers waiting are served before new
+        readers, so that a steady flow of searches can't starve them. Not reentrant.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            while self.writing or self.writers_waiting > 0:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writing or self.readers > 0:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from constants.consts import STORE_WRITE_BEHIND, STORE_FLUSH_INTERVAL, STORE_FLUSH_MAX_PENDING, PERSIST_DIR
+from modules.embeddings.embeddings_factory import EmbeddingsFactory
+from modules.indexing.index_lock import IndexLock
+from modules.indexing.search_filter import SearchFilter
+from modules.metrics.metrics import Metrics
+
+
+class VectorStore:
+    """
+        Base of the vector stores. Besides the interface every store implements, it keeps track of the writes not
+        flushed to disk yet (write-behind): stores are flushed every `STORE_FLUSH_INTERVAL` seconds or when
+        `STORE_FLUSH_MAX_PENDING` chunks are waiting, instead of after every upload.
+
+        A `read_only` store is a replica of the index written by another process (see `IndexLock`): it never writes
+        to disk, and is opened again to see the new writes.
+    """
+    def __init__(self, collection, read_only: bool = False):
+        self.collection = collection
+        self.read_only = read_only
+        self.embeddings = EmbeddingsFactory.build()
+        # Ingestion workers run in parallel, but writes and persists to the collection must not interleave
+        self.write_lock = threading.RLock()
+        self.index_lock = IndexLock(f"{PERSIST_DIR}/{collection}")
+
+        self.pending_chunks = 0
+        self.writes = 0
+        self.persisted_writes = 0
+        self.stop_flushing = threading.Event()
+        self.flusher = None
+        if STORE_WRITE_BEHIND and STORE_FLUSH_INTERVAL > 0 and not read_only:
+            self.flusher = threading.Thread(target=self._flush_periodically, name=f"{collection}-flusher",
+                                            daemon=True)
+            self.flusher.start()
+
+    def add_documents(self, documents: List[Document], ids: List[str] = None):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def get_chunks(self, filename: str) -> Dict[str, dict]:
+        """
+        Args:\n\n
+            filename: the uploaded filename
+
+        Returns:\n\n
+            A dictionary with the ids of the chunks of the file as keys and their metadata as values
+        """
+        raise NotImplementedError
+
+    def similarity_search(self, query: str, items: int = None, search_filter: Optional[SearchFilter] = None) \
+            -> List[Tuple[Document, float]]:
+        raise NotImplementedError
+
+    def similarity_search_by_vectors(self, vectors: List[List[float]], items: int = 4,
+                                     search_filter: Optional[SearchFilter] = None) \
+            -> List[List[Tuple[Document, float]]]:
+        """
+        Scores many query embeddings at once against the whole collection.
+        Args:\n\n
+            vectors: the embeddings of the queries
+            items: the number of results per query
+            search_filter: if not None, only the chunks matching it are scored
+
+        Returns:\n\n
+            For each query, a list of (Document, distance) sorted by distance. As in `similarity_search`, the distance
+            is the squared L2 distance.
+        """
+        raise NotImplementedError
+
+    def _flush(self):
+        """
+        Writes to disk whatever the store keeps in memory. Called with `write_lock` held.
+        """
+        raise NotImplementedError
+
+    def _flush_and_publish(self):
+        """
+        Flushes with the index lock held, so that replicas don't open the index half-written, and lets them know
+        there is a new version. Called with `write_lock` held.
+        """
+        with self.index_lock.exclusive():
+            self._flush()
+            self.index_lock.publish()
+
+    def _written(self, chunks: int):
+        """
+        To be called by the stores after every write, with `write_lock` held.
+        """
+        self.pending_chunks += chunks
+        self.writes += 1
+
+    def _persist_if_needed(self):
+        if not STORE_WRITE_BEHIND or self.pending_chunks >= STORE_FLUSH_MAX_PENDING:
+            self.persist()
+
+    def persist(self):
+        """
+        Flushes the pending writes to disk, if any.
+        """
+        if self.read_only:
+            return
+        with self.write_lock:
+            if self.persisted_writes == self.writes:
+                return
+            start = time.perf_counter()
+            self._flush_and_publish()
+            Metrics.observe('persist', time.perf_counter() - start)
+            logging.debug(f"Persisted {self.pending_chunks} chunks of {self.collection} in "
+                          f"{time.perf_counter() - start:.3f}s")
+            self.pending_chunks = 0
+            self.persisted_writes = self.writes
+
+    def last_write(self) -> int:
+        return self.writes
+
+    def is_persisted(self, write: int) -> bool:
+        """
+        Args:\n\n
+            write: a write sequence number, as returned by `last_write`
+
+        Returns:\n\n
+            True if the write has already been flushed to disk
+        """
+        return self.persisted_writes >= write
+
+    def close(self):
+        """
+        Stops the background flusher and forces a last flush. To be called on shutdown.
+        """
+        self.stop_flushing.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.persist()
+
+    def _flush_periodically(self):
+        while not self.stop_flushing.wait(STORE_FLUSH_INTERVAL):
+            try:
+                self.persist()
+            except Exception:
+                logging.exception(f"Error persisting {self.collection}")
+
+    @staticmethod
+    def top_k(distances: np.ndarray, items: int) -> List[np.ndarray]:
+        """
+        Args:\n\n
+            distances: a matrix of distances, one row per query
+            items: the number of results per query
+
+        Returns:\n\n
+            For each query, the indexes of the `items` smallest distances, sorted
+        """
+        items = min(items, distances.shape[1])
+        if items == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in range(distances.shape[0])]
+        top = np.argpartition(distances, items - 1, axis=1)[:, :items]
+        return [candidates[np.argsort(distances[q, candidates])] for q, candidates in enumerate(top)]
+
+    @staticmethod
+    def squared_l2(queries: np.ndarray, matrix: np.ndarray, norms: np.ndarray = None) -> np.ndarray:
+        if norms is None:
+            norms = (matrix ** 2).sum(axis=1)
+        distances = (queries ** 2).sum(axis=1)[:, None] + norms[None, :] - 2 * (queries @ matrix.T)
+        return np.maximum(distances, 0)